@@ -0,0 +1,247 @@
+import io
+import os
+import time
+import weakref
+import threading
+import mimetypes
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from collections import OrderedDict, Counter
+
+__all__ = ["AssetCache", "cache", "scheme", "PathToUrl", "UrlToPath"]
+
+
+# URL scheme previews load documents and their assets through
+scheme = "mdasset"
+
+
+def PathToUrl(path):
+    """
+    Get the asset URL for a file, e.g. to use as the base URL of a document in that folder.
+    """
+    return scheme + Path(path).resolve().as_uri()[len("file"):]
+
+
+def UrlToPath(url, folders=None):
+    """
+    Get the file an asset URL points to (resolved, so any `..` or links are followed). If
+    given a list of `folders`, a file which isn't inside any of them gives None.
+    """
+    parts = urllib.parse.urlsplit(url)
+    path = Path(urllib.request.url2pathname(parts.path)).resolve()
+    # refuse anything outside the allowed folders
+    if folders is not None and not any(path.is_relative_to(folder) for folder in folders):
+        return None
+
+    return path
+
+
+class AssetCache:
+    """
+    In-memory cache of the files (images, stylesheets, etc.) referenced by previewed
+    documents, bounded to `maxBytes` and dropping the least recently used files first. Files
+    are read once and then served from memory on every re-render, only going back to the
+    disk (to check the file hasn't changed) every `checkInterval` seconds. If given a
+    `maxImageSize` (width, height), larger images are downscaled once as they're read, so
+    the preview never has to decode them at full size (requires `pillow`).
+
+    Asset URLs are only served from folders allowed by `AllowFolder` (previews allow the
+    folder of the document they show), so a page can't read any file on the disk. Folders
+    are counted, so stay allowed until every ctrl which allowed them has moved on or gone.
+    """
+    def __init__(self, maxBytes=64 * 1024 ** 2, maxImageSize=None, checkInterval=2.0):
+        self.maxBytes = maxBytes
+        self.maxImageSize = maxImageSize
+        self.checkInterval = checkInterval
+        # path -> (data, mimeType, stat, time last checked)
+        self._entries = OrderedDict()
+        self._size = 0
+        # folders asset URLs may be served from -> number of times allowed
+        self._folders = Counter()
+        # id of owner -> (weakref to owner, folder it allowed)
+        self._owners = {}
+        # handlers can be called from the web engine's IO thread (and reentrantly, as owners
+        # can be collected while it's held)
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _getStat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def Get(self, path):
+        """
+        Get the (data, mimeType) of a file, or None if it doesn't exist.
+        """
+        path = str(path)
+        now = time.monotonic()
+        # look for a cached copy
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                data, mimeType, stat, checked = entry
+                # if checked recently, trust it
+                if now - checked < self.checkInterval:
+                    self._entries.move_to_end(path)
+                    return data, mimeType
+        # make sure it hasn't changed
+        newStat = self._getStat(path)
+        if newStat is None:
+            self.Invalidate(path)
+            return None
+        if entry is not None and newStat == entry[2]:
+            with self._lock:
+                if path in self._entries:
+                    self._entries[path] = (entry[0], entry[1], newStat, now)
+                    self._entries.move_to_end(path)
+            return entry[0], entry[1]
+        # read it
+        try:
+            data = Path(path).read_bytes()
+        except OSError:
+            return None
+        mimeType = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        # shrink if it's a big image
+        if self.maxImageSize is not None and mimeType.startswith("image/"):
+            data, mimeType = self.Downscale(data, mimeType)
+        # store
+        self._put(path, (data, mimeType, newStat, now))
+
+        return data, mimeType
+
+    def AllowFolder(self, folder, owner=None):
+        """
+        Let asset URLs be served from a folder (and any folder inside it). If given an
+        `owner`, it allows just one folder at a time: the folder it allowed before is
+        disallowed, as is this one when the owner is deleted.
+        """
+        folder = Path(folder).resolve()
+        with self._lock:
+            if owner is not None:
+                key = id(owner)
+                if key in self._owners and self._owners[key][1] == folder:
+                    return
+                self.DisallowFolder(owner=owner)
+                ref = weakref.ref(owner, lambda ref, key=key: self._forget(key, ref))
+                self._owners[key] = (ref, folder)
+            self._folders[folder] += 1
+
+    def DisallowFolder(self, folder=None, owner=None):
+        """
+        Undo a call to `AllowFolder` - either for a folder, or for whichever folder an owner
+        allowed. Folders are only stopped from serving asset URLs once disallowed as many
+        times as they were allowed.
+        """
+        with self._lock:
+            if owner is not None:
+                entry = self._owners.pop(id(owner), None)
+                if entry is None:
+                    return
+                folder = entry[1]
+            self._release(Path(folder).resolve())
+
+    def _forget(self, key, ref):
+        # called when an owner is deleted, so disallow its folder
+        with self._lock:
+            entry = self._owners.get(key)
+            if entry is None or entry[0] is not ref:
+                return
+            del self._owners[key]
+            self._release(entry[1])
+
+    def _release(self, folder):
+        # count down a folder, dropping it when no longer allowed
+        if self._folders[folder] > 1:
+            self._folders[folder] -= 1
+        else:
+            self._folders.pop(folder, None)
+
+    def GetFolders(self):
+        """
+        Get the folders asset URLs may be served from.
+        """
+        with self._lock:
+            return list(self._folders)
+
+    def GetUrl(self, url):
+        """
+        Get the (data, mimeType) for an asset URL (see `PathToUrl`), or None if there's no
+        such file or it's outside the allowed folders.
+        """
+        path = UrlToPath(url, self.GetFolders())
+        if path is None:
+            return None
+
+        return self.Get(path)
+
+    def Downscale(self, data, mimeType):
+        """
+        Shrink an image to fit in `maxImageSize`, returning (data, mimeType). Images which
+        already fit, or which can't be shrunk (e.g. SVGs or animations), are returned as-is.
+        """
+        try:
+            from PIL import Image
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError(
+                "Please install `pillow` package in order to downscale preview images"
+            )
+        try:
+            img = Image.open(io.BytesIO(data))
+            # leave it if it fits or is animated
+            if getattr(img, "is_animated", False):
+                return data, mimeType
+            if img.width <= self.maxImageSize[0] and img.height <= self.maxImageSize[1]:
+                return data, mimeType
+            # shrink, keeping format if we can write it
+            fmt = img.format if img.format in ("PNG", "JPEG", "WEBP") else "PNG"
+            img.thumbnail(self.maxImageSize)
+            out = io.BytesIO()
+            img.save(out, format=fmt)
+        except Exception:
+            # if Pillow can't handle it, let the browser try
+            return data, mimeType
+
+        return out.getvalue(), Image.MIME[fmt]
+
+    def _put(self, path, entry):
+        with self._lock:
+            # replace any existing entry
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._size -= len(old[0])
+            # don't cache anything which would take up the whole cache
+            if len(entry[0]) > self.maxBytes:
+                return
+            self._entries[path] = entry
+            self._size += len(entry[0])
+            # drop least recently used until we're within budget
+            while self._size > self.maxBytes:
+                _, dropped = self._entries.popitem(last=False)
+                self._size -= len(dropped[0])
+
+    def Invalidate(self, path=None):
+        """
+        Forget a file (or every file, if None), so it's read again next time.
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._size = 0
+                return
+            entry = self._entries.pop(str(path), None)
+            if entry is not None:
+                self._size -= len(entry[0])
+
+    def GetSize(self):
+        """
+        Get the number of bytes currently cached.
+        """
+        return self._size
+
+
+# cache shared by every preview
+cache = AssetCache()
@@ -0,0 +1,84 @@
+"""
+Compare the bundled Markdown engines on a set of files, to help pick one for a corpus:
+
+    python -m mdwidget.benchmark notes/*.md --repeat 10
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+from .engines import engines as allEngines
+
+__all__ = ["Benchmark", "main"]
+
+
+def Benchmark(files, engines=None, repeat=5):
+    """
+    Time each engine converting each file `repeat` times. Returns a dict of engine name to
+    (best seconds per pass over all files, characters per second, capabilities), or to the
+    error message if the engine couldn't be made (e.g. its package isn't installed).
+    """
+    # read files up front, so disk speed doesn't count
+    sources = [
+        Path(file).read_text(encoding="utf-8") for file in files
+    ]
+    size = sum(len(source) for source in sources)
+    # time each engine
+    results = {}
+    for name in engines or allEngines:
+        try:
+            engine = allEngines[name]()
+        except ModuleNotFoundError as err:
+            results[name] = str(err)
+            continue
+        # warm up (first conversion can include setup, e.g. compiling patterns)
+        for source in sources:
+            engine.convert(source)
+        # take the best of each pass, as that's the least disturbed by other processes
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            for source in sources:
+                engine.convert(source)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        results[name] = (best, size / best if best else 0, engine.GetCapabilities())
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m mdwidget.benchmark",
+        description="Compare the speed of the bundled Markdown engines on some files."
+    )
+    parser.add_argument("files", nargs="+", help="Markdown files to convert")
+    parser.add_argument("--engine", action="append", choices=list(allEngines),
+                        help="engine to test (can be given more than once, default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="passes to time per engine")
+    args = parser.parse_args(argv)
+    # run
+    results = Benchmark(args.files, engines=args.engine, repeat=args.repeat)
+    # print table, fastest first
+    timed = sorted(
+        (name for name, result in results.items() if isinstance(result, tuple)),
+        key=lambda name: results[name][0]
+    )
+    print(f"{'engine':<14}{'ms/pass':>10}{'MB/s':>10}  capabilities")
+    for name in timed:
+        best, rate, capabilities = results[name]
+        flagNames = ", ".join(
+            flag.name for flag in type(capabilities) if flag in capabilities
+        )
+        print(f"{name:<14}{best * 1000:>10.2f}{rate / 1e6:>10.2f}  {flagNames or '-'}")
+    for name, result in results.items():
+        if not isinstance(result, tuple):
+            print(f"{name:<14}skipped: {result}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
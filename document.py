@@ -0,0 +1,238 @@
+import bisect
+import threading
+
+__all__ = ["PieceTable", "DocumentSnapshot"]
+
+
+class DocumentSnapshot:
+    """
+    Immutable view of a document at one version. Holds references to the strings which
+    make up the document rather than a copy, and only joins them into one string when
+    the full text is first asked for.
+    """
+    def __init__(self, pieces, length, version):
+        self._pieces = pieces
+        self._length = length
+        self._version = version
+        self._text = None
+
+    def __len__(self):
+        return self._length
+
+    def __str__(self):
+        return self.GetText()
+
+    def GetVersion(self):
+        """
+        Get the version of the document this is a snapshot of - each edit makes a new version.
+        """
+        return self._version
+
+    def GetLength(self):
+        return self._length
+
+    def GetText(self):
+        """
+        Get the full text, joined once and then shared by every caller.
+        """
+        if self._text is None:
+            self._text = "".join(
+                buffer[start:start + length] for buffer, start, length in self._pieces
+            )
+
+        return self._text
+
+    def GetRange(self, start, end):
+        """
+        Get the text between two positions without joining the whole document.
+        """
+        # if we already have the full text, just slice it
+        if self._text is not None:
+            return self._text[start:end]
+        # otherwise, only join the pieces in range
+        out = []
+        pos = 0
+        for buffer, pieceStart, length in self._pieces:
+            if pos >= end:
+                break
+            if pos + length > start:
+                lo = max(start - pos, 0)
+                hi = min(end - pos, length)
+                out.append(buffer[pieceStart + lo:pieceStart + hi])
+            pos += length
+
+        return "".join(out)
+
+
+class PieceTable:
+    """
+    Python-side copy of a document, kept in sync with a text ctrl by feeding it the ctrl's
+    edit events. Each edit only adds or splits pieces (references into immutable strings),
+    and `Snapshot` gives a `DocumentSnapshot` which can be read by reference (including
+    from other threads) rather than copying the text out of the native ctrl every time.
+    """
+    # pieces to allow before joining them back into one string
+    maxPieces = 1024
+    # size up to which consecutive inserts are merged into one piece
+    mergeSize = 4096
+
+    def __init__(self, text=""):
+        self._version = 0
+        # edits come from the UI thread, but snapshots can be taken from any thread
+        self._lock = threading.RLock()
+        # functions to call with each edit
+        self._listeners = []
+        self._length = 0
+        self.SetText(text)
+
+    def AddListener(self, func):
+        """
+        Call `func(start, end, text)` after every edit, where the characters between `start`
+        and `end` (positions before the edit) were replaced with `text`.
+        """
+        self._listeners.append(func)
+
+    def RemoveListener(self, func):
+        if func in self._listeners:
+            self._listeners.remove(func)
+
+    def MarkDirty(self):
+        """
+        Mark the whole document as needing to be processed again (e.g. restyled).
+        """
+        self._dirty = (0, None, 0)
+
+    def TakeDirtyRegion(self):
+        """
+        Get the region edited since this was last called, as (start, end, shift) where `start`
+        and `end` are current positions and `shift` is the change in length. Gives
+        (0, None, 0) if the whole document has changed, or None if nothing has.
+        """
+        dirty = self._dirty
+        self._dirty = None
+        if dirty is None:
+            return None
+
+        return tuple(dirty)
+
+    def GetVersion(self):
+        return self._version
+
+    def GetLength(self):
+        return self._length
+
+    def SetText(self, text):
+        """
+        Replace the whole document.
+        """
+        with self._lock:
+            oldLength = self._length
+            self._pieces = [(text, 0, len(text))] if text else []
+            self._original = text
+            self._length = len(text)
+            self.MarkDirty()
+            self._changed()
+            self._notify(0, oldLength, text)
+
+    def Insert(self, pos, text):
+        """
+        Insert text at the given position.
+        """
+        self.Replace(pos, pos, text)
+
+    def Delete(self, pos, length):
+        """
+        Delete the given number of characters from the given position.
+        """
+        self.Replace(pos, pos + length, "")
+
+    def Replace(self, start, end, text):
+        """
+        Replace the characters between two positions with the given text.
+        """
+        with self._lock:
+            self._replace(start, end, text)
+
+    def _replace(self, start, end, text):
+        start = min(max(start, 0), self._length)
+        end = min(max(end, start), self._length)
+        if start == end and not text:
+            return
+        # find pieces which touch the edited range
+        first = max(bisect.bisect_right(self._starts, start) - 1, 0)
+        last = bisect.bisect_left(self._starts, end)
+        if last == first:
+            last += 1
+        # keep the bits of them either side of the range
+        before = []
+        after = []
+        pos = self._starts[first] if self._pieces else 0
+        for buffer, pieceStart, length in self._pieces[first:last]:
+            if pos < start:
+                before.append((buffer, pieceStart, min(start - pos, length)))
+            if pos + length > end:
+                lo = max(end - pos, 0)
+                after.append((buffer, pieceStart + lo, length - lo))
+            pos += length
+        # add new text
+        middle = []
+        if text:
+            buffer, pieceStart, length = before[-1] if before else (None, 0, 0)
+            if (
+                before
+                and buffer is not self._original
+                and pieceStart + length == len(buffer)
+                and len(buffer) + len(text) <= self.mergeSize
+            ):
+                # if typing onto the end of an inserted piece, extend it rather than adding another
+                before[-1] = (buffer + text, pieceStart, length + len(text))
+            else:
+                middle.append((text, 0, len(text)))
+        # splice
+        self._pieces[first:last] = before + middle + after
+        # widen the dirty region to cover this edit
+        shift = len(text) - (end - start)
+        if self._dirty is None:
+            self._dirty = (start, start + len(text), shift)
+        elif self._dirty[1] is not None:
+            dirtyStart, dirtyEnd, dirtyShift = self._dirty
+            if dirtyEnd >= end:
+                dirtyEnd += shift
+            self._dirty = (
+                min(dirtyStart, start), max(dirtyEnd, start + len(text)), dirtyShift + shift
+            )
+        self._changed()
+        self._notify(start, end, text)
+
+    def _notify(self, start, end, text):
+        for func in self._listeners:
+            func(start, end, text)
+
+    def Snapshot(self):
+        """
+        Get an immutable `DocumentSnapshot` of the current version.
+        """
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = DocumentSnapshot(tuple(self._pieces), self._length, self._version)
+
+            return self._snapshot
+
+    def _changed(self):
+        # if there are too many pieces, join them back up
+        if len(self._pieces) > self.maxPieces:
+            text = "".join(
+                buffer[start:start + length] for buffer, start, length in self._pieces
+            )
+            self._pieces = [(text, 0, len(text))]
+            self._original = text
+        # recalculate where each piece starts
+        self._starts = []
+        pos = 0
+        for buffer, start, length in self._pieces:
+            self._starts.append(pos)
+            pos += length
+        self._length = pos
+        # new version
+        self._version += 1
+        self._snapshot = None
@@ -0,0 +1,179 @@
+import re
+import bisect
+import difflib
+from collections import namedtuple
+
+__all__ = ["Edit", "ComputeEdits", "ApplyEdits", "GetFencedBlocks", "GetBlockRange", "GetRestyleRange"]
+
+
+Edit = namedtuple("Edit", ["start", "end", "text"])
+
+
+def ComputeEdits(old, new):
+    """
+    Get the smallest list of `Edit`s (by line) which turns `old` into `new`, with positions
+    in `old` and sorted from first to last.
+    """
+    # trim common start and end, so unchanged text is never compared line by line
+    prefix = _commonPrefix(old, new)
+    suffix = _commonSuffix(old, new, min(len(old), len(new)) - prefix)
+    # back off to line boundaries, so edits are whole lines where possible
+    prefix = old.rfind("\n", 0, prefix) + 1
+    if suffix and old[len(old) - suffix - 1] != "\n":
+        pos = old.find("\n", len(old) - suffix)
+        suffix = len(old) - pos - 1 if pos >= 0 else 0
+    oldMid = old[prefix:len(old) - suffix]
+    newMid = new[prefix:len(new) - suffix]
+    if not oldMid and not newMid:
+        return []
+    # diff the middle by line
+    oldLines = oldMid.splitlines(keepends=True)
+    newLines = newMid.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, oldLines, newLines, autojunk=False)
+    # convert line indices to character offsets
+    oldStarts = [prefix]
+    for line in oldLines:
+        oldStarts.append(oldStarts[-1] + len(line))
+    edits = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        edits.append(Edit(oldStarts[i1], oldStarts[i2], "".join(newLines[j1:j2])))
+
+    return edits
+
+
+def _commonPrefix(a, b, chunk=4096):
+    # compare a chunk at a time (in C), then a character at a time within the first mismatch
+    limit = min(len(a), len(b))
+    i = 0
+    while i < limit and a[i:i + chunk] == b[i:i + chunk]:
+        i += chunk
+    i = min(i, limit)
+    end = min(i + chunk, limit)
+    while i < end and a[i] == b[i]:
+        i += 1
+
+    return i
+
+
+def _commonSuffix(a, b, limit, chunk=4096):
+    # as _commonPrefix, but from the end and going no further than `limit` characters
+    i = 0
+    while i < limit and (
+        a[max(len(a) - i - chunk, 0):len(a) - i] == b[max(len(b) - i - chunk, 0):len(b) - i]
+    ):
+        i += chunk
+    i = min(i, limit)
+    end = min(i + chunk, limit)
+    while i < end and a[len(a) - i - 1] == b[len(b) - i - 1]:
+        i += 1
+
+    return i
+
+
+def ApplyEdits(text, edits):
+    """
+    Apply a list of `Edit`s (positions in the original text, not overlapping) to a string.
+    """
+    out = []
+    pos = 0
+    for start, end, replacement in sorted(edits, key=lambda edit: edit[0]):
+        out.append(text[pos:start])
+        out.append(replacement)
+        pos = end
+    out.append(text[pos:])
+
+    return "".join(out)
+
+
+# (a fence can only be followed by a language, as for the pygments Markdown lexer)
+fencePattern = re.compile(r"^[ \t]*(```|~~~)([\w\-]*)$", re.MULTILINE)
+
+
+def GetFencedBlocks(text):
+    """
+    Get `(start, end)` for each fenced code block in some Markdown, from the start of its
+    opening fence to the end of its closing fence's line. As for the pygments Markdown lexer,
+    a fence with a language can only open a block, and a fence which is never closed doesn't
+    open one.
+    """
+    fences = list(fencePattern.finditer(text))
+    # find the next fence each one could be closed by (same kind, without a language)
+    closers = [None] * len(fences)
+    nextCloser = {}
+    for i in range(len(fences) - 1, -1, -1):
+        closers[i] = nextCloser.get(fences[i].group(1))
+        if not fences[i].group(2):
+            nextCloser[fences[i].group(1)] = i
+    # pair fences up from the start
+    blocks = []
+    i = 0
+    while i < len(fences):
+        j = closers[i]
+        if j is None:
+            i += 1
+            continue
+        blocks.append((fences[i].start(), min(fences[j].end() + 1, len(text))))
+        i = j + 1
+
+    return blocks
+
+
+def _findBlock(blocks, pos):
+    # get the block a position is inside (not at the start of), if any
+    i = bisect.bisect_right(blocks, (pos,)) - 1
+    if i >= 0 and blocks[i][0] < pos < blocks[i][1]:
+        return blocks[i]
+
+
+def GetBlockRange(text, start, end, blocks=None, oldBlocks=None, shift=0):
+    """
+    Expand a range of Markdown text out to whole blocks (runs of lines between blank lines,
+    and whole fenced code blocks - see `GetFencedBlocks`), so it can be lexed without the
+    rest. If the range has been edited, passing the fenced blocks from before the edit (and
+    the change in length) as `oldBlocks` and `shift` expands it to cover any text which has
+    switched between code and prose because a fence was added or removed.
+    """
+    if blocks is None:
+        blocks = GetFencedBlocks(text)
+    while True:
+        # move start back to just after a blank line
+        i = text.rfind("\n\n", 0, start)
+        newStart = 0 if i < 0 else i + 2
+        # move end forward to just after the next blank line
+        j = text.find("\n\n", max(end - 1, 0))
+        newEnd = len(text) if j < 0 else j + 1
+        # if start is (or was) inside fenced code, move it back to the fence
+        for block in (_findBlock(blocks, newStart), _findBlock(oldBlocks or [], newStart)):
+            if block is not None:
+                newStart = min(newStart, block[0])
+        # if end is inside fenced code, move it on past the closing fence
+        block = _findBlock(blocks, newEnd)
+        if block is not None:
+            newEnd = block[1]
+        # (and likewise if it was, with positions after the edit moved along by `shift`)
+        block = _findBlock(oldBlocks or [], newEnd - shift)
+        if block is not None:
+            newEnd = max(newEnd, block[1] + shift)
+        # stop once it's stable
+        if (newStart, newEnd) == (start, end):
+            return start, end
+        start, end = min(start, newStart), max(end, newEnd)
+
+
+def GetRestyleRange(text, region, blocks=None):
+    """
+    Get the range of text to lex again for a region edited since it was last lexed (as given
+    by `document.PieceTable.TakeDirtyRegion`), expanded by `GetBlockRange`. `blocks` are the
+    fenced blocks from last time, and the new ones are given back with the range, as
+    `(start, end, blocks)`, to pass in next time.
+    """
+    start, end, shift = region
+    newBlocks = GetFencedBlocks(text)
+    start, end = GetBlockRange(
+        text, start, len(text) if end is None else end,
+        blocks=newBlocks, oldBlocks=blocks, shift=shift
+    )
+
+    return start, end, newBlocks
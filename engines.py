@@ -0,0 +1,205 @@
+import re
+import abc
+
+from .flags import EngineCapability
+from .sourcemap import SourceMap
+from .interpreters import PooledInterpreter, pool
+
+__all__ = [
+    "Engine",
+    "PythonMarkdownEngine",
+    "MarkdownItEngine",
+    "MistuneEngine",
+    "CmarkEngine",
+    "engines",
+    "GetEngine",
+]
+
+
+class Engine(abc.ABC):
+    """
+    Base class for adapters which let a Markdown library stand in as a ctrl's interpreter.
+    Subclasses implement `convert` and declare what the library can do via `capabilities`,
+    so the ctrl can make use of it (e.g. only syncing scroll if the engine can mark which
+    source lines each block came from). After converting, `sourceMap` holds the source map
+    for that conversion (empty if the engine doesn't support source positions).
+    """
+    # name to select this engine by in `GetEngine`
+    name = None
+    # what this engine can do
+    capabilities = EngineCapability(0)
+
+    def __init__(self, extensions=(), extensionConfigs=None):
+        # check we're not being given extensions we can't use
+        if extensions and not self.HasCapability(EngineCapability.supports_extensions):
+            raise ValueError(f"Markdown engine `{self.name}` does not support extensions")
+        self.extensions = list(extensions)
+        self.extensionConfigs = dict(extensionConfigs or {})
+        self.sourceMap = SourceMap()
+
+    def GetCapabilities(self):
+        return self.capabilities
+
+    def HasCapability(self, flag):
+        return flag in self.capabilities
+
+    @abc.abstractmethod
+    def convert(self, source):
+        """
+        Convert Markdown source to HTML.
+        """
+
+
+class PythonMarkdownEngine(PooledInterpreter, Engine):
+    """
+    Engine for `markdown` (python-markdown), borrowing interpreters from a shared pool. Slowest
+    of the bundled engines, but the only one which takes python-markdown extensions.
+    """
+    name = "markdown"
+    capabilities = (
+        EngineCapability.supports_extensions
+        | EngineCapability.supports_source_positions
+    )
+
+    def __init__(self, extensions=(), extensionConfigs=None, pool=pool):
+        PooledInterpreter.__init__(self, extensions, extensionConfigs, pool=pool)
+
+
+class MarkdownItEngine(Engine):
+    """
+    Engine for `markdown-it-py`. Extensions can be the names of built-in rules to enable
+    (e.g. "table", "strikethrough") or plugin functions (e.g. from `mdit_py_plugins`), with
+    options for each plugin given in `extensionConfigs` under the plugin's name.
+    """
+    name = "markdown-it"
+    capabilities = (
+        EngineCapability.supports_extensions
+        | EngineCapability.supports_source_positions
+    )
+
+    def __init__(self, extensions=(), extensionConfigs=None, preset="commonmark"):
+        Engine.__init__(self, extensions, extensionConfigs)
+        try:
+            from markdown_it import MarkdownIt
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError(
+                "Please install `markdown-it-py` package in order to use the markdown-it engine"
+            )
+        self.md = MarkdownIt(preset)
+        # apply extensions
+        for ext in self.extensions:
+            if isinstance(ext, str):
+                self.md.enable(ext)
+            else:
+                self.md.use(ext, **self.extensionConfigs.get(ext.__name__, {}))
+        # mark top-level blocks with their source line once they've been parsed
+        self.md.core.ruler.push("source_lines", self._markSourceLines)
+
+    @staticmethod
+    def _markSourceLines(state):
+        lines = []
+        for token in state.tokens:
+            # only mark the opening (or only) token of each top-level block
+            if token.level or token.nesting < 0 or token.map is None:
+                continue
+            # raw HTML is output as-is, so has nowhere to put an attribute
+            if token.type == "html_block":
+                continue
+            token.attrSet("data-line", str(token.map[0]))
+            lines.append(token.map[0])
+        state.env["sourceLines"] = lines
+
+    def convert(self, source):
+        env = {}
+        html = self.md.render(source, env)
+        self.sourceMap = SourceMap(env.get("sourceLines", ()))
+
+        return html
+
+
+class MistuneEngine(Engine):
+    """
+    Engine for `mistune` (version 3 or later). Extensions are mistune plugins, by name
+    (e.g. "table", "strikethrough", "footnotes") or as plugin functions. Mistune doesn't
+    track source lines, so scroll sync isn't available with this engine.
+    """
+    name = "mistune"
+    capabilities = EngineCapability.supports_extensions
+
+    def __init__(self, extensions=(), extensionConfigs=None):
+        Engine.__init__(self, extensions, extensionConfigs)
+        try:
+            import mistune
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError(
+                "Please install `mistune` package in order to use the mistune engine"
+            )
+        # don't escape raw HTML, to match python-markdown
+        self.md = mistune.create_markdown(escape=False, plugins=self.extensions)
+
+    def convert(self, source):
+        return self.md(source)
+
+
+class CmarkEngine(Engine):
+    """
+    Engine for `cmarkgfm` (bindings to GitHub's C implementation of CommonMark). Fastest of
+    the bundled engines. Extensions are the names of cmark-gfm's built-in extensions
+    ("table", "strikethrough", "autolink", "tagfilter", "tasklist").
+    """
+    name = "cmark"
+    capabilities = (
+        EngineCapability.supports_extensions
+        | EngineCapability.supports_source_positions
+    )
+    # pattern for cmark's source positions ("startLine:startCol-endLine:endCol", 1-based)
+    sourcePosPattern = re.compile(r'data-sourcepos="(\d+):\d+-\d+:\d+"')
+
+    def __init__(self, extensions=(), extensionConfigs=None):
+        Engine.__init__(self, extensions, extensionConfigs)
+        try:
+            from cmarkgfm import cmark
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError(
+                "Please install `cmarkgfm` package in order to use the cmark engine"
+            )
+        self._cmark = cmark
+        # mark source positions and don't strip raw HTML, to match python-markdown
+        self.options = cmark.Options.CMARK_OPT_SOURCEPOS | cmark.Options.CMARK_OPT_UNSAFE
+
+    def convert(self, source):
+        html = self._cmark.markdown_to_html_with_extensions(
+            source, self.options, self.extensions
+        )
+        # cmark marks every element, so note each line which starts one
+        lines = set()
+
+        def _toDataLine(match):
+            line = int(match.group(1)) - 1
+            lines.add(line)
+            return f'data-line="{line}"'
+
+        html = self.sourcePosPattern.sub(_toDataLine, html)
+        self.sourceMap = SourceMap(sorted(lines))
+
+        return html
+
+
+# bundled engines, by name
+engines = {
+    engine.name: engine
+    for engine in (PythonMarkdownEngine, MarkdownItEngine, MistuneEngine, CmarkEngine)
+}
+
+
+def GetEngine(name, extensions=(), extensionConfigs=None):
+    """
+    Make an engine by name (one of the keys of `engines`), e.g. to pass as the `interpreter`
+    of a `MarkdownCtrl`.
+    """
+    if name not in engines:
+        raise ValueError(
+            f"Unknown Markdown engine `{name}`, expected one of: {', '.join(engines)}"
+        )
+
+    return engines[name](extensions, extensionConfigs)
@@ -0,0 +1,77 @@
+import io
+import os
+from pathlib import Path
+
+from .engines import PythonMarkdownEngine
+from .themes.viewer.default import DefaultStyle as defaultViewerTheme
+
+__all__ = ["IterHtml", "WriteHtml", "ExportMarkdown"]
+
+
+def IterHtml(htmlBody, theme=defaultViewerTheme, head="", chunkSize=64 * 1024):
+    """
+    Yield a full HTML page as a series of chunks: the head, the theme, the rendered body (a
+    string, yielded `chunkSize` characters at a time, or any iterable of blocks) and the
+    tail - so it can be written out without building a second copy of the page in memory.
+    """
+    # head
+    yield "<head>\n<style>\n"
+    # theme
+    yield theme
+    yield "\n</style>\n"
+    # extra head tags (if any)
+    if head:
+        yield f"{head}\n"
+    yield "</head>\n<body>\n<main>\n"
+    # body
+    if isinstance(htmlBody, str):
+        for i in range(0, len(htmlBody), chunkSize):
+            yield htmlBody[i:i + chunkSize]
+    else:
+        yield from htmlBody
+    # tail
+    yield "\n</main>\n</body>"
+
+
+def WriteHtml(chunks, target, encoding="utf-8"):
+    """
+    Write chunks of HTML (e.g. from `IterHtml`) to a file path, an open file (text or binary)
+    or a socket, one chunk at a time. Returns the number of characters written.
+    """
+    # if given a path, open it
+    if isinstance(target, (str, os.PathLike)):
+        with open(Path(target), "w", encoding=encoding, newline="") as file:
+            return WriteHtml(chunks, file, encoding=encoding)
+    # work out how to write
+    if hasattr(target, "sendall"):
+        # sockets take bytes
+        def _write(chunk):
+            target.sendall(chunk.encode(encoding))
+    elif isinstance(target, (io.RawIOBase, io.BufferedIOBase)):
+        # binary files take bytes
+        def _write(chunk):
+            target.write(chunk.encode(encoding))
+    else:
+        _write = target.write
+    # write
+    written = 0
+    for chunk in chunks:
+        _write(chunk)
+        written += len(chunk)
+
+    return written
+
+
+def ExportMarkdown(source, target, interpreter=None, theme=defaultViewerTheme, encoding="utf-8"):
+    """
+    Convert Markdown and write it out as a full HTML page, e.g. from a batch job with no ctrl.
+    By default converts with the python-markdown engine, using interpreters from the
+    shared pool.
+    """
+    # get interpreter
+    if interpreter is None:
+        interpreter = PythonMarkdownEngine()
+    # convert and write
+    htmlBody = interpreter.convert(source)
+
+    return WriteHtml(IterHtml(htmlBody, theme=theme), target, encoding=encoding)
@@ -16,7 +16,8 @@ class FlagAtrributeMixin:
             'CtrlId': ("raw_markdown_ctrl", "raw_html_ctrl", "rendered_html_ctrl", "all_ctrls", "view_switcher_ctrl"),
             'SelectionModeFlag': ("single_selection", "multi_selection"),
             'ButtonStyleFlag': ("button_icon_only", "button_text_only", "button_text_beside_icon"),
-            'ButtonLayoutFlag': ("left_buttons_area", "right_buttons_area", "top_buttons_area", "bottom_buttons_area", "align_buttons_leading", "align_buttons_center", "align_buttons_trailing")
+            'ButtonLayoutFlag': ("left_buttons_area", "right_buttons_area", "top_buttons_area", "bottom_buttons_area", "align_buttons_leading", "align_buttons_center", "align_buttons_trailing"),
+            'EngineCapabilityFlag': ("supports_extensions", "supports_source_positions", "supports_incremental")
         }
         # iterate through groups
         for group_name, flag_names in flag_groups.items():
@@ -25,7 +26,7 @@ class FlagAtrributeMixin:
             # iterate through flags
             for flag_name in flag_names:
                 # get flag
-                for flag_cls in (MarkdownCtrlFlag, CtrlId):
+                for flag_cls in (MarkdownCtrlFlag, CtrlId, EngineCapability):
                     if hasattr(flag_cls, flag_name):
                         flag = getattr(flag_cls, flag_name)
                 # assign flag to group
@@ -93,3 +94,15 @@ class CtrlId(enum.IntFlag):
 
 
 create_global_aliases(CtrlId)
+
+
+class EngineCapability(enum.Flag):
+    # can be extended (e.g. python-markdown extensions, markdown-it plugins)
+    supports_extensions = enum.auto()
+    # marks output with the source lines it came from (`data-line` attributes)
+    supports_source_positions = enum.auto()
+    # can convert part of a document without converting the rest
+    supports_incremental = enum.auto()
+
+
+create_global_aliases(EngineCapability)
@@ -0,0 +1,160 @@
+import re
+import html
+import hashlib
+import threading
+from collections import OrderedDict
+import pygments, pygments.lexers, pygments.formatters, pygments.util
+import markdown
+import markdown.extensions
+import markdown.postprocessors
+
+from .themes.editor.default import DefaultStyle as defaultEditorTheme
+
+__all__ = ["HighlightCache", "cache", "HighlightHtml", "HighlightExtension"]
+
+
+# pattern for code blocks in HTML output - language is taken from a `language-x` class on
+# the code element, as written by python-markdown's fenced_code, markdown-it, mistune and cmark
+codeBlockPattern = re.compile(
+    r'<pre(?P<preAttrs>[^>]*)><code(?P<codeAttrs>[^>]*)>(?P<code>.*?)</code></pre>',
+    re.DOTALL
+)
+languagePattern = re.compile(r'class="(?:[^"]*\s)?language-(?P<language>[^"\s]+)')
+
+
+class HighlightCache:
+    """
+    Cache of highlighted HTML for code blocks, keyed by a hash of (code, language, style) and
+    shared by every document and ctrl, so re-rendering only highlights blocks which have
+    changed. Holds up to `maxEntries` blocks, dropping the least recently used first.
+    """
+    def __init__(self, maxEntries=2048):
+        self.maxEntries = maxEntries
+        self._entries = OrderedDict()
+        self._formatters = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def GetKey(code, language, style):
+        """
+        Get the hash a block is stored under.
+        """
+        styleName = f"{style.__module__}.{style.__qualname__}"
+        data = "\0".join((styleName, language or "", code)).encode("utf-8", "surrogatepass")
+
+        return hashlib.sha1(data).hexdigest()
+
+    def GetFormatter(self, style):
+        """
+        Get a formatter for the given pygments style, writing styles inline (so output works
+        with any stylesheet) and without wrapping, as blocks keep their own `<pre>`.
+        """
+        with self._lock:
+            formatter = self._formatters.get(style)
+            if formatter is None:
+                formatter = self._formatters[style] = pygments.formatters.HtmlFormatter(
+                    style=style, noclasses=True, nowrap=True
+                )
+
+        return formatter
+
+    def Highlight(self, code, language, style=defaultEditorTheme):
+        """
+        Get highlighted HTML (without a wrapping `<pre>`) for some code, or None if there's no
+        lexer for the language.
+        """
+        key = self.GetKey(code, language, style)
+        # look for a cached copy
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        # highlight
+        try:
+            lexer = pygments.lexers.get_lexer_by_name(language)
+        except pygments.util.ClassNotFound:
+            result = None
+        else:
+            result = pygments.highlight(code, lexer, self.GetFormatter(style))
+        # store
+        with self._lock:
+            old = self._entries.pop(key, None)
+            self._size -= len(old or "")
+            self._entries[key] = result
+            self._size += len(result or "")
+            while len(self._entries) > self.maxEntries:
+                _, dropped = self._entries.popitem(last=False)
+                self._size -= len(dropped or "")
+
+        return result
+
+    def Clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def GetSize(self):
+        """
+        Get the number of characters of highlighted HTML currently cached.
+        """
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# cache shared by the whole process
+cache = HighlightCache()
+
+
+def HighlightHtml(htmlContent, style=defaultEditorTheme, cache=cache):
+    """
+    Highlight every code block with a language in some HTML (from any engine), using a
+    pygments style (e.g. one of the editor themes in `themes.editor`).
+    """
+    background = style.background_color
+
+    def _highlight(match):
+        # get language, leaving blocks without one as they are
+        lang = languagePattern.search(match.group("codeAttrs"))
+        if lang is None:
+            return match.group(0)
+        # highlight
+        code = html.unescape(match.group("code"))
+        result = cache.Highlight(code, lang.group("language"), style)
+        if result is None:
+            return match.group(0)
+        # keep existing attributes (e.g. `data-line`), adding the style's background
+        return (
+            f'<pre{match.group("preAttrs")} style="background: {background}">'
+            f'<code{match.group("codeAttrs")}>{result}</code></pre>'
+        )
+
+    return codeBlockPattern.sub(_highlight, htmlContent)
+
+
+class _HighlightPostprocessor(markdown.postprocessors.Postprocessor):
+    def __init__(self, md, ext):
+        markdown.postprocessors.Postprocessor.__init__(self, md)
+        self.ext = ext
+
+    def run(self, text):
+        return HighlightHtml(text, style=self.ext.getConfig("style"))
+
+
+class HighlightExtension(markdown.extensions.Extension):
+    """
+    python-markdown extension which highlights fenced code blocks through the shared
+    `HighlightCache` - a cached alternative to codehilite. Use with `fenced_code`.
+    """
+    def __init__(self, **kwargs):
+        self.config = {
+            "style": [defaultEditorTheme, "pygments style to highlight with"],
+        }
+        markdown.extensions.Extension.__init__(self, **kwargs)
+
+    def extendMarkdown(self, md):
+        md.registerExtension(self)
+        # run after raw HTML is put back, so code blocks are in their final form
+        md.postprocessors.register(_HighlightPostprocessor(md, self), "highlight", 10)
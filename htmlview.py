@@ -0,0 +1,144 @@
+import re
+import bisect
+
+__all__ = ["StyledRanges", "PrettifyHtml"]
+
+
+class StyledRanges:
+    """
+    Keeps track of which ranges of a ctrl's text have been styled, so text can be styled
+    lazily (e.g. as it's scrolled into view) and each bit only once. Add it as a listener to
+    the ctrl's document model (see `document.PieceTable.AddListener`) and ranges move along
+    with edits, with edited text counting as unstyled again.
+    """
+    def __init__(self):
+        # sorted, non-overlapping (start, end) ranges
+        self._ranges = []
+
+    def Clear(self):
+        """
+        Mark everything as unstyled (e.g. after a theme change).
+        """
+        self._ranges = []
+
+    def Add(self, start, end):
+        """
+        Mark a range as styled.
+        """
+        if end <= start:
+            return
+        # find ranges which touch this one, and merge them in
+        starts = [rng[0] for rng in self._ranges]
+        i = bisect.bisect_left([rng[1] for rng in self._ranges], start)
+        j = bisect.bisect_right(starts, end)
+        if i < j:
+            start = min(start, self._ranges[i][0])
+            end = max(end, self._ranges[j - 1][1])
+        self._ranges[i:j] = [(start, end)]
+
+    def GetRanges(self):
+        """
+        Get the styled ranges, in order.
+        """
+        return list(self._ranges)
+
+    def GetGaps(self, start, end):
+        """
+        Get the unstyled ranges between two positions.
+        """
+        gaps = []
+        pos = start
+        i = bisect.bisect_right([rng[1] for rng in self._ranges], start)
+        for rngStart, rngEnd in self._ranges[i:]:
+            if rngStart >= end:
+                break
+            if rngStart > pos:
+                gaps.append((pos, rngStart))
+            pos = max(pos, rngEnd)
+        if pos < end:
+            gaps.append((pos, end))
+
+        return gaps
+
+    def OnEdit(self, start, end, text):
+        # cut the edited range out, and move later ranges along
+        shift = len(text) - (end - start)
+        ranges = []
+        for rngStart, rngEnd in self._ranges:
+            if rngEnd <= start:
+                ranges.append((rngStart, rngEnd))
+                continue
+            if rngStart < start:
+                ranges.append((rngStart, start))
+            if rngEnd > end:
+                ranges.append((max(rngStart, end) + shift, rngEnd + shift))
+        self._ranges = ranges
+
+
+# tags which go on their own line (and whose content is indented) when pretty-printing
+blockTags = {
+    "address", "article", "aside", "blockquote", "dd", "details", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr",
+    "li", "main", "nav", "ol", "p", "pre", "section", "summary", "table", "tbody", "td",
+    "tfoot", "th", "thead", "tr", "ul",
+}
+# tags whose content is kept exactly as it is
+preformattedTags = {"pre", "script", "style", "textarea"}
+# pattern splitting HTML into tags and text
+tagPattern = re.compile(r"(<!--.*?-->|<[^>]*>)", re.DOTALL)
+tagNamePattern = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9]*)")
+
+
+def PrettifyHtml(htmlContent, indent="    "):
+    """
+    Put each block-level element of some HTML on its own line, indented by how deeply it's
+    nested. Inline markup is left as it is, as is anything inside `<pre>` (and similar).
+    """
+    lines = []
+    line = []
+    depth = 0
+    preformatted = None
+
+    def _flush():
+        text = "".join(line).strip()
+        if text:
+            lines.append(indent * depth + text)
+        line.clear()
+
+    for part in tagPattern.split(htmlContent):
+        if not part:
+            continue
+        match = tagNamePattern.match(part)
+        closing, name = (match.group(1), match.group(2).lower()) if match else (None, None)
+        # inside preformatted content, keep everything until it's closed
+        if preformatted is not None:
+            line.append(part)
+            if closing and name == preformatted:
+                lines.append(indent * depth + "".join(line))
+                line.clear()
+                preformatted = None
+            continue
+        # collapse whitespace in text (but not in comments)
+        if match is None:
+            line.append(part if part.startswith("<!--") else re.sub(r"\s+", " ", part))
+            continue
+        # inline tags stay in the line
+        if name not in blockTags and name not in preformattedTags:
+            line.append(part)
+            continue
+        # block tags start a new line
+        _flush()
+        if name in preformattedTags and not closing:
+            preformatted = name
+            line.append(part)
+            continue
+        if closing:
+            depth = max(depth - 1, 0)
+            lines.append(indent * depth + part)
+            continue
+        lines.append(indent * depth + part)
+        if name != "hr" and not part.endswith("/>"):
+            depth += 1
+    _flush()
+
+    return "\n".join(lines)
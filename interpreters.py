@@ -0,0 +1,155 @@
+import copy
+import threading
+import contextlib
+import markdown
+
+from .sourcemap import SourceMap, SourceMapExtension
+
+__all__ = ["InterpreterPool", "PooledInterpreter", "pool"]
+
+
+class InterpreterPool:
+    """
+    Pool of python-markdown interpreters shared by every ctrl (and any background workers),
+    keyed by extension configuration. Interpreters are reset as they're returned, so each
+    one handed out is ready to convert with no state (e.g. footnotes, toc) carried over
+    from its last conversion, and only as many are made as are in use at once.
+    """
+    def __init__(self, maxIdle=4):
+        # max interpreters to keep for each configuration when not in use
+        self.maxIdle = maxIdle
+        self._idle = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def GetKey(extensions=(), extensionConfigs=None):
+        """
+        Get a hashable key for a configuration of extensions.
+        """
+        parts = []
+        for ext in extensions:
+            if isinstance(ext, str):
+                parts.append(ext)
+            else:
+                # extension instances are keyed by class and config
+                parts.append((
+                    type(ext).__module__,
+                    type(ext).__qualname__,
+                    repr(sorted(ext.getConfigs().items())),
+                ))
+        configs = repr(sorted((extensionConfigs or {}).items()))
+
+        return (tuple(parts), configs)
+
+    def Create(self, extensions=(), extensionConfigs=None):
+        """
+        Make a new interpreter with the given configuration (plus source mapping).
+        """
+        # extension instances hold state, so each interpreter needs its own
+        extensions = [
+            ext if isinstance(ext, str) else copy.deepcopy(ext) for ext in extensions
+        ]
+        md = markdown.Markdown(
+            extensions=extensions + [SourceMapExtension()],
+            extension_configs=extensionConfigs or {},
+        )
+
+        return md
+
+    def Acquire(self, extensions=(), extensionConfigs=None):
+        """
+        Take an interpreter with the given configuration from the pool, making one if none
+        are free. Give it back with `Release` once done.
+        """
+        key = self.GetKey(extensions, extensionConfigs)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                md = idle.pop()
+                self._keys[id(md)] = key
+                return md
+        # make a new one outside of the lock, as extension setup can be slow
+        md = self.Create(extensions, extensionConfigs)
+        with self._lock:
+            self._keys[id(md)] = key
+
+        return md
+
+    def Release(self, md):
+        """
+        Reset an interpreter and return it to the pool.
+        """
+        md.reset()
+        with self._lock:
+            key = self._keys.pop(id(md), None)
+            if key is None:
+                return
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxIdle:
+                idle.append(md)
+
+    @contextlib.contextmanager
+    def Borrow(self, extensions=(), extensionConfigs=None):
+        """
+        Context manager version of `Acquire`/`Release`.
+        """
+        md = self.Acquire(extensions, extensionConfigs)
+        try:
+            yield md
+        finally:
+            self.Release(md)
+
+    def Warm(self, extensions=(), extensionConfigs=None, count=1):
+        """
+        Make sure at least `count` interpreters with the given configuration are ready.
+        """
+        key = self.GetKey(extensions, extensionConfigs)
+        with self._lock:
+            needed = count - len(self._idle.get(key, []))
+        for i in range(needed):
+            md = self.Create(extensions, extensionConfigs)
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < max(count, self.maxIdle):
+                    idle.append(md)
+
+    def Clear(self):
+        """
+        Drop all idle interpreters.
+        """
+        with self._lock:
+            self._idle.clear()
+
+    def GetIdleCount(self):
+        """
+        Get how many interpreters are waiting in the pool.
+        """
+        with self._lock:
+            return sum(len(idle) for idle in self._idle.values())
+
+
+# pool shared by the whole process
+pool = InterpreterPool()
+
+
+class PooledInterpreter:
+    """
+    Stands in for a `markdown.Markdown` object, borrowing an interpreter from a pool for
+    each conversion. After converting, `sourceMap` holds the source map for that conversion.
+    """
+    def __init__(self, extensions=(), extensionConfigs=None, pool=pool):
+        self.extensions = list(extensions)
+        self.extensionConfigs = dict(extensionConfigs or {})
+        self.pool = pool
+        self.sourceMap = SourceMap()
+        # have one ready for the first conversion
+        self.pool.Warm(self.extensions, self.extensionConfigs)
+
+    def convert(self, source):
+        with self.pool.Borrow(self.extensions, self.extensionConfigs) as md:
+            md.sourceMap = SourceMap()
+            html = md.convert(source)
+            self.sourceMap = md.sourceMap
+
+        return html
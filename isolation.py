@@ -0,0 +1,231 @@
+import threading
+import traceback
+import multiprocessing
+
+from .sourcemap import SourceMap
+from .engines import Engine
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where memory can't be capped
+    resource = None
+
+__all__ = ["IsolatedRenderer"]
+
+
+def _work(conn, spec, memoryLimit):
+    """
+    Main loop of a worker process: make an interpreter, then convert each string it's sent.
+    """
+    # cap memory, so a runaway document fails here rather than swapping out the machine
+    if memoryLimit and resource is not None:
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memoryLimit, memoryLimit))
+        except (ValueError, OSError):
+            pass
+    # make interpreter
+    cls, extensions, extensionConfigs = spec
+    try:
+        if cls is None:
+            interpreter = extensions
+        else:
+            interpreter = cls(extensions, extensionConfigs)
+    except Exception as err:
+        conn.send(("error", "".join(traceback.format_exception(err)), None))
+        return
+    conn.send(("ready", None, None))
+    # convert until the pipe is closed
+    while True:
+        try:
+            source = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            if hasattr(interpreter, "reset"):
+                interpreter.reset()
+            html = interpreter.convert(source)
+            sourceMap = getattr(interpreter, "sourceMap", None)
+            conn.send(("ok", html, list(sourceMap.lines) if sourceMap else []))
+        except MemoryError:
+            # can't trust the process after running out of memory, so stop
+            conn.send(("error", "Ran out of memory while rendering", None))
+            return
+        except Exception as err:
+            conn.send(("error", "".join(traceback.format_exception(err)), None))
+
+
+class _Worker:
+    """
+    Handle on one worker process.
+    """
+    def __init__(self, context, spec, memoryLimit):
+        self.conn, childConn = context.Pipe()
+        self.process = context.Process(
+            target=_work, args=(childConn, spec, memoryLimit), daemon=True
+        )
+        self.process.start()
+        childConn.close()
+        self.ready = False
+
+    def WaitReady(self, timeout):
+        """
+        Wait for the worker to have made its interpreter, returning False if it took too long.
+        """
+        if not self.ready and self.conn.poll(timeout):
+            status, message, _ = self.conn.recv()
+            if status != "ready":
+                raise RuntimeError(f"Could not start render worker:\n{message}")
+            self.ready = True
+
+        return self.ready
+
+    def Kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+
+class IsolatedRenderer:
+    """
+    Converts Markdown in separate worker processes, so a pathological document (e.g. deeply
+    nested lists, or patterns which backtrack catastrophically) can be stopped after
+    `timeout` seconds, and can't use more than `memoryLimit` bytes (on platforms which
+    support it), without taking the GUI down with it. Workers are started ahead of time and
+    reused, and any worker which times out or crashes is killed and replaced.
+
+    Engines (see `engines.Engine`) are remade in each worker from their class and
+    extensions; any other interpreter must be picklable. Workers are started with "spawn",
+    so the app's main module must be guarded by `if __name__ == "__main__":`.
+    """
+    def __init__(
+            self, interpreter,
+            timeout=5.0, memoryLimit=512 * 1024 ** 2,
+            workers=1, startupTimeout=30.0
+        ):
+        self.timeout = timeout
+        self.memoryLimit = memoryLimit
+        self.workers = workers
+        self.startupTimeout = startupTimeout
+        # get what workers need to make the interpreter
+        if isinstance(interpreter, Engine):
+            self.spec = (type(interpreter), interpreter.extensions, interpreter.extensionConfigs)
+        else:
+            self.spec = (None, interpreter, None)
+        # don't fork, as the parent has GUI threads running
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = []
+        self._lock = threading.Lock()
+        # state for rendering in the background
+        self._pending = None
+        self._currentKey = None
+        self._thread = None
+        self._wake = threading.Condition()
+        self._closed = False
+        # start workers now, so they're ready by the first render
+        self.Warm()
+
+    def Warm(self):
+        """
+        Start workers until there are `workers` idle.
+        """
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle) >= self.workers:
+                    return
+            worker = _Worker(self._context, self.spec, self.memoryLimit)
+            with self._lock:
+                self._idle.append(worker)
+
+    def Render(self, source):
+        """
+        Convert Markdown in a worker, returning (html, sourceMap). Raises TimeoutError if it
+        took too long, or RuntimeError if the conversion failed or the worker died.
+        """
+        # take an idle worker, or start one if there are none
+        with self._lock:
+            worker = self._idle.pop(0) if self._idle else None
+        if worker is None:
+            worker = _Worker(self._context, self.spec, self.memoryLimit)
+        # convert
+        ok = False
+        try:
+            if not worker.WaitReady(self.startupTimeout):
+                raise TimeoutError("Render worker took too long to start")
+            worker.conn.send(source)
+            if not worker.conn.poll(self.timeout):
+                raise TimeoutError(f"Rendering took longer than {self.timeout:g}s")
+            status, html, lines = worker.conn.recv()
+            ok = True
+        except (EOFError, ConnectionError):
+            raise RuntimeError("Render worker stopped unexpectedly (it may have run out of memory)")
+        finally:
+            # kill workers which failed (or whose conversion did), and give back the rest
+            if ok and status == "ok" and worker.process.is_alive() and not self._closed:
+                with self._lock:
+                    self._idle.append(worker)
+            else:
+                worker.Kill()
+            self.Warm()
+        if status != "ok":
+            raise RuntimeError(html)
+
+        return html, SourceMap(lines)
+
+    def Submit(self, key, source, callback):
+        """
+        Convert Markdown in the background, calling `callback(key, html, sourceMap, error)`
+        from a background thread once done (`error` being None if it succeeded). If
+        something else is submitted before this starts, only the latest is converted.
+        Submitting the same key as the conversion in progress or waiting does nothing.
+        """
+        with self._wake:
+            if self._closed:
+                return
+            if key == self._currentKey or (self._pending and self._pending[0] == key):
+                return
+            self._pending = (key, source, callback)
+            # start thread on first use
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def _run(self):
+        while True:
+            # wait for something to convert
+            with self._wake:
+                while self._pending is None and not self._closed:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                key, source, callback = self._pending
+                self._pending = None
+                self._currentKey = key
+            # convert it
+            try:
+                html, sourceMap = self.Render(source)
+                error = None
+            except Exception as err:
+                html, sourceMap = None, None
+                error = err
+            with self._wake:
+                self._currentKey = None
+                if self._closed:
+                    return
+            callback(key, html, sourceMap, error)
+
+    def Close(self):
+        """
+        Stop all workers. Conversions in progress are left to finish, but their result is
+        not passed on.
+        """
+        with self._wake:
+            self._closed = True
+            self._pending = None
+            self._wake.notify()
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for worker in idle:
+            worker.Kill()
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import queue
+import threading
+from pathlib import Path
+
+from .document import PieceTable
+
+__all__ = ["EditJournal", "ReplayJournal"]
+
+
+class EditJournal:
+    """
+    Autosaves a document model (a `document.PieceTable`) by appending each edit to a journal
+    file, rather than rewriting the whole document - so saving costs as much as the edit, not
+    the document. Edits are queued as they happen and written (and synced to disk every
+    `syncInterval` seconds) on a background thread. Every `compactEvery` edits, the journal is
+    swapped for a new one holding just the current text, so it doesn't grow forever. After a
+    crash, `ReplayJournal` gets the text back.
+
+    Each line of the journal is a JSON list: `["text", text]` to start from some text, or
+    `["edit", start, end, text]` for an edit.
+    """
+    def __init__(self, path, model, compactEvery=1000, syncInterval=1.0, encoding="utf-8"):
+        self.path = Path(path)
+        self.model = model
+        self.compactEvery = compactEvery
+        self.syncInterval = syncInterval
+        self.encoding = encoding
+        self._queue = queue.Queue()
+        self._edits = 0
+        self._thread = None
+
+    def Start(self):
+        """
+        Start journaling, beginning a new journal from the model's current text.
+        """
+        if self._thread is not None:
+            return
+        # start from current text, then follow edits
+        self._queue.put(("text", self.model.Snapshot()))
+        self.model.AddListener(self.OnEdit)
+        self._edits = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def Stop(self):
+        """
+        Stop journaling, once any queued edits are written. The journal is kept, so unsaved
+        edits can still be recovered.
+        """
+        if self._thread is None:
+            return
+        self.model.RemoveListener(self.OnEdit)
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def Discard(self):
+        """
+        Stop journaling and delete the journal (e.g. once the document has been saved).
+        """
+        self.Stop()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def IsRunning(self):
+        return self._thread is not None
+
+    def OnEdit(self, start, end, text):
+        # every so often, compact - the snapshot is taken here (cheaply, as it's by
+        # reference) so it matches the edits queued before it
+        self._edits += 1
+        if self._edits >= self.compactEvery:
+            self._edits = 0
+            self._queue.put(("text", self.model.Snapshot()))
+        else:
+            self._queue.put(("edit", start, end, text))
+
+    def _open(self, snapshot):
+        # write the text to a new journal and swap it in, so there's always a whole journal
+        temp = self.path.with_name(self.path.name + ".tmp")
+        with open(temp, "w", encoding=self.encoding, newline="") as file:
+            file.write(json.dumps(["text", snapshot.GetText()]) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, self.path)
+
+        return open(self.path, "a", encoding=self.encoding, newline="")
+
+    def _run(self):
+        file = None
+        lastSync = time.monotonic()
+        try:
+            while True:
+                # wait for an edit (or until it's time to sync what's been written)
+                try:
+                    item = self._queue.get(timeout=self.syncInterval)
+                except queue.Empty:
+                    item = ()
+                if item is None:
+                    break
+                # write
+                if item and item[0] == "text":
+                    if file is not None:
+                        file.close()
+                    file = self._open(item[1])
+                elif item:
+                    file.write(json.dumps(list(item)) + "\n")
+                # sync every so often, rather than after every keystroke
+                if time.monotonic() - lastSync >= self.syncInterval and file is not None:
+                    file.flush()
+                    os.fsync(file.fileno())
+                    lastSync = time.monotonic()
+        finally:
+            if file is not None:
+                file.flush()
+                os.fsync(file.fileno())
+                file.close()
+
+
+def ReplayJournal(path, encoding="utf-8"):
+    """
+    Get the text of a document from its journal (see `EditJournal`), or None if there's no
+    journal. An entry cut off by a crash (and anything after it) is ignored.
+    """
+    path = Path(path)
+    if not path.is_file():
+        return None
+    model = PieceTable()
+    with open(path, "r", encoding=encoding, newline="") as file:
+        for line in file:
+            # stop at an incomplete entry
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if entry[0] == "text":
+                model.SetText(entry[1])
+            elif entry[0] == "edit":
+                model.Replace(*entry[1:])
+
+    return model.Snapshot().GetText()
@@ -0,0 +1,120 @@
+import os
+import threading
+import multiprocessing
+import concurrent.futures
+import pygments, pygments.lexers, pygments.token
+
+from .edits import GetFencedBlocks, GetBlockRange
+from .outline import OutlineIndex
+
+__all__ = ["SplitBlocks", "LexChunk", "LexParallel", "GetExecutor"]
+
+
+def SplitBlocks(text, chunkSize=256 * 1024):
+    """
+    Split text into ranges of roughly `chunkSize` characters, only splitting between
+    blocks (see `edits.GetBlockRange`) so each range can be lexed without the rest.
+    """
+    ranges = []
+    blocks = GetFencedBlocks(text)
+    start = 0
+    while start < len(text):
+        target = start + chunkSize
+        if target >= len(text):
+            ranges.append((start, len(text)))
+            break
+        # split at the start of the block the target falls in, or after it if that's before us
+        blockStart, blockEnd = GetBlockRange(text, target, target, blocks=blocks)
+        end = blockStart if blockStart > start else blockEnd
+        ranges.append((start, end))
+        start = end
+
+    return ranges
+
+
+def LexChunk(language, text, offset=0):
+    """
+    Lex some text, giving a list of style runs as `(start, length, token)` (with `token` as
+    a string, so runs can be passed between processes - see
+    `pygments.token.string_to_tokentype`) and the headings in it (see
+    `outline.OutlineIndex.ParseHeading`), with positions starting from `offset`.
+    """
+    # keep leading and trailing newlines, so chunks lex the same as the whole text would
+    lexer = pygments.lexers.get_lexer_by_name(language, stripnl=False)
+    i = offset
+    runs = []
+    headings = []
+    for token, value in pygments.lex(text, lexer=lexer):
+        # note any headings
+        heading = OutlineIndex.ParseHeading(i, token, value)
+        if heading is not None:
+            headings.append(heading)
+        # join runs of the same token
+        if runs and runs[-1][2] is token:
+            runs[-1][1] += len(value)
+        else:
+            runs.append([i, len(value), token])
+        i += len(value)
+
+    return [(start, length, str(token)) for start, length, token in runs], headings
+
+
+_executor = None
+_executorLock = threading.Lock()
+
+
+def GetExecutor():
+    """
+    Get the process pool shared by every ctrl for lexing, starting it on first use (its
+    processes are spawned rather than forked, as forking a GUI app isn't safe). Spawned
+    processes import the app's main module again, so an app using the pool must start its
+    GUI from inside an `if __name__ == "__main__":` block - otherwise each worker would open
+    the app again.
+    """
+    global _executor
+    with _executorLock:
+        if _executor is None:
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+        return _executor
+
+
+def LexParallel(text, language, executor=None, chunkSize=None):
+    """
+    Lex text in chunks across a process pool (by default, the one from `GetExecutor`),
+    giving one table of style runs as `(start, length, tokentype)` and the headings in it,
+    as for `LexChunk`. By default, the text is split into a couple of chunks per core. This
+    waits for every chunk, so (as when lexing in one go) it blocks the calling thread until
+    the whole text is lexed - it's just done sooner.
+    """
+    cores = os.cpu_count() or 1
+    if chunkSize is None:
+        chunkSize = max(len(text) // (cores * 2), 64 * 1024)
+    ranges = SplitBlocks(text, chunkSize)
+    # lex each chunk in a worker (unless there's only one chunk, which isn't worth sending,
+    # or only one core, so the workers couldn't run alongside each other)
+    if len(ranges) > 1 and (executor is not None or cores > 1):
+        if executor is None:
+            executor = GetExecutor()
+        futures = [
+            executor.submit(LexChunk, language, text[start:end], start) for start, end in ranges
+        ]
+    else:
+        futures = [concurrent.futures.Future()]
+        futures[0].set_result(LexChunk(language, text))
+    # merge results (in order), turning token names back into token types
+    runs = []
+    headings = []
+    for future in futures:
+        chunkRuns, chunkHeadings = future.result()
+        for start, length, token in chunkRuns:
+            token = pygments.token.string_to_tokentype(token)
+            if runs and runs[-1][2] is token and runs[-1][0] + runs[-1][1] == start:
+                runs[-1] = (runs[-1][0], runs[-1][1] + length, token)
+            else:
+                runs.append((start, length, token))
+        headings += chunkHeadings
+
+    return runs, headings
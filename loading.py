@@ -0,0 +1,67 @@
+import io
+import mmap
+import codecs
+from pathlib import Path
+
+__all__ = ["ChunkedReader"]
+
+
+class ChunkedReader:
+    """
+    Reads a text file a chunk at a time, decoding as it goes and normalizing newlines to
+    "\\n" (including "\\r\\n" split across two chunks). Can optionally memory-map the file
+    rather than reading it, which avoids copying it into a buffer first.
+    """
+    def __init__(self, path, chunkSize=256 * 1024, encoding="utf-8", useMmap=False):
+        self.path = Path(path)
+        self.chunkSize = chunkSize
+        # open file
+        self._file = open(self.path, "rb")
+        self.total = self.path.stat().st_size
+        self.loaded = 0
+        # memory-map if requested (can't map an empty file)
+        self._map = None
+        if useMmap and self.total:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        # setup decoder
+        self._decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(encoding)(), translate=True
+        )
+        self.done = False
+
+    def Read(self):
+        """
+        Read and decode the next chunk, returning "" once the file is exhausted (after which
+        `done` is True and the file is closed).
+        """
+        if self.done:
+            return ""
+        # get next chunk of bytes
+        if self._map is not None:
+            data = self._map[self.loaded:self.loaded + self.chunkSize]
+        else:
+            data = self._file.read(self.chunkSize)
+        self.loaded += len(data)
+        # decode (flushing the decoder on the last chunk)
+        final = len(data) < self.chunkSize or self.loaded >= self.total
+        text = self._decoder.decode(data, final=final)
+        if final:
+            self.Close()
+
+        return text
+
+    def Close(self):
+        """
+        Stop reading and close the file.
+        """
+        self.done = True
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __iter__(self):
+        while not self.done:
+            text = self.Read()
+            if text:
+                yield text
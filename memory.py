@@ -0,0 +1,215 @@
+import types
+import weakref
+import threading
+from collections import OrderedDict, namedtuple
+
+from .assetcache import cache as assetCache
+from .highlight import cache as highlightCache
+from .typeset import cache as typesetCache
+from .interpreters import pool as interpreterPool
+
+__all__ = ["MemoryManager", "manager"]
+
+
+# rough size of an idle python-markdown interpreter (with its extensions), in bytes
+interpreterSize = 256 * 1024
+
+
+CacheEntry = namedtuple("CacheEntry", ["getSize", "trim"])
+
+
+def _weakly(func, default=None):
+    # hold a bound method weakly, so registering it doesn't keep its object alive (once the
+    # object is gone, calling it just gives `default`)
+    if not isinstance(func, types.MethodType):
+        return func
+    ref = weakref.WeakMethod(func)
+
+    def _call():
+        method = ref()
+        if method is None:
+            return default
+
+        return method()
+
+    return _call
+
+
+class MemoryManager:
+    """
+    Keeps account of the memory used by caches across the whole process, so an app with many
+    ctrls open stays within one budget. Each cache is registered with a function giving its
+    size and a function which empties it, either against the ctrl it belongs to or, for
+    caches shared by every ctrl, against no owner. Ctrls `Touch` the manager as they're used,
+    and once the caches which can be trimmed go over `budget`, they're trimmed from the least
+    recently used ctrl onwards, then the shared caches, until they're back within budget.
+    Things which can only be reported on (such as the document itself) are accounted for,
+    but don't count towards the budget, as trimming couldn't bring them under it. Owners
+    (and functions which are methods) are only held weakly, so registering doesn't keep a
+    ctrl alive - its caches are forgotten once it's gone.
+
+    Sizes are rough (they should be cheap to get) and are counted in characters for text
+    and bytes for binary data, such as images - so for mostly-ASCII documents, they're
+    roughly bytes.
+    """
+    def __init__(self, budget=256 * 1024 ** 2):
+        self.budget = budget
+        # (weak reference to owner, caches) by owner id (None for shared caches), least
+        # recently used owner first
+        self._owners = OrderedDict()
+        self._lock = threading.RLock()
+
+    def SetBudget(self, budget):
+        """
+        Set the size trimmable caches may reach in total, trimming them if they're over it.
+        """
+        self.budget = budget
+        self.Check()
+
+    def GetBudget(self):
+        return self.budget
+
+    def Register(self, name, getSize, trim=None, owner=None):
+        """
+        Account for a cache: `getSize()` gives its size and `trim()` empties it (or None if it
+        can only be reported on, in which case it doesn't count towards the budget). Caches
+        belonging to a ctrl should be registered with that ctrl as `owner`, using its methods
+        (or those of its children) rather than functions which refer to it - so the manager
+        doesn't keep it alive. They're unregistered once it's gone, or by `Unregister`.
+        """
+        with self._lock:
+            if id(owner) not in self._owners:
+                if owner is None:
+                    # (shared caches have no owner to go away)
+                    ref = lambda: None
+                else:
+                    ref = weakref.ref(owner, lambda ref, key=id(owner): self._forget(key, ref))
+                self._owners[id(owner)] = (ref, {})
+            caches = self._owners[id(owner)][1]
+            if owner is not None:
+                getSize, trim = _weakly(getSize, 0), _weakly(trim)
+            caches[name] = CacheEntry(getSize, trim)
+
+    def Unregister(self, owner=None, name=None):
+        """
+        Stop accounting for a cache, or (if `name` is None) for every cache of an owner.
+        """
+        with self._lock:
+            if id(owner) not in self._owners:
+                return
+            if name is None:
+                del self._owners[id(owner)]
+            else:
+                self._owners[id(owner)][1].pop(name, None)
+
+    def GetUnregister(self, owner):
+        """
+        Get a function which unregisters every cache of an owner without holding a reference
+        to it, e.g. to call as it's destroyed (when it may no longer be referred to).
+        """
+        key = id(owner)
+
+        def _unregister(*args):
+            self._forget(key)
+
+        return _unregister
+
+    def _forget(self, key, ref=None):
+        # drop an owner's caches (if given its reference, only if it's still the same owner)
+        with self._lock:
+            entry = self._owners.get(key)
+            if entry is not None and (ref is None or entry[0] is ref):
+                del self._owners[key]
+
+    def Touch(self, owner):
+        """
+        Mark an owner as just used, so its caches are the last to be trimmed.
+        """
+        with self._lock:
+            if id(owner) in self._owners:
+                self._owners.move_to_end(id(owner))
+
+    def GetUsage(self, owner=None):
+        """
+        Get the size of each of an owner's caches, by name.
+        """
+        with self._lock:
+            _, caches = self._owners.get(id(owner), (None, {}))
+            caches = dict(caches)
+
+        return {name: cache.getSize() for name, cache in caches.items()}
+
+    def GetReport(self):
+        """
+        Get `(owner, usage)` for every owner, most recently used first - with `usage` as
+        given by `GetUsage` - for diagnostics.
+        """
+        with self._lock:
+            owners = [(ref(), key) for key, (ref, _) in reversed(self._owners.items())]
+
+        return [
+            (owner, self.GetUsage(owner))
+            for owner, key in owners if owner is not None or key == id(None)
+        ]
+
+    def GetTotal(self, trimmable=False):
+        """
+        Get the size of every cache put together - or, if `trimmable` is True, of just the
+        caches which can be trimmed (the ones which count towards the budget).
+        """
+        with self._lock:
+            caches = [
+                cache for _, owned in self._owners.values() for cache in owned.values()
+                if cache.trim is not None or not trimmable
+            ]
+
+        return sum(cache.getSize() for cache in caches)
+
+    def Check(self):
+        """
+        Trim caches if they're over budget. Returns the size freed.
+        """
+        if self.GetTotal(trimmable=True) <= self.budget:
+            return 0
+
+        return self.Trim()
+
+    def Trim(self, budget=None):
+        """
+        Empty caches until the trimmable ones are within `budget` (by default, the manager's
+        budget): a whole ctrl at a time from the least recently used, then the shared caches,
+        largest first. Returns the size freed.
+        """
+        if budget is None:
+            budget = self.budget
+        with self._lock:
+            # shared caches go last, as every ctrl loses out when they're emptied
+            owned = [
+                list(caches.values())
+                for key, (_, caches) in self._owners.items() if key != id(None)
+            ]
+            _, shared = self._owners.get(id(None), (None, {}))
+            owned += [[cache] for cache in sorted(
+                shared.values(), key=lambda cache: cache.getSize(), reverse=True
+            )]
+        # trim until we're within budget
+        before = total = self.GetTotal(trimmable=True)
+        for caches in owned:
+            if total <= budget:
+                break
+            for cache in caches:
+                if cache.trim is not None:
+                    cache.trim()
+            total = self.GetTotal(trimmable=True)
+
+        return before - total
+
+
+# manager shared by the whole process, accounting for the shared caches
+manager = MemoryManager()
+manager.Register("assets", assetCache.GetSize, lambda: assetCache.Invalidate())
+manager.Register("highlighting", highlightCache.GetSize, highlightCache.Clear)
+manager.Register("typesetting", typesetCache.GetSize, typesetCache.Clear)
+manager.Register(
+    "interpreters", lambda: interpreterPool.GetIdleCount() * interpreterSize, interpreterPool.Clear
+)
@@ -0,0 +1,84 @@
+import re
+import bisect
+from collections import namedtuple
+from pygments.token import Generic
+from markdown.extensions.toc import slugify, unique
+
+__all__ = ["Heading", "OutlineIndex"]
+
+
+Heading = namedtuple("Heading", ["level", "text", "offset", "anchor"])
+
+
+class OutlineIndex:
+    """
+    Index of the headings in a Markdown document, built from the tokens made when lexing it
+    for highlighting rather than by lexing it again. When only part of a document is
+    re-lexed, only the headings in that part are replaced.
+    """
+    underlinePattern = re.compile(r"=+|-+")
+
+    def __init__(self):
+        # (level, text, offset) for each heading, sorted by offset
+        self._entries = []
+        self._offsets = []
+        # headings with anchors, built on request
+        self._outline = None
+
+    @staticmethod
+    def ParseHeading(offset, token, text):
+        """
+        Get (level, text, offset) for a lexed token if it's a heading, or None if not.
+        """
+        # only heading tokens count
+        if token not in Generic.Heading and token not in Generic.Subheading:
+            return None
+        # skip Setext-style underlines
+        if OutlineIndex.underlinePattern.fullmatch(text.strip()):
+            return None
+        if text.startswith("#"):
+            # ATX-style, so level is number of hashes
+            level = len(text) - len(text.lstrip("#"))
+            text = text.strip("#").strip()
+        else:
+            # Setext-style, so level is from token type
+            level = 1 if token in Generic.Heading else 2
+            text = text.strip()
+
+        return (level, text, offset)
+
+    def UpdateRegion(self, start, end, shift, entries):
+        """
+        Replace the headings which were between `start` and `end` before an edit with the
+        given entries (from `ParseHeading`, in new offsets), and move headings after `end` by
+        `shift` characters. If `end` is None, the region runs to the end of the document. The
+        region should cover every heading an edit could have changed, including any which have
+        moved into or out of fenced code (see `edits.GetRestyleRange`). Returns True if any headings were added, removed or renamed.
+        """
+        lo = bisect.bisect_left(self._offsets, start)
+        hi = len(self._offsets) if end is None else bisect.bisect_left(self._offsets, end)
+        # shift headings after the region
+        after = [
+            (level, text, offset + shift) for level, text, offset in self._entries[hi:]
+        ]
+        # splice in the new headings
+        entries = sorted(entries, key=lambda entry: entry[2])
+        removed = self._entries[lo:hi]
+        self._entries = self._entries[:lo] + entries + after
+        self._offsets = [entry[2] for entry in self._entries]
+        self._outline = None
+        # only count it as a change if headings were added, removed or renamed
+        return [entry[:2] for entry in removed] != [entry[:2] for entry in entries]
+
+    def GetOutline(self):
+        """
+        Get a list of `Heading`s, with anchor ids matching those made by the `toc` extension.
+        """
+        if self._outline is None:
+            ids = set()
+            self._outline = [
+                Heading(level, text, offset, unique(slugify(text, "-"), ids))
+                for level, text, offset in self._entries
+            ]
+
+        return list(self._outline)
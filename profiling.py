@@ -0,0 +1,202 @@
+import time
+import threading
+from collections import namedtuple
+
+from .sourcemap import SourceMap
+
+__all__ = ["ProcessorTiming", "Profile", "ProfilingInterpreter"]
+
+
+ProcessorTiming = namedtuple("ProcessorTiming", ["stage", "name", "calls", "total", "max"])
+
+
+class Profile:
+    """
+    Timings of each python-markdown processor, for the last conversion and totalled over
+    every conversion since the profile was made (or last reset). Times are in seconds.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.Reset()
+
+    def Reset(self):
+        """
+        Clear all timings.
+        """
+        with self._lock:
+            self._totals = {}
+            self._last = {}
+            self.conversions = 0
+            self.convertTime = 0
+            self.lastConvertTime = 0
+
+    def Record(self, timings, stage, name, elapsed):
+        """
+        Add one call of a processor to a set of timings (a dict from `Begin`).
+        """
+        entry = timings.get((stage, name))
+        if entry is None:
+            timings[(stage, name)] = [1, elapsed, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+
+    def Begin(self):
+        """
+        Start timing a conversion, giving the dict to `Record` its timings in.
+        """
+        return {}
+
+    def End(self, timings, elapsed):
+        """
+        Finish timing a conversion which took `elapsed` seconds in all, adding its timings
+        to the totals.
+        """
+        with self._lock:
+            self._last = timings
+            self.conversions += 1
+            self.convertTime += elapsed
+            self.lastConvertTime = elapsed
+            for key, (calls, total, longest) in timings.items():
+                entry = self._totals.setdefault(key, [0, 0, 0])
+                entry[0] += calls
+                entry[1] += total
+                entry[2] = max(entry[2], longest)
+
+    @staticmethod
+    def _toList(timings):
+        # make list of named tuples, slowest first
+        out = [
+            ProcessorTiming(stage, name, calls, total, longest)
+            for (stage, name), (calls, total, longest) in timings.items()
+        ]
+        out.sort(key=lambda timing: timing.total, reverse=True)
+
+        return out
+
+    def GetLast(self):
+        """
+        Get the `ProcessorTiming`s of the last conversion, slowest first.
+        """
+        with self._lock:
+            return self._toList(self._last)
+
+    def GetTotals(self):
+        """
+        Get the `ProcessorTiming`s totalled over all conversions, slowest first.
+        """
+        with self._lock:
+            return self._toList(self._totals)
+
+    def Format(self, last=False):
+        """
+        Get timings as a plain text table, e.g. for logging.
+        """
+        timings = self.GetLast() if last else self.GetTotals()
+        lines = [f"{'stage':<16}{'processor':<24}{'calls':>8}{'total ms':>12}{'max ms':>10}"]
+        for timing in timings:
+            lines.append(
+                f"{timing.stage:<16}{timing.name:<24}{timing.calls:>8}"
+                f"{timing.total * 1000:>12.2f}{timing.max * 1000:>10.2f}"
+            )
+        conversions = 1 if last else self.conversions
+        elapsed = self.lastConvertTime if last else self.convertTime
+        lines.append(f"{conversions} conversion(s) in {elapsed * 1000:.2f} ms")
+
+        return "\n".join(lines)
+
+
+class ProfilingInterpreter:
+    """
+    Wraps a python-markdown interpreter (a `markdown.Markdown` object, or anything which
+    borrows them from an `interpreters.InterpreterPool`, e.g. the default engine) and times
+    every registered processor on each conversion, recording the results in `profile`.
+    Processors are only instrumented for the length of a conversion, so interpreters shared
+    through a pool aren't slowed down for anyone else. Anything else is passed through to
+    the wrapped interpreter.
+    """
+    # processor registries to instrument, as (stage, path from the interpreter, methods)
+    stages = (
+        ("preprocessor", ("preprocessors",), ("run",)),
+        ("blockprocessor", ("parser", "blockprocessors"), ("test", "run")),
+        ("inlinepattern", ("inlinePatterns",), ("handleMatch",)),
+        ("treeprocessor", ("treeprocessors",), ("run",)),
+        ("postprocessor", ("postprocessors",), ("run",)),
+    )
+
+    def __init__(self, interpreter, profile=None):
+        if not hasattr(interpreter, "pool") and not hasattr(interpreter, "treeprocessors"):
+            raise TypeError(
+                f"Can only profile python-markdown interpreters, not {type(interpreter).__name__}"
+            )
+        self.interpreter = interpreter
+        if profile is None:
+            profile = Profile()
+        self.profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self.interpreter, name)
+
+    def convert(self, source):
+        start = time.perf_counter()
+        timings = self.profile.Begin()
+        pool = getattr(self.interpreter, "pool", None)
+        if pool is not None:
+            # borrow an interpreter the same way the wrapped one would
+            with pool.Borrow(self.interpreter.extensions, self.interpreter.extensionConfigs) as md:
+                md.sourceMap = SourceMap()
+                html = self._convert(md, source, timings)
+                self.interpreter.sourceMap = md.sourceMap
+        else:
+            html = self._convert(self.interpreter, source, timings)
+        self.profile.End(timings, time.perf_counter() - start)
+
+        return html
+
+    def _convert(self, md, source, timings):
+        patched = self._instrument(md, timings)
+        try:
+            return md.convert(source)
+        finally:
+            # put back original methods
+            for processor, method in patched:
+                try:
+                    delattr(processor, method)
+                except AttributeError:
+                    pass
+
+    def _instrument(self, md, timings):
+        patched = []
+        for stage, path, methods in self.stages:
+            # get registry
+            registry = md
+            for attr in path:
+                registry = getattr(registry, attr)
+            # wrap each processor's methods
+            for name, processor in registry._data.items():
+                for method in methods:
+                    # skip methods already overridden on the instance
+                    if method in vars(processor) or not hasattr(processor, method):
+                        continue
+                    # name by method too if there's more than one (e.g. block processor tests)
+                    label = name if len(methods) == 1 else f"{name}.{method}"
+                    setattr(processor, method, self._wrap(
+                        getattr(processor, method), stage, label, timings
+                    ))
+                    patched.append((processor, method))
+
+        return patched
+
+    def _wrap(self, func, stage, name, timings):
+        record = self.profile.Record
+
+        def _timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(timings, stage, name, time.perf_counter() - start)
+
+        return _timed
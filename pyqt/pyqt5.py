@@ -1,23 +1,68 @@
+import bisect
 import traceback
+from html import escape
 import enum
 import pygments, pygments.lexers
 import PyQt5.QtCore as util
 import PyQt5.QtWidgets as qt
 import PyQt5.QtGui as gui
 import PyQt5.QtWebEngineWidgets as html
+import PyQt5.QtWebEngineCore as webcore
 
 from pathlib import Path
 
 from .. import flags
+from ..sourcemap import SourceMap, SourceMapExtension, clickScript, GetClickedLine
+from ..engines import PythonMarkdownEngine, GetEngine
+from ..profiling import ProfilingInterpreter
+from ..isolation import IsolatedRenderer
+from ..highlight import HighlightHtml
+from ..typeset import cache as typesetCache, collectScript
+from ..export import IterHtml, WriteHtml
+from ..server import PreviewServer
+from ..outline import OutlineIndex
+from ..document import PieceTable
+from ..edits import ComputeEdits, GetRestyleRange
+from ..memory import manager as memoryManager
+from ..throttle import RenderThrottle
+from ..journal import EditJournal, ReplayJournal
+from ..lexing import LexChunk, LexParallel
+from ..htmlview import StyledRanges, PrettifyHtml
+from ..search import LineIndex, Searcher, CompilePattern, GetReplaceEdits
+from ..watcher import FileWatcher
+from ..loading import ChunkedReader
+from ..assetcache import cache as assetCache, scheme as assetScheme, PathToUrl
 from ..assets import folder as assetsFolder
 from ..themes.editor.default import DefaultStyle as defaultEditorTheme
 from ..themes.viewer.default import DefaultStyle as defaultViewerTheme
 
 
+
+# register scheme previews load assets through (only possible before the app is made)
+assetSchemeRegistered = False
+if qt.QApplication.instance() is None:
+    _assetScheme = webcore.QWebEngineUrlScheme(assetScheme.encode())
+    _assetScheme.setSyntax(webcore.QWebEngineUrlScheme.Syntax.Path)
+    _assetScheme.setFlags(
+        webcore.QWebEngineUrlScheme.LocalScheme | webcore.QWebEngineUrlScheme.LocalAccessAllowed
+    )
+    webcore.QWebEngineUrlScheme.registerScheme(_assetScheme)
+    assetSchemeRegistered = True
+
 class MarkdownCtrl(qt.QWidget, flags.FlagAtrributeMixin):
+    # emitted with a list of headings when headings are added, removed or renamed
+    outlineChanged = util.pyqtSignal(list)
+    # emitted from the file watcher thread, to hand changes over to the UI thread
+    _fileChanged = util.pyqtSignal(object, object, object)
+    # emitted with (bytes loaded, total bytes, done) after each chunk of a file is loaded
+    loadProgress = util.pyqtSignal(object, object, bool)
+    # emitted from the isolated renderer's thread, to hand renders over to the UI thread
+    _isolatedRender = util.pyqtSignal(object, object, object, object)
+
     def __init__(
             self, parent, interpreter=None, 
-            minCtrlSize=(256, 256)
+            minCtrlSize=(256, 256),
+            extensions=(), extensionConfigs=None
         ):
         # initialise
         qt.QWidget.__init__(self, parent)
@@ -26,11 +71,48 @@ class MarkdownCtrl(qt.QWidget, flags.FlagAtrributeMixin):
         # setup sizer
         self.sizer = qt.QVBoxLayout(self)
 
-        # setup interpreter
+        # setup interpreter (by default, borrowing from a pool shared by all ctrls)
         if interpreter is None:
-            import markdown
-            interpreter = markdown.Markdown()
+            interpreter = PythonMarkdownEngine(extensions, extensionConfigs)
+        # if given the name of an engine, make it
+        if isinstance(interpreter, str):
+            interpreter = GetEngine(interpreter, extensions, extensionConfigs)
         self.interpreter = interpreter
+        # if interpreter takes extensions, have it mark source lines in its output
+        if hasattr(interpreter, "registerExtensions"):
+            interpreter.registerExtensions([SourceMapExtension()], {})
+        self._sourceMap = SourceMap()
+        self._scrollSync = True
+        # (version, html) of last conversion, and version last shown in the HTML ctrls
+        self._htmlBody = (None, "")
+        self._renderedVersion = None
+        # how often to re-render, adapted to how long rendering takes
+        self.throttle = RenderThrottle()
+        self._renderTimer = util.QTimer(self)
+        self._renderTimer.setSingleShot(True)
+        self._renderTimer.timeout.connect(self.onSetMarkdownText)
+        # file we're editing, and thread watching it for changes
+        self._file = None
+        self._encoding = "utf-8"
+        self._watcher = None
+        self._fileChanged.connect(self.onFileChanged)
+        # reader for a file being loaded in chunks
+        self._loader = None
+        # renderer for converting in a separate process, and the last render which worked
+        self._isolation = None
+        self._goodHtml = ""
+        # whether (and with what pygments style) to highlight code blocks in the HTML
+        self._codeHighlighting = False
+        self._codeStyle = None
+        # cache of typeset math and diagrams (if typesetting them)
+        self._typesetCache = None
+        # server showing the preview in browsers (if started)
+        self._server = None
+        # journal autosaving edits (if autosaving)
+        self._journal = None
+        # whether to pretty-print the raw HTML
+        self._prettyHtml = False
+        self._isolatedRender.connect(self.onIsolatedRender)
 
         # setup ctrls panel
         ctrlsPanel = qt.QSplitter(self)
@@ -47,6 +129,10 @@ class MarkdownCtrl(qt.QWidget, flags.FlagAtrributeMixin):
         # add raw markdown ctrl
         rawMarkdownCtrl = self._ctrls[flags.RawMarkdownCtrl] = StyledTextCtrl(self, language="markdown", minSize=minCtrlSize)
         rawMarkdownCtrl.textChanged.connect(self.onSetMarkdownText)
+        # keep preview scrolled to the caret
+        rawMarkdownCtrl.cursorPositionChanged.connect(self.onMarkdownCaretMoved)
+        # relay outline changes
+        rawMarkdownCtrl.outlineChanged.connect(self.outlineChanged)
         ctrlsPanel.addWidget(rawMarkdownCtrl)
         # add view toggle button
         rawMarkdownBtn = ViewToggleButton(viewSwitcherCtrl, iconName="view_md", label="Markdown code")
@@ -58,6 +144,8 @@ class MarkdownCtrl(qt.QWidget, flags.FlagAtrributeMixin):
         rawHtmlCtrl = self._ctrls[flags.RawHtmlCtrl] = StyledTextCtrl(self, language="html", minSize=minCtrlSize)
         rawHtmlCtrl.setReadOnly(True)
         ctrlsPanel.addWidget(rawHtmlCtrl)
+        # only style the HTML as it comes into view, as it's often longer than the Markdown
+        rawHtmlCtrl.setLazyStyling(True)
         # add view toggle button
         rawHtmlBtn = ViewToggleButton(viewSwitcherCtrl, iconName="view_html", label="HTML code")
         rawHtmlBtn.clicked.connect(self.onViewSwitcherButtonClicked)
@@ -67,21 +155,343 @@ class MarkdownCtrl(qt.QWidget, flags.FlagAtrributeMixin):
         # add rendered HTML ctrl
         renderedHtmlCtrl = self._ctrls[flags.RenderedHtmlCtrl] = HTMLPreviewCtrl(self, minSize=minCtrlSize)
         ctrlsPanel.addWidget(renderedHtmlCtrl)
+        # jump to the source of blocks clicked in the preview
+        renderedHtmlCtrl.lineClicked.connect(self.showMarkdownLine)
         # add view toggle button
         renderedHtmlBtn = ViewToggleButton(viewSwitcherCtrl, iconName="view_preview", label="HTML preview")
         renderedHtmlBtn.clicked.connect(self.onViewSwitcherButtonClicked)
         viewSwitcherCtrl.sizer.addWidget(renderedHtmlBtn)
         self._btns.addButton(renderedHtmlBtn, id=flags.RenderedHtmlCtrl)
 
+        # take the shared preview when focused (if it's following focus)
+        qt.QApplication.instance().focusChanged.connect(self.onFocusChanged)
+        # account for our caches in the process-wide memory budget
+        # (registering methods, as the manager only holds those weakly)
+        memoryManager.Register("document", rawMarkdownCtrl.model.GetLength, owner=self)
+        memoryManager.Register("html", self.getHtmlCacheSize, self.clearHtmlCache, owner=self)
+        memoryManager.Register("styles", self.getStyleCacheSize, self.clearStyleCache, owner=self)
+        memoryManager.Register("preview", renderedHtmlCtrl.getContentSize, owner=self)
+        # (the slot doesn't refer to us, as by the time it's called we may be gone)
+        self.destroyed.connect(memoryManager.GetUnregister(self))
+
         # set default style
         self.setSelectionMode(flags.MultiSelection)
         self.setView(flags.AllCtrls)
     
     def getMarkdownText(self):
+        # get content (shared, so repeat calls don't copy the document again)
+        return self.getSnapshot().GetText()
+
+    def applyEdits(self, edits):
+        """
+        Apply a list of (start, end, text) edits to the Markdown, with positions in the
+        current text, as one undoable action. Only the edited blocks are restyled.
+        """
         # get markdown ctrl
         ctrl = self.getCtrl(flags.RawMarkdownCtrl)
-        # get content
-        return ctrl.toPlainText()
+        # apply edits last first, so earlier positions stay valid
+        cursor = gui.QTextCursor(ctrl.document())
+        cursor.beginEditBlock()
+        for start, end, text in sorted(edits, key=lambda edit: edit[0], reverse=True):
+            cursor.setPosition(start)
+            cursor.setPosition(end, cursor.KeepAnchor)
+            cursor.insertText(text)
+        cursor.endEditBlock()
+
+    def applyDiff(self, value):
+        """
+        Set the Markdown text by applying only the lines which differ from the current text,
+        rather than replacing it all as `setMarkdownText` does. Returns the edits applied.
+        """
+        # work out what's changed
+        edits = ComputeEdits(self.getMarkdownText(), value)
+        # apply it
+        if edits:
+            self.applyEdits(edits)
+
+        return edits
+
+    def find(self, pattern, regex=False, caseSensitive=False, wholeWord=False):
+        """
+        Search the Markdown in the background, highlighting matches in the raw markdown ctrl
+        (see `StyledTextCtrl.find`).
+        """
+        return self.getCtrl(flags.RawMarkdownCtrl).find(
+            pattern, regex=regex, caseSensitive=caseSensitive, wholeWord=wholeWord
+        )
+
+    def findNext(self, backwards=False):
+        return self.getCtrl(flags.RawMarkdownCtrl).findNext(backwards=backwards)
+
+    def clearFind(self):
+        self.getCtrl(flags.RawMarkdownCtrl).clearFind()
+
+    def getMatches(self):
+        return self.getCtrl(flags.RawMarkdownCtrl).getMatches()
+
+    def replaceAll(self, pattern, replacement, regex=False, caseSensitive=False, wholeWord=False):
+        """
+        Replace every match of a pattern as one undoable edit, returning how many were replaced.
+        """
+        compiled = CompilePattern(pattern, regex, caseSensitive, wholeWord)
+        edits = GetReplaceEdits(self.getMarkdownText(), compiled, replacement, regex=regex)
+        if edits:
+            self.applyEdits(edits)
+
+        return len(edits)
+
+    def openFile(self, path, watch=True, encoding="utf-8"):
+        """
+        Load Markdown from a file and, if `watch` is True, keep reloading it as it's changed
+        from outside (e.g. by a generator or a git checkout), applying only the changed lines.
+        """
+        path = Path(path)
+        # store file details
+        self._file = path
+        self._encoding = encoding
+        # load content in chunks
+        self.loadFile(path, encoding=encoding)
+        # start watching
+        self.watchFile(watch)
+
+    def loadFile(self, path, chunkSize=256 * 1024, encoding="utf-8", useMmap=False):
+        """
+        Load Markdown from a file a chunk at a time (optionally memory-mapped), appending
+        each chunk on a separate pass of the event loop so the app stays responsive. Only the
+        first chunk is styled straight away - the rest is styled, and the whole document
+        converted, once loading finishes. Progress is reported by the `loadProgress` signal.
+        """
+        ctrl = self.getCtrl(flags.RawMarkdownCtrl)
+        # stop any load in progress (its chain of calls will carry on with this one)
+        loading = self._loader is not None
+        if loading:
+            self._loader.Close()
+        # clear content, without making loading undoable
+        self.setMarkdownText("")
+        ctrl.setUndoRedoEnabled(False)
+        ctrl.deferStyling(False)
+        # start reading
+        self._loader = ChunkedReader(path, chunkSize=chunkSize, encoding=encoding, useMmap=useMmap)
+        if not loading:
+            util.QTimer.singleShot(0, self.onLoadChunk)
+
+    def isLoading(self):
+        """
+        Is a file currently being loaded by `loadFile`?
+        """
+        return self._loader is not None
+
+    def onLoadChunk(self):
+        # stop if cancelled
+        if self._loader is None:
+            return
+        loader = self._loader
+        ctrl = self.getCtrl(flags.RawMarkdownCtrl)
+        # append next chunk
+        chunk = loader.Read()
+        if chunk:
+            ctrl.appendText(chunk)
+            # style the first chunk, so what's visible looks right, then hold off until done
+            if not ctrl.isStylingDeferred():
+                ctrl.styleText()
+                ctrl.deferStyling(True)
+        # report progress
+        self.loadProgress.emit(loader.loaded, loader.total, loader.done)
+        if loader.done:
+            # style the rest and convert
+            self._loader = None
+            ctrl.setUndoRedoEnabled(True)
+            ctrl.deferStyling(False)
+            self.onSetMarkdownText()
+        else:
+            # carry on next time round the event loop
+            util.QTimer.singleShot(0, self.onLoadChunk)
+
+    def getFile(self):
+        """
+        Get the path of the file opened by `openFile`, if any.
+        """
+        return self._file
+
+    def watchFile(self, watch=True, interval=0.5):
+        """
+        Start (or stop) watching the file opened by `openFile` for changes, polling it every
+        `interval` seconds on a background thread.
+        """
+        # stop any existing watcher
+        if self._watcher is not None:
+            self._watcher.Stop()
+            self._watcher = None
+        # start a new one, which hands changes back to the UI thread
+        if watch and self._file is not None:
+            self._watcher = FileWatcher(
+                self._file,
+                model=self.getCtrl(flags.RawMarkdownCtrl).model,
+                callback=self._fileChanged.emit,
+                interval=interval,
+                encoding=self._encoding,
+            )
+            self.destroyed.connect(self._watcher.Stop)
+            self._watcher.start()
+
+    def onFileChanged(self, version, content, edits):
+        # if changed while still loading, start loading again
+        if self._loader is not None:
+            self.loadFile(self._file, encoding=self._encoding)
+            return
+        # if the document has been edited since the diff was made, diff again
+        if self.getSnapshot().GetVersion() != version:
+            edits = ComputeEdits(self.getMarkdownText(), content)
+        # apply changes
+        self.applyEdits(edits)
+
+    def getAutosavePath(self, path=None):
+        """
+        Get where edits are journaled when autosaving: the given path or, by default, next to
+        the file opened by `openFile` (with ".journal" added to its name).
+        """
+        if path is not None:
+            return Path(path)
+        if self._file is None:
+            raise ValueError("No file is open, so a path for the autosave journal is needed.")
+
+        return self._file.with_name(self._file.name + ".journal")
+
+    def setAutosave(self, enable=True, path=None, compactEvery=1000):
+        """
+        Start (or stop) autosaving, by appending each edit to a journal on a background thread
+        (see `journal.EditJournal`) rather than rewriting the whole document. If the app
+        crashes, `recoverAutosave` gets the text back.
+        """
+        # stop any existing journal (keeping what it's written)
+        if self._journal is not None:
+            self._journal.Stop()
+            self._journal = None
+        # start a new one
+        if enable:
+            self._journal = EditJournal(
+                self.getAutosavePath(path),
+                model=self.getCtrl(flags.RawMarkdownCtrl).model,
+                compactEvery=compactEvery,
+            )
+            # write out any edits still queued when we're destroyed
+            self.destroyed.connect(self._journal.Stop)
+            self._journal.Start()
+
+    def getAutosave(self):
+        """
+        Get the journal autosaving edits, if autosaving.
+        """
+        return self._journal
+
+    def recoverAutosave(self, path=None):
+        """
+        Replay an autosave journal (e.g. after a crash) into the Markdown, returning True if
+        there was one to recover.
+        """
+        text = ReplayJournal(self.getAutosavePath(path))
+        if text is None:
+            return False
+        self.setMarkdownText(text)
+
+        return True
+
+    def discardAutosave(self, path=None):
+        """
+        Stop autosaving and delete the journal, e.g. once the document has been saved.
+        """
+        if self._journal is not None:
+            self._journal.Discard()
+            self._journal = None
+        elif path is not None or self._file is not None:
+            self.getAutosavePath(path).unlink(missing_ok=True)
+
+    def setPrettyHtml(self, enable=True):
+        """
+        Set whether to pretty-print the raw HTML (each block on its own line, indented by how
+        deeply it's nested) - this only affects the raw HTML ctrl, not the preview or export.
+        """
+        self._prettyHtml = enable
+        # render again
+        self._renderedVersion = None
+        self.onSetMarkdownText()
+
+    def getPrettyHtml(self):
+        return self._prettyHtml
+
+    def getRenderInterval(self):
+        """
+        Get how long (in seconds) is currently left between renders, which grows as rendering
+        gets slower (see `throttle.RenderThrottle`).
+        """
+        return self.throttle.GetInterval()
+
+    def getRenderCosts(self):
+        """
+        Get the average time (in seconds) recent renders have spent converting ("convert")
+        and updating the HTML ctrls ("preview").
+        """
+        return self.throttle.GetCosts()
+
+    def getMemoryUsage(self):
+        """
+        Get the size of each of this ctrl's caches, by name (see `memory.MemoryManager`).
+        """
+        return memoryManager.GetUsage(self)
+
+    def clearHtmlCache(self):
+        """
+        Drop the stored HTML from the last conversion (it's converted again when next needed).
+        """
+        self._htmlBody = (None, "")
+        self._goodHtml = ""
+
+    def getHtmlCacheSize(self):
+        """
+        Get the size of the stored HTML from the last conversion.
+        """
+        return len(self._htmlBody[1]) + len(self._goodHtml)
+
+    def getStyleCacheSize(self):
+        """
+        Get the size of the styles cached by the raw Markdown and HTML ctrls.
+        """
+        return (
+            self.getCtrl(flags.RawMarkdownCtrl).formatter.GetSize()
+            + self.getCtrl(flags.RawHtmlCtrl).formatter.GetSize()
+        )
+
+    def clearStyleCache(self):
+        """
+        Drop the styles cached by the raw Markdown and HTML ctrls (they're made again as
+        needed).
+        """
+        self.getCtrl(flags.RawMarkdownCtrl).formatter.Clear()
+        self.getCtrl(flags.RawHtmlCtrl).formatter.Clear()
+
+    def onFocusChanged(self, old, new):
+        # if the preview follows focus and focus has come to us, bring it here
+        renderedHtmlCtrl = self.getCtrl(flags.RenderedHtmlCtrl)
+        if (
+            renderedHtmlCtrl.pool.followFocus
+            and new is not None
+            and self.isAncestorOf(new)
+            and renderedHtmlCtrl.isVisible()
+        ):
+            renderedHtmlCtrl.acquirePage()
+        # if focus has come to us, we're in use, so trim other ctrls' caches first
+        if new is not None and self.isAncestorOf(new):
+            memoryManager.Touch(self)
+
+    def getSnapshot(self):
+        """
+        Get an immutable `document.DocumentSnapshot` of the Markdown content, which can be read
+        by reference and handed to other threads.
+        """
+        # get markdown ctrl
+        ctrl = self.getCtrl(flags.RawMarkdownCtrl)
+        # get snapshot
+        return ctrl.getSnapshot()
 
     def setMarkdownText(self, value):
         # get markdown ctrl
@@ -90,23 +500,67 @@ class MarkdownCtrl(qt.QWidget, flags.FlagAtrributeMixin):
         ctrl.setPlainText(value)
     
     def onSetMarkdownText(self, evt=None):
+        # only update if content has changed since last time (and not while loading a file,
+        # as it's converted once loaded)
+        version = self.getSnapshot().GetVersion()
+        if version == self._renderedVersion or self._loader is not None:
+            return
+        # if rendering has been slow, wait until the next render is due (edits until then
+        # are coalesced into one render)
+        delay = self.throttle.GetDelay()
+        if delay > 0:
+            if not self._renderTimer.isActive():
+                self._renderTimer.start(max(int(delay * 1000), 1))
+            return
+        self._renderedVersion = version
         # get HTML body
-        htmlBody = self.getHtmlBody()
-        # populate raw HTML ctrl
-        rawHtmlCtrl = self.getCtrl(flags.RawHtmlCtrl)
-        rawHtmlCtrl.setPlainText(htmlBody)
-        # get full HTML
-        htmlFull = self.getHtml()
-        # populate rendered HTML ctrl
-        renderedHtmlCtrl = self.getCtrl(flags.RenderedHtmlCtrl)
-        renderedHtmlCtrl.setHtml(htmlFull)
+        with self.throttle.Time("convert"):
+            htmlBody = self.getHtmlBody()
+        with self.throttle.Time("preview"):
+            # populate raw HTML ctrl
+            # (only changed blocks are replaced, and only visible ones restyled)
+            rawHtmlCtrl = self.getCtrl(flags.RawHtmlCtrl)
+            rawHtmlCtrl.applyDiff(PrettifyHtml(htmlBody) if self._prettyHtml else htmlBody)
+            # get full HTML
+            htmlFull = self.getHtml()
+            # populate rendered HTML ctrl
+            renderedHtmlCtrl = self.getCtrl(flags.RenderedHtmlCtrl)
+            renderedHtmlCtrl.setHtml(htmlFull, filename=self._file)
+        self.throttle.Rendered()
+        # push to browsers viewing the preview server
+        self.publishPreview()
+        # we're in use, so trim other ctrls' caches first if over budget
+        memoryManager.Touch(self)
+        memoryManager.Check()
     
     def getHtmlBody(self):
         # get markdown
-        mdContent = self.getMarkdownText()
+        snapshot = self.getSnapshot()
+        # if this version has already been converted, reuse it
+        if self._htmlBody[0] == snapshot.GetVersion():
+            return self._htmlBody[1]
+        mdContent = snapshot.GetText()
+        # if isolated, convert in a worker process and keep showing the last render until done
+        if self._isolation is not None:
+            self._isolation.Submit(
+                snapshot.GetVersion(), mdContent,
+                self._isolatedRender.emit
+            )
+            return self._htmlBody[1]
         # parse to HTML
         try:
+            # reset interpreter so no state (e.g. footnotes) carries over from last time
+            if hasattr(self.interpreter, "reset"):
+                self.interpreter.reset()
             htmlContent = self.interpreter.convert(mdContent)
+            # highlight code blocks (cached, so only changed blocks are highlighted again)
+            if self._codeHighlighting:
+                htmlContent = HighlightHtml(htmlContent, style=self.getCodeStyle())
+            # get source map (blank documents are never converted, so have no map)
+            self._sourceMap = SourceMap()
+            if mdContent.strip():
+                self._sourceMap = getattr(self.interpreter, "sourceMap", None) or SourceMap()
+            self._goodHtml = htmlContent
         except Exception as err:
             # on fail, return error as HTML
             tb = "\n".join(traceback.format_exception(err))
@@ -115,9 +569,228 @@ class MarkdownCtrl(qt.QWidget, flags.FlagAtrributeMixin):
                 f"<p>Could not parse Markdown. Error from Python:</p>\n"
                 f"<pre><code>{tb}</code></pre>\n"
                 )
+        # store against version
+        self._htmlBody = (snapshot.GetVersion(), htmlContent)
         
         return htmlContent
 
+    def getEngineCapabilities(self):
+        """
+        Get what the interpreter can do, as `flags.EngineCapability` flags. Interpreters which
+        aren't engines (see `engines.Engine`) are assumed to be python-markdown-like if they
+        take extensions, and to have no capabilities otherwise.
+        """
+        if hasattr(self.interpreter, "GetCapabilities"):
+            return self.interpreter.GetCapabilities()
+        if hasattr(self.interpreter, "registerExtensions"):
+            return flags.SupportsExtensions | flags.SupportsSourcePositions
+
+        return flags.EngineCapability(0)
+
+    def enableProfiling(self, enable=True):
+        """
+        Start (or stop) timing each python-markdown processor on every conversion. Timings
+        build up over the session in the `profiling.Profile` given by `getProfile`.
+        """
+        profiling = isinstance(self.interpreter, ProfilingInterpreter)
+        if enable and not profiling:
+            self.interpreter = ProfilingInterpreter(self.interpreter)
+        if not enable and profiling:
+            self.interpreter = self.interpreter.interpreter
+
+    def getProfile(self):
+        """
+        Get the `profiling.Profile` of conversions so far, or None if profiling isn't enabled.
+        """
+        if isinstance(self.interpreter, ProfilingInterpreter):
+            return self.interpreter.profile
+
+    def setIsolation(self, enable=True, timeout=5.0, memoryLimit=512 * 1024 ** 2):
+        """
+        Start (or stop) converting in a separate worker process, stopped if it takes longer
+        than `timeout` seconds or uses more than `memoryLimit` bytes. While a conversion
+        runs the preview keeps showing the last render, and if it fails the last good render
+        is shown with an error above it - so the editor stays responsive whatever the
+        document. See `isolation.IsolatedRenderer`.
+        """
+        # stop any existing workers
+        if self._isolation is not None:
+            self._isolation.Close()
+            self._isolation = None
+        # start new ones (converting whatever the interpreter wraps, if it's profiling)
+        if enable:
+            interpreter = self.interpreter
+            if isinstance(interpreter, ProfilingInterpreter):
+                interpreter = interpreter.interpreter
+            self._isolation = IsolatedRenderer(
+                interpreter, timeout=timeout, memoryLimit=memoryLimit
+            )
+            self.destroyed.connect(self._isolation.Close)
+
+    def onIsolatedRender(self, version, htmlContent, sourceMap, error):
+        # ignore renders which finish after isolation is turned off
+        if self._isolation is None:
+            return
+        if error is None:
+            if self._codeHighlighting:
+                htmlContent = HighlightHtml(htmlContent, style=self.getCodeStyle())
+            self._goodHtml = htmlContent
+            self._sourceMap = sourceMap
+        else:
+            # on fail, show the last good render with the error above it
+            msg = escape(str(error))
+            htmlContent = (
+                f"<blockquote>\n"
+                f"<p><strong>Could not render Markdown</strong> (showing last successful render):</p>\n"
+                f"<pre><code>{msg}</code></pre>\n"
+                f"</blockquote>\n"
+                f"{self._goodHtml}"
+            )
+        self._htmlBody = (version, htmlContent)
+        # show it
+        self._renderedVersion = None
+        self.onSetMarkdownText()
+
+    def setCodeHighlighting(self, enable=True, style=None):
+        """
+        Set whether to highlight code blocks (with a language) in the HTML, using a pygments
+        style - by default, whatever theme the Markdown ctrl is using. Highlighted blocks are
+        cached (see `highlight.HighlightCache`), so only new or changed blocks cost anything.
+        """
+        self._codeHighlighting = enable
+        self._codeStyle = style
+        # convert again
+        self._htmlBody = (None, self._htmlBody[1])
+        self._renderedVersion = None
+        self.onSetMarkdownText()
+
+    def getCodeHighlighting(self):
+        return self._codeHighlighting
+
+    def getCodeStyle(self):
+        """
+        Get the pygments style code blocks are highlighted with.
+        """
+        if self._codeStyle is not None:
+            return self._codeStyle
+
+        return self.getCtrl(flags.RawMarkdownCtrl).getTheme()
+
+    def setTypesetting(self, enable=True, cache=typesetCache):
+        """
+        Set whether to typeset math (KaTeX or MathJax) and mermaid diagrams in the preview.
+        Each block is typeset by the preview the first time it's seen and the result cached
+        by its source (see `typeset.TypesetCache`), so later renders only typeset blocks which
+        have changed.
+        """
+        self._typesetCache = cache if enable else None
+        self.getCtrl(flags.RenderedHtmlCtrl).typesetCache = self._typesetCache
+        # render again
+        self._renderedVersion = None
+        self.onSetMarkdownText()
+
+    def getTypesetting(self):
+        return self._typesetCache is not None
+
+    def startPreviewServer(self, host="127.0.0.1", port=0):
+        """
+        Start serving the preview to browsers (see `server.PreviewServer`), returning the URL
+        to view it at. Every render is then pushed to all connected browsers.
+        """
+        if self._server is None:
+            self._server = PreviewServer(host=host, port=port)
+            self.destroyed.connect(self._server.Stop)
+        url = self._server.Start()
+        self.publishPreview()
+
+        return url
+
+    def stopPreviewServer(self):
+        """
+        Stop serving the preview to browsers.
+        """
+        if self._server is not None:
+            self._server.Stop()
+            self._server = None
+
+    def getPreviewServer(self):
+        return self._server
+
+    def publishPreview(self):
+        # push current render to the preview server, if running
+        if self._server is None:
+            return
+        htmlBody = self.getHtmlBody()
+        theme = self.getCtrl(flags.RenderedHtmlCtrl).getTheme()
+        # typeset math and diagrams as for the preview
+        head = ""
+        if self._typesetCache is not None:
+            htmlBody = self._typesetCache.Prepare(htmlBody, theme)
+            # always load typesetting libraries, so blocks in later renders can be typeset too
+            head = self._typesetCache.GetHead()
+        self._server.Publish(
+            htmlBody,
+            theme=theme,
+            root=self._file.parent if self._file is not None else None,
+            head=head
+        )
+
+    def getSourceMap(self):
+        """
+        Get the map from Markdown lines to top-level HTML blocks made by the last conversion.
+        """
+        return self._sourceMap
+
+    def getOutline(self):
+        """
+        Get the headings in the Markdown document, as a list of `outline.Heading`s. Connect to
+        `outlineChanged` to be notified when they change.
+        """
+        return self.getCtrl(flags.RawMarkdownCtrl).outline.GetOutline()
+
+    def setScrollSync(self, value):
+        """
+        Set whether the HTML preview should follow the caret in the Markdown ctrl.
+        """
+        self._scrollSync = value
+
+    def getScrollSync(self):
+        return self._scrollSync
+
+    def syncPreview(self, line=None):
+        """
+        Scroll the HTML preview to the block containing the given Markdown line (or the line
+        with the caret on, if None).
+        """
+        ctrl = self.getCtrl(flags.RawMarkdownCtrl)
+        # if not given a line, use the caret
+        if line is None:
+            line = ctrl.textCursor().blockNumber()
+        # can't sync if the interpreter doesn't say where blocks came from
+        if flags.SupportsSourcePositions not in self.getEngineCapabilities():
+            return
+        # look up the block this line is in
+        blockLine = self.getSourceMap().GetBlockLine(line)
+        if blockLine is None:
+            return
+        # scroll to it
+        self.getCtrl(flags.RenderedHtmlCtrl).scrollToLine(blockLine)
+
+    def showMarkdownLine(self, line):
+        """
+        Move the caret in the Markdown ctrl to the start of the given line and scroll to it,
+        e.g. to jump to the source of a block clicked in the preview.
+        """
+        ctrl = self.getCtrl(flags.RawMarkdownCtrl)
+        block = ctrl.document().findBlockByNumber(line)
+        ctrl.setTextCursor(gui.QTextCursor(block))
+        ctrl.ensureCursorVisible()
+
+    def onMarkdownCaretMoved(self, evt=None):
+        # sync preview if requested
+        if self._scrollSync:
+            self.syncPreview()
+
     def onViewSwitcherButtonClicked(self, evt=None):
         for flag in (
             flags.RawMarkdownCtrl,
@@ -134,25 +807,35 @@ class MarkdownCtrl(qt.QWidget, flags.FlagAtrributeMixin):
                 ctrl.hide()
 
     def getHtml(self):
+        # construct full html
+        htmlFull = "".join(self.iterHtml())
+        
+        return htmlFull
+
+    def iterHtml(self, chunkSize=64 * 1024):
+        """
+        Yield the full themed HTML page in chunks (head, theme, rendered body, tail), e.g. to
+        write out with `export.WriteHtml` without a second copy of the page in memory.
+        """
         # get html body
         htmlBody = self.getHtmlBody()
         # get theme
         theme = self.getCtrl(flags.RenderedHtmlCtrl).theme
-        # construct full html
-        htmlFull = (
-            f"<head>\n"
-            f"<style>\n"
-            f"{theme}\n"
-            f"</style>\n"
-            f"</head>\n"
-            f"<body>\n"
-            f"<main>\n"
-            f"{htmlBody}\n"
-            f"</main>\n"
-            f"</body>"
-        )
-        
-        return htmlFull
+        # swap math and diagrams for their cached typesetting (or placeholders to typeset)
+        head = ""
+        if self._typesetCache is not None:
+            htmlBody = self._typesetCache.Prepare(htmlBody, theme)
+            # only load typesetting libraries if there's something to typeset
+            if "data-pending" in htmlBody:
+                head = self._typesetCache.GetHead()
+
+        return IterHtml(htmlBody, theme=theme, head=head, chunkSize=chunkSize)
+
+    def exportHtml(self, target, encoding="utf-8"):
+        """
+        Write the full themed HTML page to a file path, open file or socket, a chunk at a time.
+        """
+        return WriteHtml(self.iterHtml(), target, encoding=encoding)
     
     def getCtrl(self, flag):
         """
@@ -254,6 +937,11 @@ class MarkdownCtrl(qt.QWidget, flags.FlagAtrributeMixin):
                     thisCtrl.styleText()
                 if isinstance(ctrl, HTMLPreviewCtrl):
                     thisCtrl.setHtml(self.getHtml())
+        # code highlighting follows the Markdown ctrl's theme, so convert again
+        if flags.RawMarkdownCtrl in ctrl and self._codeHighlighting and self._codeStyle is None:
+            self._htmlBody = (None, self._htmlBody[1])
+            self._renderedVersion = None
+            self.onSetMarkdownText()
     
     def setButtonStyle(self, style, buttons=flags.AllCtrls):
         """
@@ -374,8 +1062,25 @@ class MarkdownCtrlFormatter:
         
         return self.styles[token]
 
+    def GetSize(self):
+        # (roughly, per char format)
+        return len(self.styles) * 512
+
+    def Clear(self):
+        """
+        Forget token styles (they're made again as they're needed).
+        """
+        self.styles.clear()
+
 
 class StyledTextCtrl(qt.QTextEdit):
+    # emitted with a list of headings when headings are added, removed or renamed
+    outlineChanged = util.pyqtSignal(list)
+    # emitted with a list of `search.Match`es when a search (see `find`) has found its matches
+    searchResults = util.pyqtSignal(list)
+    # (internal) emitted from the search thread when a search is done
+    _searchDone = util.pyqtSignal(object, object, object)
+
     def __init__(self, parent, language, minSize=(256, 256)):
         # initialise
         qt.QTextEdit.__init__(self)
@@ -385,28 +1090,202 @@ class StyledTextCtrl(qt.QTextEdit):
         # set minimum size
         self.setMinimumSize(*minSize)
         # setup lexer
+        self.language = language
         self.lexer = pygments.lexers.get_lexer_by_name(language)
+        # size from which restyling the whole document is lexed across worker processes, or
+        # None to always lex here (the default, as the workers are spawned by re-importing the
+        # app's main module, which needs an `if __name__ == "__main__":` guard - see
+        # `lexing.GetExecutor`)
+        self.parallelLexing = None
         # setup formatter
         self.formatter = MarkdownCtrlFormatter(defaultEditorTheme)
+        # setup heading index, fed by the tokens from styling
+        self.outline = OutlineIndex()
+        # setup document model, kept in sync from edit events
+        self.model = PieceTable()
+        self._ignoreEdits = False
+        self.document().contentsChange.connect(self.onContentsChange)
+        # whether styling is on hold (e.g. while a file is loading)
+        self._deferStyling = False
+        # fenced code blocks when last styled
+        self._fencedBlocks = None
+        # whether there were edits while hidden, so everything needs styling once shown
+        self._restyleOnShow = False
+        # setup line index and search, with matches highlighted over the syntax styles
+        self.lines = LineIndex(self.model)
+        self.searcher = Searcher(self._searchDone.emit)
+        self._searchDone.connect(self.onSearchDone)
+        self.matchColour = "#ffd54f"
+        self._pattern = None
+        self._matches = []
+        self.verticalScrollBar().valueChanged.connect(self.highlightMatches)
+        # whether to only style text as it comes into view, and what's been styled if so
+        self.lazyStyling = False
+        self._styled = StyledRanges()
+        self.verticalScrollBar().valueChanged.connect(self.onScroll)
+        self.destroyed.connect(self.searcher.Close)
         # bind style function
         self.textChanged.connect(self.styleText)
+
+    def setPlainText(self, value):
+        # replace model first, so it's up to date for any handlers of the ctrl's signals
+        self.model.SetText(value)
+        # set content without going through edit events
+        self._ignoreEdits = True
+        qt.QTextEdit.setPlainText(self, value)
+        self._ignoreEdits = False
+
+    def appendText(self, value):
+        # add to model first, so it's up to date for any handlers of the ctrl's signals
+        self.model.Insert(self.model.GetLength(), value)
+        # append content without going through edit events
+        self._ignoreEdits = True
+        cursor = gui.QTextCursor(self.document())
+        cursor.movePosition(cursor.End)
+        cursor.insertText(value)
+        self._ignoreEdits = False
+
+    def applyDiff(self, value):
+        """
+        Set the content by replacing only the lines which differ from the current content,
+        so only those are restyled. Returns the edits.
+        """
+        edits = ComputeEdits(self.getSnapshot().GetText(), value)
+        if not edits:
+            return edits
+        # hold off styling until all edits are in
+        deferred = self._deferStyling
+        self._deferStyling = True
+        # apply edits last first, so earlier positions stay valid
+        cursor = gui.QTextCursor(self.document())
+        cursor.beginEditBlock()
+        for start, end, text in reversed(edits):
+            cursor.setPosition(start)
+            cursor.setPosition(end, cursor.KeepAnchor)
+            cursor.insertText(text)
+        cursor.endEditBlock()
+        self.deferStyling(deferred)
+
+        return edits
+
+    def setLazyStyling(self, lazy=True):
+        """
+        Set whether to only style text as it's scrolled into view, rather than all of it as
+        it's edited - e.g. for long generated text which is read rather than edited.
+        """
+        if lazy and not self.lazyStyling:
+            self.model.AddListener(self._styled.OnEdit)
+        elif not lazy and self.lazyStyling:
+            self.model.RemoveListener(self._styled.OnEdit)
+            self.model.MarkDirty()
+        self.lazyStyling = lazy
+        self._styled.Clear()
+
+    def deferStyling(self, defer=True):
+        """
+        Put styling on hold (edits are still noted), or resume it and style anything edited
+        in the meantime.
+        """
+        self._deferStyling = defer
+        if not defer:
+            self.styleText()
+
+    def isStylingDeferred(self):
+        return self._deferStyling
+
+    def getSnapshot(self):
+        """
+        Get an immutable `document.DocumentSnapshot` of the current content.
+        """
+        # if an edit got past us, resync the model from the ctrl
+        if self.model.GetLength() != self.document().characterCount() - 1:
+            self.model.SetText(self.toPlainText())
+
+        return self.model.Snapshot()
+
+    def onContentsChange(self, position, charsRemoved, charsAdded):
+        # ignore our own changes (including restyling, which only changes formats)
+        if self._ignoreEdits:
+            return
+        # select just the added text (clipped, as whole-document changes count the final separator)
+        cursor = gui.QTextCursor(self.document())
+        end = min(position + charsAdded, self.document().characterCount() - 1)
+        cursor.setPosition(position)
+        cursor.setPosition(end, cursor.KeepAnchor)
+        # copy it into the model
+        text = cursor.selectedText().replace("\u2029", "\n")
+        self.model.Replace(position, position + charsRemoved, text)
     
     def setTheme(self, theme):
         self.formatter = MarkdownCtrlFormatter(theme)
+        # everything needs restyling in the new theme
+        self.model.MarkDirty()
     
     def getTheme(self):
         return self.formatter.theme
     
+    def isParallelLexing(self, region, size):
+        """
+        Should a region (from `model.TakeDirtyRegion`) be lexed across worker processes? Only
+        restyling a whole large document (e.g. on first open or a theme change) is worth it.
+        """
+        return region[1] is None and self.parallelLexing is not None and size >= self.parallelLexing
+
     def styleText(self):
         """
-        Apply pyments.style to text contents
+        Apply pyments.style to text contents - only to the blocks edited since last time, if
+        the document model knows which they are.
         """
-        # don't restyle if ctrl is hidden
-        if not self.isVisible():
+        # styling is on hold (e.g. while a file is loading)
+        if self._deferStyling:
+            return
+        # if edited while hidden, style everything now we're shown
+        if self._restyleOnShow and self.isVisible():
+            self._restyleOnShow = False
+            self.model.MarkDirty()
+        # get content
+        content = self.getSnapshot().GetText()
+        # get region which needs restyling (if any)
+        region = self.model.TakeDirtyRegion()
+        if region is None:
+            # (if styling lazily, there may be unstyled text in view)
+            if self.lazyStyling:
+                self.styleVisible()
             return
+        shift = region[2]
+        # expand to whole blocks, so the lexer has the context it needs (including any text
+        # which has switched between code and prose since a fence was added or removed)
+        start, end, self._fencedBlocks = GetRestyleRange(content, region, self._fencedBlocks)
+        if not self.isVisible():
+            # don't style while hidden (everything is styled once shown), but keep the outline
+            # up to date
+            self._restyleOnShow = True
+            headings = self.lexHeadings(content, region, start, end)
+        elif self.lazyStyling:
+            # just style what's in view (edited ranges are already unstyled)
+            if region[1] is None:
+                self._styled.Clear()
+            self.styleVisible()
+            headings = self.lexHeadings(content, region, start, end)
+        else:
+            headings = self.styleRange(content, region, start, end)
+        # update heading index for the region (whose end was `end - shift` before editing)
+        oldEnd = None if region[1] is None else end - shift
+        if self.outline.UpdateRegion(start, oldEnd, shift, headings):
+            self.outlineChanged.emit(self.outline.GetOutline())
+        # search edited text again, if searching
+        if self._pattern is not None:
+            self.searcher.Submit(self.getSnapshot(), self._pattern)
+
+    def styleRange(self, content, region, start, end):
+        """
+        Style a range of the text (from `edits.GetRestyleRange`), giving the headings in it
+        (see `outline.OutlineIndex.ParseHeading`).
+        """
         # don't trigger any events while this method executes
         self.blockSignals(True)
         self.setUpdatesEnabled(False)
+        self._ignoreEdits = True
 
         # get cursor handle
         cursor = gui.QTextCursor(self.document())
@@ -414,54 +1293,504 @@ class StyledTextCtrl(qt.QTextEdit):
         self.setStyleSheet(
             f"background-color: {self.getTheme().background_color};"
         )
-        # lex content to get tokens
-        content = self.toPlainText()
-        tokens = pygments.lex(content, lexer=self.lexer)
-        # re-add characters with styling
-        i = 0
-        while content.startswith("\n"):
-            content = content[1:]
-            i += 1
-        for token, text in tokens:
-            charFormat = self.formatter.GetTokenFont(token)
-            # select corresponding chars
-            cursor.setPosition(i)
-            cursor.movePosition(cursor.Right, n=len(text), mode=cursor.KeepAnchor)
-            # format selection
-            cursor.setCharFormat(charFormat)
-            # move forward to next token
-            i += len(text)
+        if self.isParallelLexing(region, end - start):
+            # lex whole document across worker processes, then apply the merged style runs
+            runs, headings = LexParallel(content, self.language)
+            for i, length, token in runs:
+                cursor.setPosition(i)
+                cursor.movePosition(cursor.Right, n=length, mode=cursor.KeepAnchor)
+                cursor.setCharFormat(self.formatter.GetTokenStyle(token))
+        else:
+            # lex region to get tokens
+            content = content[start:end]
+            tokens = pygments.lex(content, lexer=self.lexer)
+            # re-add characters with styling
+            i = start
+            while content.startswith("\n"):
+                content = content[1:]
+                i += 1
+            headings = []
+            for token, text in tokens:
+                charFormat = self.formatter.GetTokenStyle(token)
+                # select corresponding chars
+                cursor.setPosition(i)
+                cursor.movePosition(cursor.Right, n=len(text), mode=cursor.KeepAnchor)
+                # format selection
+                cursor.setCharFormat(charFormat)
+                # note any headings
+                heading = self.outline.ParseHeading(i, token, text)
+                if heading is not None:
+                    headings.append(heading)
+                # move forward to next token
+                i += len(text)
 
         # allow signals to trigger again
         self.blockSignals(False)
         self.setUpdatesEnabled(True)
+        self._ignoreEdits = False
+
+        return headings
+
+    def lexHeadings(self, content, region, start, end):
+        """
+        Lex a range of the text just for the headings in it, without styling it.
+        """
+        if self.isParallelLexing(region, end - start):
+            _, headings = LexParallel(content, self.language)
+        else:
+            _, headings = LexChunk(self.language, content[start:end], start)
+
+        return headings
+
+    def styleVisible(self):
+        """
+        Style any unstyled text in view (and a screen's worth either side), a line at a time.
+        """
+        if not self.isVisible() or self._deferStyling:
+            return
+        snapshot = self.getSnapshot()
+        content = snapshot.GetText()
+        # get visible range, plus a margin so scrolling a little doesn't show unstyled text
+        viewport = self.viewport()
+        first = self.cursorForPosition(util.QPoint(0, 0)).position()
+        last = self.cursorForPosition(util.QPoint(viewport.width(), viewport.height())).position()
+        margin = max(last - first, 0)
+        start, end = self.lines.ExpandToLines(
+            max(first - margin, 0), min(last + margin, len(content)), snapshot
+        )
+        # get the bits of it which aren't styled
+        gaps = self._styled.GetGaps(start, end)
+        if not gaps:
+            return
+        # don't trigger any events while styling
+        self.blockSignals(True)
+        self.setUpdatesEnabled(False)
+        self._ignoreEdits = True
+        self.setStyleSheet(
+            f"background-color: {self.getTheme().background_color};"
+        )
+        cursor = gui.QTextCursor(self.document())
+        for gapStart, gapEnd in gaps:
+            # expand to whole lines
+            gapStart, gapEnd = self.lines.ExpandToLines(gapStart, gapEnd, snapshot)
+            # lex and style
+            text = content[gapStart:gapEnd]
+            i = gapStart
+            while text.startswith("\n"):
+                text = text[1:]
+                i += 1
+            for token, value in pygments.lex(text, lexer=self.lexer):
+                cursor.setPosition(i)
+                cursor.movePosition(cursor.Right, n=len(value), mode=cursor.KeepAnchor)
+                cursor.setCharFormat(self.formatter.GetTokenStyle(token))
+                i += len(value)
+            self._styled.Add(gapStart, gapEnd)
+        self.blockSignals(False)
+        self.setUpdatesEnabled(True)
+        self._ignoreEdits = False
+
+    def onScroll(self, value):
+        # style text scrolled into view
+        if self.lazyStyling:
+            self.styleVisible()
+
+    def find(self, pattern, regex=False, caseSensitive=False, wholeWord=False):
+        """
+        Search for a pattern in the background, highlighting matches as extra selections (so
+        syntax styles are kept). `searchResults` is emitted once matches are found, and
+        they're kept up to date as the text changes.
+        """
+        self._pattern = CompilePattern(pattern, regex, caseSensitive, wholeWord)
+        self.searcher.Submit(self.getSnapshot(), self._pattern)
+
+        return self._pattern
+
+    def clearFind(self):
+        """
+        Stop searching and remove match highlights.
+        """
+        self._pattern = None
+        self._matches = []
+        self.searcher.Cancel()
+        self.highlightMatches()
+
+    def getMatches(self):
+        """
+        Get the matches of the current search, as a list of `search.Match`es.
+        """
+        return self._matches
+
+    def findNext(self, backwards=False):
+        """
+        Select the next (or previous) match from the caret, wrapping around, and scroll to it.
+        Returns the match, or None if there are none.
+        """
+        if not self._matches:
+            return None
+        starts = [match.start for match in self._matches]
+        cursor = self.textCursor()
+        if backwards:
+            i = bisect.bisect_left(starts, cursor.selectionStart()) - 1
+        else:
+            i = bisect.bisect_right(starts, cursor.position()) % len(starts)
+        match = self._matches[i]
+        cursor.setPosition(match.start)
+        cursor.setPosition(match.end, cursor.KeepAnchor)
+        self.setTextCursor(cursor)
+        self.ensureCursorVisible()
+
+        return match
+
+    def onSearchDone(self, version, pattern, matches):
+        # ignore results of a search which has since been replaced
+        if pattern is not self._pattern:
+            return
+        # if the text changed while searching, search again
+        snapshot = self.getSnapshot()
+        if version != snapshot.GetVersion():
+            self.searcher.Submit(snapshot, pattern)
+            return
+        # store and show matches
+        self._matches = matches
+        self.highlightMatches()
+        self.searchResults.emit(matches)
+
+    def highlightMatches(self):
+        """
+        Highlight matches in view (only these, so a search with many matches stays cheap).
+        """
+        # get visible range, as whole lines so matches on partly visible lines are included
+        viewport = self.viewport()
+        first = self.cursorForPosition(util.QPoint(0, 0)).position()
+        last = self.cursorForPosition(util.QPoint(viewport.width(), viewport.height())).position()
+        first, last = self.lines.ExpandToLines(first, last, self.getSnapshot())
+        # get matches in it (including one running into it from before)
+        starts = [match.start for match in self._matches]
+        i = bisect.bisect_left(starts, first)
+        j = bisect.bisect_left(starts, last)
+        if i > 0 and self._matches[i - 1].end > first:
+            i -= 1
+        # make a selection for each
+        charFormat = gui.QTextCharFormat()
+        charFormat.setBackground(gui.QColor(self.matchColour))
+        selections = []
+        for start, end in self._matches[i:j]:
+            selection = qt.QTextEdit.ExtraSelection()
+            selection.cursor = gui.QTextCursor(self.document())
+            selection.cursor.setPosition(start)
+            selection.cursor.setPosition(end, gui.QTextCursor.KeepAnchor)
+            selection.format = charFormat
+            selections.append(selection)
+        self.setExtraSelections(selections)
+
+    def showEvent(self, evt):
+        qt.QTextEdit.showEvent(self, evt)
+        # style anything edited while hidden
+        self.styleText()
+
+    def resizeEvent(self, evt):
+        qt.QTextEdit.resizeEvent(self, evt)
+        # more (or less) may be in view
+        if self.lazyStyling:
+            self.styleVisible()
+        if self._matches:
+            self.highlightMatches()
+
+
+class AssetSchemeHandler(webcore.QWebEngineUrlSchemeHandler):
+    """
+    Serves documents' images and other files to the preview from an `assetcache.AssetCache`,
+    so re-rendering doesn't read them from disk again.
+    """
+    def __init__(self, cache=assetCache, parent=None):
+        webcore.QWebEngineUrlSchemeHandler.__init__(self, parent)
+        self.cache = cache
+
+    def requestStarted(self, job):
+        # get file
+        found = self.cache.GetUrl(job.requestUrl().toString())
+        if found is None:
+            job.fail(webcore.QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        data, mimeType = found
+        # reply with it (buffer is deleted along with the job)
+        buffer = util.QBuffer(job)
+        buffer.setData(data)
+        buffer.open(util.QIODevice.ReadOnly)
+        job.reply(mimeType.encode(), buffer)
+
+
+class PreviewPage(html.QWebEnginePage):
+    """
+    Web page which, rather than following them, reports the clicks sent by `clickScript`.
+    """
+    # emitted with the Markdown line of a block clicked in the page
+    lineClicked = util.pyqtSignal(int)
+
+    def acceptNavigationRequest(self, url, navType, isMainFrame):
+        line = GetClickedLine(url.toString())
+        if line is not None:
+            self.lineClicked.emit(line)
+            return False
+
+        return html.QWebEnginePage.acceptNavigationRequest(self, url, navType, isMainFrame)
+
+
+class PreviewPool:
+    """
+    Pool of web pages shared by every `HTMLPreviewCtrl`. Each page has its own renderer
+    process behind it, so rather than every ctrl making one, ctrls borrow a page while shown
+    and give it back when hidden - so memory stays flat however many ctrls there are, and
+    a spare page is kept loaded so a newly shown preview doesn't wait for one to start up.
+    All pages share one (in-memory) profile. With `followFocus`, there is only one page,
+    which moves to whichever `MarkdownCtrl` has focus.
+    """
+    def __init__(self, maxIdle=2, spare=1, followFocus=False):
+        # max pages to keep when not in use
+        self.maxIdle = maxIdle
+        # pages to keep loaded and ready
+        self.spare = spare
+        self.followFocus = followFocus
+        self._idle = []
+        self._profile = None
+        # (if following focus) ctrl with the page
+        self._owner = None
+
+    def setFollowFocus(self, value):
+        """
+        Set whether to have just one page, moved to whichever ctrl has focus.
+        """
+        self.followFocus = value
+        if value:
+            self.spare = 0
+
+    def getFollowFocus(self):
+        return self.followFocus
+
+    def getOwner(self):
+        """
+        Get the ctrl which has the page, if following focus.
+        """
+        return self._owner
+
+    def getProfile(self):
+        """
+        Get the profile shared by all pages (made on first use, as it needs an app), which
+        serves assets through an `AssetSchemeHandler`.
+        """
+        if self._profile is None:
+            self._profile = html.QWebEngineProfile(qt.QApplication.instance())
+            # pages are served locally, but typesetting loads its libraries from a CDN
+            self._profile.settings().setAttribute(
+                html.QWebEngineSettings.LocalContentCanAccessRemoteUrls, True
+            )
+            # serve assets from the shared cache
+            if assetSchemeRegistered:
+                self._profile.installUrlSchemeHandler(
+                    assetScheme.encode(), AssetSchemeHandler(parent=self._profile)
+                )
+
+        return self._profile
+
+    def create(self):
+        """
+        Make a new page (with a blank page loaded so its renderer is started).
+        """
+        page = PreviewPage(self.getProfile(), qt.QApplication.instance())
+        page.setHtml("<html><body></body></html>")
+
+        return page
+
+    def warm(self):
+        """
+        Make pages until there are `spare` idle ones.
+        """
+        while len(self._idle) < min(self.spare, self.maxIdle):
+            self._idle.append(self.create())
+
+    def acquire(self, ctrl):
+        """
+        Give a page to an `HTMLPreviewCtrl`, taking it from whichever ctrl has it if following
+        focus.
+        """
+        # if following focus, take the page from whichever ctrl has it
+        if self.followFocus and self._owner not in (None, ctrl):
+            try:
+                self._owner.releasePage()
+            except RuntimeError:
+                # owner has been deleted, and its page with it
+                pass
+        if self.followFocus:
+            self._owner = ctrl
+        # take an idle page, or make one if there are none
+        page = self._idle.pop() if self._idle else self.create()
+        # make sure there's a spare for next time
+        self.warm()
+
+        return page
+
+    def release(self, page, ctrl):
+        """
+        Take back a page from an `HTMLPreviewCtrl`.
+        """
+        if self._owner is ctrl:
+            self._owner = None
+        # keep it if we need more, otherwise get rid of it
+        if len(self._idle) < self.maxIdle:
+            page.setParent(qt.QApplication.instance())
+            page.setHtml("<html><body></body></html>")
+            self._idle.append(page)
+        else:
+            page.deleteLater()
+
+
+# pool shared by the whole app
+previewPool = PreviewPool()
 
 
 class HTMLPreviewCtrl(html.QWebEngineView):
     theme = defaultViewerTheme
+    # emitted with the Markdown line of a block clicked in the preview
+    lineClicked = util.pyqtSignal(int)
 
-    def __init__(self, parent, minSize=(256, 256)):
+    def __init__(self, parent, minSize=(256, 256), pool=previewPool):
         # initalise
         html.QWebEngineView.__init__(self)
         self.parent = parent
         # set minimum size
         self.setMinimumSize(*minSize)
+        # page is borrowed from a pool while shown (with a blank one, which never loads so
+        # never starts a renderer, the rest of the time)
+        self.pool = pool
+        self._page = None
+        self._blankPage = html.QWebEnginePage(self.pool.getProfile(), self)
+        self.setPage(self._blankPage)
+        # last content set, to show whenever we get a page
+        self._content = None
+        # line to keep scrolled to across page loads
+        self._scrollLine = None
+        self.loadFinished.connect(self.onLoaded)
+        # cache to store math and diagrams typeset by the page in (if typesetting)
+        self.typesetCache = None
+        self._typesetTries = 0
+
+    def hasPage(self):
+        return self._page is not None
+
+    def acquirePage(self):
+        """
+        Borrow a web page from the pool, if we don't have one already.
+        """
+        if self._page is not None:
+            return
+        # get page (owning it while we have it, so it's deleted with us)
+        self._page = self.pool.acquire(self)
+        self._page.setParent(self)
+        self._page.lineClicked.connect(self.lineClicked)
+        self.setPage(self._page)
+        # show last content
+        if self._content is not None:
+            self._page.setHtml(*self._content)
+
+    def releasePage(self):
+        """
+        Give our web page back to the pool.
+        """
+        if self._page is None:
+            return
+        page = self._page
+        self._page = None
+        page.lineClicked.disconnect(self.lineClicked)
+        self.setPage(self._blankPage)
+        self.pool.release(page, self)
+
+    def showEvent(self, evt):
+        # borrow a page while shown (unless following focus, where focus decides)
+        if not self.pool.followFocus:
+            self.acquirePage()
+        html.QWebEngineView.showEvent(self, evt)
+
+    def hideEvent(self, evt):
+        # give back page while hidden
+        self.releasePage()
+        html.QWebEngineView.hideEvent(self, evt)
     
     def setTheme(self, theme):
         self.theme = theme
     
     def getTheme(self):
         return self.theme
-    
-    def setHtml(self, content, filename=None):
+
+    def getContentSize(self):
+        """
+        Get the size of the HTML held to show whenever we have a page.
+        """
+        if self._content is None:
+            return 0
+
+        return len(self._content[0])
+
+    def scrollToLine(self, line):
+        """
+        Scroll to the block whose `data-line` attribute is the given Markdown line.
+        """
+        self._scrollLine = line
         if not self.isVisible():
             return
+        self.page().runJavaScript(
+            f"var el = document.querySelector('[data-line=\"{int(line)}\"]');\n"
+            f"if (el) {{ el.scrollIntoView(); }}"
+        )
+
+    def onLoaded(self, ok):
+        # page reloads lose scroll position, so restore it
+        if self._scrollLine is not None:
+            self.scrollToLine(self._scrollLine)
+        # collect typesetting done by the page once it's had time to run
+        if self.typesetCache is not None:
+            self._typesetTries = 0
+            util.QTimer.singleShot(250, self.collectTypeset)
+
+    def collectTypeset(self):
+        """
+        Store math and diagrams the page has typeset in `typesetCache`, checking again later
+        if it's still going.
+        """
+        if self._page is None or self.typesetCache is None:
+            return
+        self._page.runJavaScript(collectScript, self.onTypesetCollected)
+
+    def onTypesetCollected(self, result):
+        if self.typesetCache is None:
+            return
+        pending = self.typesetCache.Collect(result)
+        # check again if not done (giving up eventually, e.g. if a library didn't load)
+        self._typesetTries += 1
+        if pending and self._typesetTries < 40:
+            util.QTimer.singleShot(250, self.collectTypeset)
+    
+    def setHtml(self, content, filename=None):
         # if not given a filename, use assets folder
         if filename is None:
             filename = Path(__file__).parent.parent / "assets" / "untitled.html"
         # enforce html extension
         filename = filename.parent / (filename.stem + ".html")
-        # get base url
-        base_url = util.QUrl.fromLocalFile(str(filename))
+        # get base url (loading assets through the cache if we can)
+        if assetSchemeRegistered:
+            # (one folder per ctrl, given up when it shows another or is deleted)
+            assetCache.AllowFolder(filename.parent, owner=self)
+            base_url = util.QUrl(PathToUrl(filename))
+        else:
+            base_url = util.QUrl.fromLocalFile(str(filename))
+        # store content (reporting clicks, to jump to their source), so it can be shown
+        # whenever we have a page
+        self._content = (content + clickScript, base_url)
+        if not self.isVisible():
+            return
+        # make sure we have a page (unless following focus and another ctrl has it)
+        if not self.pool.followFocus or self.pool.getOwner() is None:
+            self.acquirePage()
+        if self._page is None:
+            return
         # set HTML
-        html.QWebEngineView.setHtml(self, content, base_url)
+        self._page.setHtml(content, base_url)
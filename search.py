@@ -0,0 +1,204 @@
+import re
+import bisect
+import threading
+from collections import namedtuple
+
+from .edits import Edit
+
+__all__ = ["Match", "LineIndex", "CompilePattern", "FindAll", "GetReplaceEdits", "Searcher"]
+
+
+Match = namedtuple("Match", ["start", "end"])
+
+
+class LineIndex:
+    """
+    Index of where each line starts in a document model (a `document.PieceTable`), kept in
+    sync with its edits. An edit only drops the entries after it, and they're found again
+    (by a fast scan for newlines) the next time a position past the edit is looked up - so
+    typing stays cheap however long the document is.
+    """
+    def __init__(self, model):
+        self.model = model
+        self._starts = [0]
+        # position up to which line starts are known
+        self._scanned = 0
+        self._lock = threading.Lock()
+        model.AddListener(self.Invalidate)
+
+    def Invalidate(self, start, end=None, text=None):
+        """
+        Forget line starts after the given position (called by the model on each edit).
+        """
+        with self._lock:
+            if start < self._scanned:
+                del self._starts[bisect.bisect_right(self._starts, start):]
+                self._scanned = start
+
+    def _scanTo(self, pos, text):
+        # find line starts up to the given position
+        if pos <= self._scanned:
+            return
+        i = text.find("\n", self._scanned)
+        while i >= 0 and i < pos:
+            self._starts.append(i + 1)
+            i = text.find("\n", i + 1)
+        self._scanned = len(text) if i < 0 else pos
+
+    def GetLine(self, pos, snapshot=None):
+        """
+        Get the (0-based) line a position is on.
+        """
+        text = (snapshot or self.model.Snapshot()).GetText()
+        with self._lock:
+            self._scanTo(pos, text)
+
+            return bisect.bisect_right(self._starts, pos) - 1
+
+    def GetLineStart(self, line, snapshot=None):
+        """
+        Get the position the given line starts at (or the end of the text if there are
+        fewer lines).
+        """
+        text = (snapshot or self.model.Snapshot()).GetText()
+        with self._lock:
+            while len(self._starts) <= line and self._scanned < len(text):
+                self._scanTo(min(self._scanned + 64 * 1024, len(text)), text)
+            if line < len(self._starts):
+                return self._starts[line]
+
+            return len(text)
+
+    def ExpandToLines(self, start, end, snapshot=None):
+        """
+        Expand a range out to whole lines, from the start of the line `start` is on to the
+        start of the line after the one `end` is on (or the end of the text).
+        """
+        snapshot = snapshot or self.model.Snapshot()
+
+        return (
+            self.GetLineStart(self.GetLine(start, snapshot), snapshot),
+            self.GetLineStart(self.GetLine(end, snapshot) + 1, snapshot),
+        )
+
+    def PositionToLineCol(self, pos, snapshot=None):
+        """
+        Get the (line, column) of a position.
+        """
+        line = self.GetLine(pos, snapshot)
+
+        return line, pos - self._starts[line]
+
+
+def CompilePattern(pattern, regex=True, caseSensitive=True, wholeWord=False):
+    """
+    Compile a search pattern, either a regular expression or plain text.
+    """
+    if not regex:
+        pattern = re.escape(pattern)
+    if wholeWord:
+        pattern = rf"\b(?:{pattern})\b"
+    flags = re.MULTILINE
+    if not caseSensitive:
+        flags |= re.IGNORECASE
+
+    return re.compile(pattern, flags)
+
+
+def FindAll(text, pattern, maxMatches=None, cancelled=None):
+    """
+    Find every (non-empty) match of a compiled pattern in some text, as `Match`es. Stops
+    early after `maxMatches`, or if `cancelled()` becomes True.
+    """
+    matches = []
+    for i, match in enumerate(pattern.finditer(text)):
+        # check whether to stop every so often
+        if i % 1024 == 0 and cancelled is not None and cancelled():
+            break
+        if match.end() == match.start():
+            continue
+        matches.append(Match(match.start(), match.end()))
+        if maxMatches is not None and len(matches) >= maxMatches:
+            break
+
+    return matches
+
+
+def GetReplaceEdits(text, pattern, replacement, regex=True):
+    """
+    Get the `edits.Edit`s which replace every match of a compiled pattern, with group
+    references in `replacement` expanded if `regex` is True - to apply in one go, e.g. via
+    `MarkdownCtrl.ApplyEdits`.
+    """
+    edits = []
+    for match in pattern.finditer(text):
+        if match.end() == match.start():
+            continue
+        value = match.expand(replacement) if regex else replacement
+        edits.append(Edit(match.start(), match.end(), value))
+
+    return edits
+
+
+class Searcher:
+    """
+    Runs searches over document snapshots on a background thread. Submitting a new search
+    cancels any search still running, and `callback(version, pattern, matches)` is called
+    (from the background thread) once a search finishes, with the version of the snapshot
+    searched.
+    """
+    def __init__(self, callback, maxMatches=100000):
+        self.callback = callback
+        self.maxMatches = maxMatches
+        self._pending = None
+        self._generation = 0
+        self._thread = None
+        self._wake = threading.Condition()
+        self._closed = False
+
+    def Submit(self, snapshot, pattern):
+        """
+        Search a snapshot for a compiled pattern in the background.
+        """
+        with self._wake:
+            self._generation += 1
+            self._pending = (self._generation, snapshot, pattern)
+            # start thread on first use
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def Cancel(self):
+        """
+        Cancel any search waiting or in progress.
+        """
+        with self._wake:
+            self._generation += 1
+            self._pending = None
+
+    def Close(self):
+        with self._wake:
+            self._closed = True
+            self._generation += 1
+            self._pending = None
+            self._wake.notify()
+
+    def _run(self):
+        while True:
+            # wait for a search
+            with self._wake:
+                while self._pending is None and not self._closed:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                generation, snapshot, pattern = self._pending
+                self._pending = None
+            # search (stopping if another search comes in)
+            matches = FindAll(
+                snapshot.GetText(), pattern,
+                maxMatches=self.maxMatches,
+                cancelled=lambda: self._generation != generation
+            )
+            if self._generation == generation:
+                self.callback(snapshot.GetVersion(), pattern, matches)
@@ -0,0 +1,259 @@
+import asyncio
+import threading
+import urllib.parse
+from pathlib import Path
+
+from .export import IterHtml
+from .assetcache import cache as assetCache
+from .themes.viewer.default import DefaultStyle as defaultViewerTheme
+
+__all__ = ["PreviewServer"]
+
+
+# event telling viewers to reload the page
+reloadEvent = b"event: reload\ndata: \n\n"
+
+
+# script added to served pages, which swaps in new content as it's pushed
+clientScript = """<script>
+(function() {
+    var events = new EventSource('/events');
+    events.addEventListener('update', function(evt) {
+        var main = document.querySelector('main');
+        var y = window.scrollY;
+        main.innerHTML = evt.data;
+        window.scrollTo(0, y);
+        // typeset any new math or diagrams
+        if (window.mdwidgetTypeset) {
+            mdwidgetTypeset.run();
+        }
+    });
+    events.addEventListener('reload', function(evt) {
+        window.location.reload();
+    });
+})();
+</script>"""
+
+
+class PreviewServer:
+    """
+    Local HTTP server showing a live preview in any browser. Runs an asyncio loop on a
+    background thread, serving the themed page at `/` and pushing each new render to every
+    connected viewer over server-sent events at `/events`, where the page swaps it in without
+    reloading. Each render is encoded once however many viewers there are, and viewers which
+    fall behind skip straight to the latest render (or reload, if the theme changed in the
+    renders they missed). Other paths are served from `root` (e.g.
+    the document's folder) through the shared asset cache.
+    """
+    def __init__(self, host="127.0.0.1", port=0, root=None):
+        self.host = host
+        self.port = port
+        self.root = Path(root) if root is not None else None
+        # current content (set from any thread, so only touched with the lock held)
+        self._lock = threading.Lock()
+        self._theme = defaultViewerTheme
+        self._head = ""
+        self._body = ""
+        # update event with the current body, the number of renders published and the last
+        # one which needed viewers to reload
+        self._update = b""
+        self._version = 0
+        self._reloadVersion = 0
+        # asyncio state (only touched from the loop's thread)
+        self._loop = None
+        self._server = None
+        self._changed = None
+        self._clients = set()
+        self._thread = None
+        self._started = threading.Event()
+
+    def Start(self):
+        """
+        Start serving, returning the URL to view the preview at.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            self._started.wait()
+
+        return self.GetUrl()
+
+    def Stop(self):
+        """
+        Stop serving and disconnect all viewers.
+        """
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+        self._loop = None
+        self._started.clear()
+
+    def IsRunning(self):
+        return self._loop is not None
+
+    def GetUrl(self):
+        return f"http://{self.host}:{self.port}/"
+
+    def GetViewerCount(self):
+        """
+        Get how many viewers are currently connected for updates.
+        """
+        return len(self._clients)
+
+    def Publish(self, htmlBody, theme=None, root=None, head=None):
+        """
+        Push a new render to every viewer (can be called from any thread). `head` is any
+        extra tags for the page's `<head>` (e.g. typesetting scripts). If the theme or head
+        has changed, viewers reload the page rather than just swapping in the new body.
+        """
+        # encode event once for all viewers
+        lines = "".join(f"data: {line}\n" for line in htmlBody.split("\n"))
+        update = f"event: update\n{lines}\n".encode("utf-8")
+        with self._lock:
+            reload = (
+                (theme is not None and theme != self._theme)
+                or (head is not None and head != self._head)
+            )
+            if theme is not None:
+                self._theme = theme
+            if head is not None:
+                self._head = head
+            if root is not None:
+                self.root = Path(root)
+            self._body = htmlBody
+            self._update = update
+            self._version += 1
+            if reload:
+                self._reloadVersion = self._version
+        # wake viewers
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._notify)
+            except RuntimeError:
+                # (stopped since)
+                pass
+
+    def _notify(self):
+        # swap in a new event for waiting viewers to wake on
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._changed = asyncio.Event()
+        # start server
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        # serve until stopped
+        try:
+            self._loop.run_forever()
+        finally:
+            # close server and viewer connections
+            self._server.close()
+            for task in list(self._clients):
+                task.cancel()
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(
+                asyncio.gather(*pending, return_exceptions=True)
+            )
+            self._loop.close()
+            self._clients.clear()
+
+    async def _handle(self, reader, writer):
+        try:
+            # read request
+            try:
+                request = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            parts = request.split(b"\r\n", 1)[0].decode("latin-1").split(" ")
+            if len(parts) < 2 or parts[0] != "GET":
+                await self._respond(writer, 405, "text/plain", b"Method not allowed")
+                return
+            path = urllib.parse.unquote(urllib.parse.urlsplit(parts[1]).path)
+            # route
+            if path == "/events":
+                await self._stream(writer)
+            elif path in ("/", "/index.html"):
+                with self._lock:
+                    body, theme, head = self._body, self._theme, self._head
+                head = f"{clientScript}\n{head}" if head else clientScript
+                page = "".join(IterHtml(body, theme=theme, head=head))
+                await self._respond(writer, 200, "text/html; charset=utf-8", page.encode("utf-8"))
+            else:
+                await self._serveAsset(writer, path)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, contentType, data):
+        reasons = {200: "OK", 404: "Not Found", 405: "Method Not Allowed"}
+        writer.write(
+            f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n"
+            f"Content-Type: {contentType}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Cache-Control: no-cache\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1")
+        )
+        writer.write(data)
+        await writer.drain()
+
+    async def _serveAsset(self, writer, path):
+        # only serve files inside the root folder
+        found = None
+        with self._lock:
+            root = self.root
+        if root is not None:
+            file = (root / path.lstrip("/")).resolve()
+            if file.is_relative_to(root.resolve()):
+                found = assetCache.Get(file)
+        if found is None:
+            await self._respond(writer, 404, "text/plain", b"Not found")
+            return
+        data, mimeType = found
+        await self._respond(writer, 200, mimeType, data)
+
+    async def _stream(self, writer):
+        task = asyncio.current_task()
+        self._clients.add(task)
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/event-stream\r\n"
+                b"Cache-Control: no-cache\r\n"
+                b"Connection: keep-alive\r\n\r\n"
+            )
+            await writer.drain()
+            # catch up with anything published since the page was loaded
+            with self._lock:
+                sent, update = self._version, self._update
+            writer.write(update or b": connected\n\n")
+            await writer.drain()
+            # send updates until the viewer goes away, skipping any missed while sending
+            while True:
+                # (only wait if nothing was published while we were sending)
+                if sent == self._version:
+                    await self._changed.wait()
+                with self._lock:
+                    version, reloadVersion, update = (
+                        self._version, self._reloadVersion, self._update
+                    )
+                if version == sent:
+                    continue
+                # reload if any render since the last one sent needed it, otherwise just
+                # swap in the latest body
+                writer.write(reloadEvent if reloadVersion > sent else update)
+                sent = version
+                await writer.drain()
+        finally:
+            self._clients.discard(task)
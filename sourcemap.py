@@ -0,0 +1,304 @@
+import re
+import bisect
+import markdown
+import markdown.util
+import markdown.extensions
+import markdown.preprocessors
+import markdown.blockprocessors
+import markdown.treeprocessors
+
+__all__ = ["SourceMap", "SourceMapExtension", "clickScript", "clickScheme", "GetClickedLine"]
+
+
+# scheme of the URLs the preview navigates to when a block is clicked, which the preview ctrl
+# intercepts (rather than following) to jump to that block's source
+clickScheme = "mdwidget-line"
+# script added to previews, which reports clicks on tagged blocks (except on links, or when
+# selecting text) by navigating to `clickScheme:<data-line>`
+clickScript = """<script>
+document.addEventListener('click', function(evt) {
+    if (evt.target.closest('a') || !window.getSelection().isCollapsed) {
+        return;
+    }
+    var el = evt.target.closest('[data-line]');
+    if (el) {
+        evt.preventDefault();
+        window.location.href = '%s:' + el.dataset.line;
+    }
+});
+</script>""" % clickScheme
+
+
+def GetClickedLine(url):
+    """
+    Get the Markdown line a preview click reported (see `clickScript`), or None if a URL
+    isn't a click.
+    """
+    prefix = clickScheme + ":"
+    if not url.startswith(prefix) or not url[len(prefix):].isdigit():
+        return None
+
+    return int(url[len(prefix):])
+
+
+class SourceMap:
+    """
+    Sorted table linking the top-level blocks of a rendered document back to the line of
+    Markdown they started on. Each block is marked in the HTML with a `data-line` attribute
+    holding the same line number, so lookups in either direction are a binary search.
+    """
+    def __init__(self, lines=()):
+        # store start lines (always ascending, as blocks are parsed in document order)
+        self.lines = list(lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def GetBlockIndex(self, line):
+        """
+        Get the index of the block which contains the given (0-based) source line, or -1 if
+        the line comes before the first block.
+        """
+        return bisect.bisect_right(self.lines, line) - 1
+
+    def GetBlockLine(self, line):
+        """
+        Get the start line (i.e. the `data-line` value) of the block which contains the
+        given source line, or None if there is no such block.
+        """
+        i = self.GetBlockIndex(line)
+        if i < 0:
+            return None
+        return self.lines[i]
+
+    def GetSourceLine(self, index):
+        """
+        Get the source line which the block at the given index started on.
+        """
+        return self.lines[index]
+
+
+class _SourceLinesPreprocessor(markdown.preprocessors.Preprocessor):
+    """
+    Stores lines before any other preprocessors get to them.
+    """
+    def __init__(self, md, ext):
+        markdown.preprocessors.Preprocessor.__init__(self, md)
+        self.ext = ext
+
+    def run(self, lines):
+        self.ext.reset()
+        self.ext.sourceLines = lines
+        return lines
+
+
+class _AlignLinesPreprocessor(markdown.preprocessors.Preprocessor):
+    """
+    Once all other preprocessors have run, works out which source line each processed line
+    came from.
+    """
+    def __init__(self, md, ext):
+        markdown.preprocessors.Preprocessor.__init__(self, md)
+        self.ext = ext
+
+    def run(self, lines):
+        self.ext.lineMap = align_lines(self.ext.sourceLines, lines)
+        return lines
+
+
+class _BlockMarkerProcessor(markdown.blockprocessors.BlockProcessor):
+    """
+    Runs before every other block processor on each top-level block, to note which line it
+    started on and tag the elements made from the previous block. Never consumes a block.
+    """
+    def __init__(self, parser, ext):
+        markdown.blockprocessors.BlockProcessor.__init__(self, parser)
+        self.ext = ext
+
+    def test(self, parent, block):
+        return parent is self.ext.root or self.ext.root is None
+
+    def run(self, parent, blocks):
+        ext = self.ext
+        if ext.root is None:
+            # first block of the document, so blocks are as yet untouched - count lines
+            ext.root = parent
+            ext.blocks = blocks
+            ext.suffixLines = [0] * (len(blocks) + 1)
+            for i in range(len(blocks) - 1, -1, -1):
+                # each block is joined to the next by a blank line
+                ext.suffixLines[i] = ext.suffixLines[i + 1] + blocks[i].count("\n") + 2
+            ext.totalLines = ext.suffixLines[0]
+        if blocks is not ext.blocks:
+            # some processors parse part of a block straight into the root, ignore these
+            return False
+        # tag elements created since last time
+        ext.markChildren()
+        # only the first block is ever altered by processors, so the rest are still the tail
+        tail = ext.suffixLines[len(ext.suffixLines) - len(blocks)]
+        line = ext.totalLines - tail - blocks[0].count("\n") - 2
+        # store line and how many children the root has, so the next call can tag new ones
+        ext.pending = (line, len(parent))
+
+        return False
+
+
+class _SourceMapTreeprocessor(markdown.treeprocessors.Treeprocessor):
+    """
+    Tags elements from the final block and publishes the source map as `md.sourceMap`.
+    """
+    def __init__(self, md, ext):
+        markdown.treeprocessors.Treeprocessor.__init__(self, md)
+        self.ext = ext
+
+    def run(self, root):
+        self.ext.markChildren()
+        self.md.sourceMap = SourceMap(self.ext.blockLines)
+
+
+class _RetagTreeprocessor(markdown.treeprocessors.Treeprocessor):
+    """
+    Runs after every other treeprocessor, to tag again any element which lost its tag - e.g.
+    code blocks highlighted by `codehilite`, which are swapped for stashed HTML.
+    """
+    def __init__(self, md, ext):
+        markdown.treeprocessors.Treeprocessor.__init__(self, md)
+        self.ext = ext
+
+    def run(self, root):
+        for child, line in self.ext.tagged:
+            if child.get("data-line") is None:
+                self.ext.tagElement(child, line)
+        self.ext.reset()
+
+
+class SourceMapExtension(markdown.extensions.Extension):
+    """
+    Python-markdown extension which adds a `data-line` attribute to each top-level element,
+    giving the (0-based) Markdown line it came from, and stores a `SourceMap` of these lines
+    as `md.sourceMap` after each conversion.
+    """
+    placeholderPattern = re.compile(markdown.util.HTML_PLACEHOLDER % r"([0-9]+)")
+    tagPattern = re.compile(r"^(\s*<[a-zA-Z][\w-]*)")
+    taggedPattern = re.compile(r"^\s*<[a-zA-Z][\w-]* data-line=")
+
+    def extendMarkdown(self, md):
+        self.md = md
+        self.reset()
+        md.sourceMap = SourceMap()
+        md.registerExtension(self)
+        # normalize whitespace runs at 30, so capture lines just before
+        md.preprocessors.register(_SourceLinesPreprocessor(md, self), "source_lines", 35)
+        md.preprocessors.register(_AlignLinesPreprocessor(md, self), "align_lines", -100)
+        md.parser.blockprocessors.register(_BlockMarkerProcessor(md.parser, self), "block_marker", 1000)
+        md.treeprocessors.register(_SourceMapTreeprocessor(md, self), "source_map", 100)
+        md.treeprocessors.register(_RetagTreeprocessor(md, self), "source_map_retag", -100)
+
+    def reset(self):
+        self.sourceLines = []
+        self.lineMap = []
+        self.root = None
+        self.blocks = None
+        self.suffixLines = []
+        self.totalLines = 0
+        self.pending = None
+        self.blockLines = []
+        # (element, line) for each tagged element
+        self.tagged = []
+
+    def markChildren(self):
+        """
+        Tag any children added to the root since the last block was marked.
+        """
+        if self.pending is None:
+            return
+        line, start = self.pending
+        self.pending = None
+        # map processed line back to source line
+        if self.lineMap:
+            line = self.lineMap[min(max(line, 0), len(self.lineMap) - 1)]
+        for child in list(self.root)[start:]:
+            if not self.tagElement(child, line):
+                continue
+            self.tagged.append((child, line))
+            # blocks are in order, but several elements can come from one block
+            if not self.blockLines or self.blockLines[-1] != line:
+                self.blockLines.append(line)
+
+    def tagElement(self, child, line):
+        """
+        Give an element a `data-line` attribute, returning False if it can't be tagged.
+        """
+        # a paragraph of just a placeholder will be replaced by stashed HTML, so tag that instead
+        match = self.placeholderPattern.fullmatch((child.text or "").strip())
+        if child.tag == "p" and match and not len(child):
+            i = int(match.group(1))
+            stashed = self.md.htmlStash.rawHtmlBlocks[i]
+            if not isinstance(stashed, str) or not self.tagPattern.match(stashed):
+                return False
+            if self.taggedPattern.match(stashed):
+                return True
+            self.md.htmlStash.rawHtmlBlocks[i] = self.tagPattern.sub(
+                rf'\1 data-line="{line}"', stashed, count=1
+            )
+        else:
+            child.set("data-line", str(line))
+
+        return True
+
+
+def align_lines(source, processed):
+    """
+    Map each line in `processed` to the index of the line in `source` it came from, where
+    `processed` is `source` with some runs of lines collapsed or altered (e.g. fenced code
+    swapped for a placeholder, or whitespace normalized).
+    """
+    def norm(line):
+        return line.expandtabs().strip()
+
+    lineMap = []
+    j = 0
+    i = 0
+    while i < len(processed):
+        line = processed[i]
+        if j < len(source) and norm(line) == norm(source[j]):
+            # lines match, step both
+            lineMap.append(j)
+            i += 1
+            j += 1
+            continue
+        # lines differ, so this line stands in for a run of source lines - find where the
+        # next distinctive processed line reappears in the source
+        k = i + 1
+        while k < len(processed) and (
+            not norm(processed[k]) or "\x02" in processed[k]
+        ):
+            k += 1
+        target = None
+        if k < len(processed):
+            for n in range(j + 1, len(source)):
+                if norm(source[n]) == norm(processed[k]):
+                    target = n
+                    break
+        start = min(j, max(len(source) - 1, 0))
+        if target is None:
+            # couldn't resync, so just step forward
+            lineMap.append(start)
+            i += 1
+            j += 1
+            continue
+        # lines up to the last non-blank one in the run stand in for its start, blank lines
+        # after that are the ones just before the target
+        last = i
+        for n in range(i, k):
+            if norm(processed[n]):
+                last = n
+        for n in range(i, k):
+            if n <= last:
+                lineMap.append(start)
+            else:
+                lineMap.append(max(start, target - (k - n)))
+        i = k
+        j = target
+
+    return lineMap
@@ -0,0 +1,49 @@
+import gc
+
+from ..assetcache import AssetCache, PathToUrl
+
+
+def test_only_allowed_folders_served(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "image.txt").write_text("inside")
+    (tmp_path / "secret.txt").write_text("outside")
+    cache = AssetCache()
+    # nothing is served until its folder is allowed
+    assert cache.GetUrl(PathToUrl(docs / "image.txt")) is None
+    cache.AllowFolder(docs)
+    assert cache.GetUrl(PathToUrl(docs / "image.txt")) == (b"inside", "text/plain")
+    # paths leading out of the folder are refused
+    assert cache.GetUrl(PathToUrl(tmp_path / "secret.txt")) is None
+    url = PathToUrl(docs / "image.txt").replace("image.txt", "../secret.txt")
+    assert cache.GetUrl(url) is None
+    url = PathToUrl(docs / "image.txt").replace("image.txt", "%2e%2e/secret.txt")
+    assert cache.GetUrl(url) is None
+    # and once disallowed, so is the folder
+    cache.DisallowFolder(docs)
+    assert cache.GetUrl(PathToUrl(docs / "image.txt")) is None
+
+
+class Owner:
+    pass
+
+
+def test_folders_counted_per_owner(tmp_path):
+    docs = tmp_path / "docs"
+    other = tmp_path / "other"
+    cache = AssetCache()
+    first, second = Owner(), Owner()
+    cache.AllowFolder(docs, owner=first)
+    cache.AllowFolder(docs, owner=second)
+    # showing the same folder again doesn't count twice
+    cache.AllowFolder(docs, owner=first)
+    assert cache.GetFolders() == [docs.resolve()]
+    # moving to another folder gives up the old one, but it's still allowed for the other owner
+    cache.AllowFolder(other, owner=first)
+    assert set(cache.GetFolders()) == {docs.resolve(), other.resolve()}
+    cache.DisallowFolder(owner=second)
+    assert cache.GetFolders() == [other.resolve()]
+    # deleting an owner gives up its folder
+    del first
+    gc.collect()
+    assert cache.GetFolders() == []
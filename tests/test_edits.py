@@ -0,0 +1,121 @@
+import pytest
+import pygments, pygments.lexers
+
+from ..document import PieceTable
+from ..edits import GetRestyleRange
+
+
+lexer = pygments.lexers.get_lexer_by_name("markdown")
+# documents (as lines) and edits to them, as (first line, last line, new lines) to replace
+editCases = [
+    # open a fence, so the text after it becomes code
+    (
+        ["text\n", "\n", "# heading\n", "* item\n", "```\n", "text\n"],
+        [(1, 1, ["```\n"])],
+    ),
+    # close a fence, then remove it again
+    (
+        ["```python\n", "# heading\n", "\n", "`code` text\n", "* item\n"],
+        [(3, 3, ["```\n"]), (3, 4, [])],
+    ),
+    # remove the opening fence, so the closing one opens a block instead
+    (
+        ["text\n", "```\n", "# heading\n", "```\n", "* item\n", "`code` text\n"],
+        [(1, 2, [])],
+    ),
+    # change which fence a block is closed by
+    (
+        ["```\n", "text\n", "```\n", "# heading\n", "```python\n", "* item\n", "```\n"],
+        [(2, 3, ["text\n"]), (1, 1, ["```\n", "\n"])],
+    ),
+    # edit inside a code block, then inside a paragraph
+    (
+        ["# heading\n", "```python\n", "text\n", "```\n", "\n", "`code` text\n"],
+        [(2, 3, ["# heading\n", "* item\n"]), (6, 7, ["text\n"])],
+    ),
+    # add a language to a fence
+    (
+        ["text\n", "```\n", "* item\n", "```\n"],
+        [(1, 2, ["```python\n"])],
+    ),
+    # edit at the very start and end
+    (
+        ["* item\n", "\n", "```\n", "text\n"],
+        [(0, 0, ["```\n"]), (5, 5, ["# heading\n"]), (0, 1, [])],
+    ),
+    # join and split paragraphs either side of a fence
+    (
+        ["text\n", "\n", "```\n", "\n", "text\n", "```\n", "\n", "# heading\n"],
+        [(1, 2, []), (5, 6, ["\n", "\n"]), (0, 8, ["text\n"])],
+    ),
+]
+
+
+def lexStyles(text, start, end):
+    """
+    Lex a range as `StyledTextCtrl.StyleText` does, giving (position, token) for each char.
+    """
+    content = text[start:end]
+    i = start
+    while content.startswith("\n"):
+        content = content[1:]
+        i += 1
+    for token, value in pygments.lex(content, lexer=lexer):
+        for char in value:
+            yield i, token
+            i += 1
+
+
+def applyStyles(styles, text, start, end):
+    for i, token in lexStyles(text, start, end):
+        if i < len(styles):
+            styles[i] = token
+
+
+def compareStyles(text, styles):
+    # whitespace isn't visibly styled, so only compare other chars
+    full = [None] * len(text)
+    applyStyles(full, text, 0, len(text))
+
+    return [
+        i for i, char in enumerate(text) if not char.isspace() and full[i] != styles[i]
+    ]
+
+
+def test_restyle_after_fence_added():
+    text = "xin\n\n```\n# xex\next\n```\ntext\nx"
+    model = PieceTable(text)
+    styles = [None] * len(text)
+    start, end, fences = GetRestyleRange(text, model.TakeDirtyRegion())
+    applyStyles(styles, text, start, end)
+    # remove the opening fence, so the closing one opens a block instead
+    model.Replace(5, 9, "")
+    text = model.Snapshot().GetText()
+    styles[5:9] = []
+    start, end, fences = GetRestyleRange(text, model.TakeDirtyRegion(), fences)
+    assert end == len(text)
+    applyStyles(styles, text, start, end)
+    assert compareStyles(text, styles) == []
+
+
+@pytest.mark.parametrize("doc, edits", editCases)
+def test_incremental_restyle_matches_full_restyle(doc, edits):
+    doc = list(doc)
+    text = "".join(doc)
+    model = PieceTable(text)
+    styles = [None] * len(text)
+    start, end, fences = GetRestyleRange(text, model.TakeDirtyRegion())
+    applyStyles(styles, text, start, end)
+    for i, j, new in edits:
+        # replace some lines, keeping old styles either side of them
+        a = len("".join(doc[:i]))
+        b = len("".join(doc[:j]))
+        value = "".join(new)
+        doc[i:j] = new
+        model.Replace(a, b, value)
+        styles[a:b] = [None] * len(value)
+        text = model.Snapshot().GetText()
+        # restyle just what's needed
+        start, end, fences = GetRestyleRange(text, model.TakeDirtyRegion(), fences)
+        applyStyles(styles, text, start, end)
+        assert compareStyles(text, styles) == [], text
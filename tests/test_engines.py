@@ -0,0 +1,66 @@
+import re
+
+import pytest
+
+from ..flags import EngineCapability
+from ..engines import Engine, MistuneEngine, engines, GetEngine
+
+
+content = (
+    "# Title\n"
+    "\n"
+    "Some *text*\n"
+    "\n"
+    "- one\n"
+    "- two\n"
+)
+
+
+def _available(name):
+    # each engine wraps an optional library, so skip those which aren't installed
+    try:
+        return GetEngine(name)
+    except ModuleNotFoundError as err:
+        pytest.skip(str(err))
+
+
+@pytest.mark.parametrize("name", list(engines))
+def test_engines_convert(name):
+    engine = _available(name)
+    html = engine.convert(content)
+    assert re.search(r"<h1[^>]*>Title</h1>", html)
+    assert "<em>text</em>" in html
+    assert re.search(r"<li[^>]*>one</li>", html)
+
+
+@pytest.mark.parametrize("name", list(engines))
+def test_source_positions_match_capabilities(name):
+    engine = _available(name)
+    html = engine.convert(content)
+    if engine.HasCapability(EngineCapability.supports_source_positions):
+        # blocks are marked with the lines they start on
+        assert re.search(r'<h1 data-line="0"', html)
+        assert re.search(r'<p data-line="2"', html)
+        assert re.search(r'<ul data-line="4"', html)
+        assert engine.sourceMap.GetBlockLine(3) == 2
+    else:
+        assert "data-line" not in html
+        assert len(engine.sourceMap) == 0
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        GetEngine("nonexistent")
+
+
+def test_extensions_need_capability():
+    class PlainEngine(MistuneEngine):
+        capabilities = EngineCapability(0)
+
+    with pytest.raises(ValueError):
+        PlainEngine(extensions=["table"])
+
+
+def test_engine_is_abstract():
+    with pytest.raises(TypeError):
+        Engine()
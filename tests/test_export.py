@@ -0,0 +1,23 @@
+import io
+
+from ..export import IterHtml, WriteHtml
+
+
+def test_page_without_head_tags():
+    page = "".join(IterHtml("<p>body</p>", theme="main {}"))
+    assert page == (
+        "<head>\n<style>\nmain {}\n</style>\n</head>\n"
+        "<body>\n<main>\n<p>body</p>\n</main>\n</body>"
+    )
+
+
+def test_page_with_head_tags():
+    page = "".join(IterHtml("<p>body</p>", theme="main {}", head="<script></script>"))
+    assert "</style>\n<script></script>\n</head>\n" in page
+
+
+def test_chunked_body_written_whole():
+    body = "<p>" + "x" * 1000 + "</p>"
+    out = io.StringIO()
+    WriteHtml(IterHtml(body, theme="", chunkSize=64), out)
+    assert out.getvalue() == "".join(IterHtml(body, theme=""))
@@ -0,0 +1,68 @@
+import markdown
+
+from ..highlight import HighlightCache, HighlightHtml, HighlightExtension
+from ..themes.editor.default import DefaultStyle
+from ..themes.editor.torillic import TorillicStyle
+
+
+block = '<pre data-line="3"><code class="language-python">x = 1 &lt; 2\n</code></pre>'
+
+
+def test_blocks_cached():
+    cache = HighlightCache()
+    first = cache.Highlight("x = 1\n", "python")
+    assert first is not None and len(cache) == 1
+    # the same block comes from the cache
+    assert cache.Highlight("x = 1\n", "python") is first
+    assert len(cache) == 1
+    # changing the code, language or style is a different block
+    cache.Highlight("x = 2\n", "python")
+    cache.Highlight("x = 1\n", "ruby")
+    cache.Highlight("x = 1\n", "python", style=TorillicStyle)
+    assert len(cache) == 4
+    assert cache.GetSize() > 0
+    cache.Clear()
+    assert len(cache) == 0 and cache.GetSize() == 0
+
+
+def test_least_recently_used_dropped():
+    cache = HighlightCache(maxEntries=2)
+    cache.Highlight("a\n", "python")
+    cache.Highlight("b\n", "python")
+    # use the first again, so the second is the oldest
+    cache.Highlight("a\n", "python")
+    cache.Highlight("c\n", "python")
+    assert len(cache) == 2
+    keys = list(cache._entries)
+    assert cache.GetKey("b\n", "python", DefaultStyle) not in keys
+    assert cache.GetKey("a\n", "python", DefaultStyle) in keys
+
+
+def test_unknown_language():
+    cache = HighlightCache()
+    assert cache.Highlight("x\n", "not-a-language") is None
+    content = '<pre><code class="language-not-a-language">x\n</code></pre>'
+    assert HighlightHtml(content, cache=cache) == content
+
+
+def test_highlight_html():
+    cache = HighlightCache()
+    result = HighlightHtml(block, cache=cache)
+    # attributes are kept, and the style's background added
+    assert result.startswith(
+        f'<pre data-line="3" style="background: {DefaultStyle.background_color}">'
+        '<code class="language-python">'
+    )
+    assert "<span" in result
+    # code is unescaped before highlighting, and escaped again by pygments
+    assert "&lt;" in result and "&amp;lt;" not in result
+    # blocks without a language are left alone
+    plain = "<pre><code>x = 1\n</code></pre>"
+    assert HighlightHtml(plain, cache=cache) == plain
+
+
+def test_extension():
+    md = markdown.Markdown(extensions=["fenced_code", HighlightExtension()])
+    html = md.convert("```python\nx = 1\n```\n")
+    assert html.startswith(f'<pre style="background: {DefaultStyle.background_color}">')
+    assert "<span" in html
@@ -0,0 +1,68 @@
+from ..htmlview import StyledRanges, PrettifyHtml
+
+
+def test_ranges_merged():
+    ranges = StyledRanges()
+    ranges.Add(10, 20)
+    ranges.Add(30, 40)
+    assert ranges.GetRanges() == [(10, 20), (30, 40)]
+    # touching and overlapping ranges merge
+    ranges.Add(20, 25)
+    ranges.Add(24, 32)
+    assert ranges.GetRanges() == [(10, 40)]
+    # empty ranges are ignored
+    ranges.Add(50, 50)
+    assert ranges.GetRanges() == [(10, 40)]
+    ranges.Clear()
+    assert ranges.GetRanges() == []
+
+
+def test_gaps():
+    ranges = StyledRanges()
+    ranges.Add(10, 20)
+    ranges.Add(30, 40)
+    assert ranges.GetGaps(0, 50) == [(0, 10), (20, 30), (40, 50)]
+    assert ranges.GetGaps(15, 35) == [(20, 30)]
+    assert ranges.GetGaps(12, 18) == []
+
+
+def test_ranges_follow_edits():
+    ranges = StyledRanges()
+    ranges.Add(10, 20)
+    ranges.Add(30, 40)
+    # inserting before a range moves it along
+    ranges.OnEdit(0, 0, "abc")
+    assert ranges.GetRanges() == [(13, 23), (33, 43)]
+    # edited text counts as unstyled, and later ranges move back
+    ranges.OnEdit(15, 20, "x")
+    assert ranges.GetRanges() == [(13, 15), (16, 19), (29, 39)]
+    # deleting past a range leaves it be
+    ranges.OnEdit(45, 50, "")
+    assert ranges.GetRanges() == [(13, 15), (16, 19), (29, 39)]
+
+
+def test_prettify():
+    content = "<div><p>Some <em>text</em></p><ul><li>one</li></ul><hr></div>"
+    assert PrettifyHtml(content) == (
+        "<div>\n"
+        "    <p>\n"
+        "        Some <em>text</em>\n"
+        "    </p>\n"
+        "    <ul>\n"
+        "        <li>\n"
+        "            one\n"
+        "        </li>\n"
+        "    </ul>\n"
+        "    <hr>\n"
+        "</div>"
+    )
+
+
+def test_prettify_keeps_preformatted():
+    content = "<p>a   b</p><pre><code>x  =  1\n  y</code></pre>"
+    assert PrettifyHtml(content, indent="  ") == (
+        "<p>\n"
+        "  a b\n"
+        "</p>\n"
+        "<pre><code>x  =  1\n  y</code></pre>"
+    )
@@ -0,0 +1,73 @@
+import time
+import threading
+
+import pytest
+
+from ..engines import PythonMarkdownEngine
+from ..isolation import IsolatedRenderer, resource
+
+
+class SlowInterpreter:
+    """
+    Interpreter which takes longer to convert than the renderer allows.
+    """
+    def convert(self, source):
+        time.sleep(60)
+
+
+class GreedyInterpreter:
+    """
+    Interpreter which tries to use more memory than the renderer allows.
+    """
+    def convert(self, source):
+        return bytearray(4 * 1024 ** 3)
+
+
+def test_render():
+    renderer = IsolatedRenderer(PythonMarkdownEngine())
+    try:
+        html, sourceMap = renderer.Render("# Title\n\nSome text\n")
+        assert html == '<h1 data-line="0">Title</h1>\n<p data-line="2">Some text</p>'
+        assert sourceMap.lines == [0, 2]
+    finally:
+        renderer.Close()
+
+
+def test_timeout_replaces_worker():
+    renderer = IsolatedRenderer(SlowInterpreter(), timeout=0.5)
+    try:
+        with pytest.raises(TimeoutError):
+            renderer.Render("anything")
+        # the stuck worker is killed, and a fresh one started in its place
+        assert len(renderer._idle) == 1
+        assert renderer._idle[0].process.is_alive()
+    finally:
+        renderer.Close()
+
+
+@pytest.mark.skipif(resource is None, reason="memory can't be capped on this platform")
+def test_memory_limit():
+    renderer = IsolatedRenderer(GreedyInterpreter(), memoryLimit=1024 ** 3)
+    try:
+        with pytest.raises(RuntimeError, match="memory"):
+            renderer.Render("anything")
+    finally:
+        renderer.Close()
+
+
+def test_submit_calls_back():
+    renderer = IsolatedRenderer(PythonMarkdownEngine())
+    done = threading.Event()
+    results = []
+
+    def _callback(*args):
+        results.append(args)
+        done.set()
+
+    try:
+        renderer.Submit(1, "Text\n", _callback)
+        assert done.wait(30)
+        key, html, sourceMap, error = results[0]
+        assert (key, html, error) == (1, '<p data-line="0">Text</p>', None)
+    finally:
+        renderer.Close()
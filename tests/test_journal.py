@@ -0,0 +1,42 @@
+import json
+
+from ..document import PieceTable
+from ..journal import EditJournal, ReplayJournal
+
+
+def test_replay_edits(tmp_path):
+    path = tmp_path / "doc.journal"
+    model = PieceTable("hello world")
+    journal = EditJournal(path, model, syncInterval=0.01)
+    journal.Start()
+    model.Replace(0, 5, "goodbye")
+    model.Replace(len("goodbye world"), len("goodbye world"), "!\n")
+    model.Replace(8, 13, "there")
+    journal.Stop()
+    assert ReplayJournal(path) == model.Snapshot().GetText() == "goodbye there!\n"
+
+
+def test_replay_after_compaction(tmp_path):
+    path = tmp_path / "doc.journal"
+    model = PieceTable("")
+    journal = EditJournal(path, model, compactEvery=5, syncInterval=0.01)
+    journal.Start()
+    for i in range(23):
+        model.Replace(i, i, str(i % 10))
+    journal.Stop()
+    assert ReplayJournal(path) == model.Snapshot().GetText()
+    # compacted, so only the edits since the last snapshot are kept
+    assert len(path.read_text().splitlines()) < 6
+
+
+def test_replay_ignores_truncated_entry(tmp_path):
+    path = tmp_path / "doc.journal"
+    entries = [["text", "abc"], ["edit", 3, 3, "def"], ["edit", 0, 1, "A"]]
+    data = "".join(json.dumps(entry) + "\n" for entry in entries)
+    # cut off partway through the last entry, as if by a crash
+    path.write_text(data[:-6])
+    assert ReplayJournal(path) == "abcdef"
+
+
+def test_replay_without_journal(tmp_path):
+    assert ReplayJournal(tmp_path / "missing.journal") is None
@@ -0,0 +1,91 @@
+import multiprocessing
+import concurrent.futures
+
+import pygments.token
+import pytest
+
+from ..lexing import SplitBlocks, LexChunk, LexParallel
+
+
+content = (
+    "# Title\n"
+    "\n"
+    "Some *text* with `code`\n"
+    "\n"
+    "```python\n"
+    "# not a heading\n"
+    "\n"
+    "x = 1\n"
+    "```\n"
+    "\n"
+    "## Section\n"
+    "\n"
+    "- one\n"
+    "- **two**\n"
+    "\n"
+    "More text\n"
+) * 4
+
+
+def _lexOnce():
+    # lex the whole text in one go, in the same form as `LexParallel`
+    runs, headings = LexChunk("markdown", content)
+    runs = [
+        (start, length, pygments.token.string_to_tokentype(token))
+        for start, length, token in runs
+    ]
+
+    return runs, headings
+
+
+def _tokens(runs):
+    """
+    Get the token each character is styled with. Runs may be split differently, and the
+    newline before a code fence is only part of the fence if lexed with it, so only visible
+    characters are compared - but every character must be styled.
+    """
+    tokens = [None] * len(content)
+    for start, length, token in runs:
+        tokens[start:start + length] = [token] * length
+    assert None not in tokens[:len(content)]
+
+    return [token for char, token in zip(content, tokens) if char != "\n"]
+
+
+def _assertSame(result):
+    runs, headings = _lexOnce()
+    assert _tokens(result[0]) == _tokens(runs)
+    assert result[1] == headings
+
+
+def test_chunks_split_between_blocks():
+    ranges = SplitBlocks(content, chunkSize=40)
+    assert len(ranges) > 1
+    # ranges cover the text with no gaps
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(content)
+    assert all(prev[1] == nxt[0] for prev, nxt in zip(ranges, ranges[1:]))
+    # and never split a code block
+    for start, end in ranges:
+        assert content[start:end].count("```") % 2 == 0
+
+
+def test_threads_match_lexing_once():
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        result = LexParallel(content, "markdown", executor=executor, chunkSize=40)
+    _assertSame(result)
+
+
+def test_processes_match_lexing_once():
+    with concurrent.futures.ProcessPoolExecutor(
+        2, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        result = LexParallel(content, "markdown", executor=executor, chunkSize=200)
+    _assertSame(result)
+
+
+def test_one_chunk_lexed_here():
+    class NoExecutor:
+        def submit(self, *args):
+            pytest.fail("A single chunk shouldn't be sent to the pool")
+
+    assert LexParallel(content, "markdown", executor=NoExecutor()) == _lexOnce()
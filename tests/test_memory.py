@@ -0,0 +1,79 @@
+import gc
+import weakref
+
+from ..memory import MemoryManager
+
+
+class Cache:
+    def __init__(self, size):
+        self.size = size
+
+    def GetSize(self):
+        return self.size
+
+    def Clear(self):
+        self.size = 0
+
+
+class Owner:
+    def __init__(self):
+        self.cache = Cache(10)
+
+    def GetCacheSize(self):
+        return self.cache.GetSize()
+
+    def ClearCache(self):
+        self.cache.Clear()
+
+
+def test_fixed_entries_dont_count_towards_budget():
+    manager = MemoryManager(budget=100)
+    owner = Owner()
+    cache = Cache(50)
+    manager.Register("document", lambda: 1000, owner=owner)
+    manager.Register("html", cache.GetSize, cache.Clear, owner=owner)
+    # the document alone is over budget, but trimming couldn't help, so nothing is trimmed
+    assert manager.Check() == 0
+    assert cache.size == 50
+    assert manager.GetTotal() == 1050
+    # once the trimmable caches go over budget, they're trimmed
+    cache.size = 150
+    assert manager.Check() == 150
+    assert cache.size == 0
+
+
+def test_least_recently_used_trimmed_first():
+    manager = MemoryManager(budget=100)
+    first, second = Owner(), Owner()
+    caches = {first: Cache(60), second: Cache(60)}
+    for owner, cache in caches.items():
+        manager.Register("html", cache.GetSize, cache.Clear, owner=owner)
+    manager.Touch(first)
+    manager.Check()
+    assert caches[second].size == 0
+    assert caches[first].size == 60
+
+
+def test_owner_not_kept_alive():
+    manager = MemoryManager()
+    owner = Owner()
+    manager.Register("cache", owner.GetCacheSize, owner.ClearCache, owner=owner)
+    assert manager.GetUsage(owner) == {"cache": 10}
+    assert [usage for _, usage in manager.GetReport()] == [{"cache": 10}]
+    # once the owner is gone, so are its caches
+    ref = weakref.ref(owner)
+    del owner
+    gc.collect()
+    assert ref() is None
+    assert manager.GetReport() == []
+    assert manager.GetTotal() == 0
+
+
+def test_unregister_without_owner():
+    manager = MemoryManager()
+    owner = Owner()
+    manager.Register("cache", owner.GetCacheSize, owner.ClearCache, owner=owner)
+    unregister = manager.GetUnregister(owner)
+    # (as when connected to a signal which passes an argument)
+    unregister(None)
+    assert manager.GetReport() == []
@@ -0,0 +1,95 @@
+import pytest
+
+from ..document import PieceTable
+from ..edits import GetRestyleRange
+from ..lexing import LexChunk
+from ..outline import OutlineIndex
+
+
+# documents (as lines) and edits to them, as (first line, last line, new lines) to replace
+editCases = [
+    # rename, add and remove headings
+    (
+        ["# heading\n", "\n", "text\n", "## other\n", "* item\n"],
+        [(0, 1, ["# renamed\n"]), (2, 2, ["## added\n"]), (4, 5, [])],
+    ),
+    # open a fence above headings, then close it between them
+    (
+        ["text\n", "# heading\n", "\n", "## other\n", "\n", "# last\n"],
+        [(0, 0, ["```\n"]), (4, 4, ["```\n"])],
+    ),
+    # remove the opening fence, so the closing one opens a block instead
+    (
+        ["# heading\n", "```\n", "## fenced\n", "```\n", "## other\n", "* item\n"],
+        [(1, 2, [])],
+    ),
+    # add a heading inside a code block, then take the fence away
+    (
+        ["```python\n", "text\n", "```\n", "# heading\n"],
+        [(1, 1, ["## fenced\n"]), (0, 1, ["\n"])],
+    ),
+    # change which fence a block is closed by
+    (
+        ["```\n", "# one\n", "```\n", "## two\n", "```python\n", "# three\n", "```\n"],
+        [(2, 3, ["text\n"]), (0, 1, [])],
+    ),
+    # replace the whole document
+    (
+        ["# heading\n", "```\n", "## other\n"],
+        [(0, 3, ["## other\n", "\n", "# heading\n"])],
+    ),
+]
+
+
+def buildOutline(text):
+    outline = OutlineIndex()
+    _, headings = LexChunk("markdown", text)
+    outline.UpdateRegion(0, None, 0, headings)
+
+    return outline.GetOutline()
+
+
+def updateOutline(outline, text, region, blocks):
+    """
+    Update an outline for an edited region as `StyledTextCtrl.StyleText` does.
+    """
+    start, end, blocks = GetRestyleRange(text, region, blocks)
+    _, headings = LexChunk("markdown", text[start:end], start)
+    oldEnd = None if region[1] is None else end - region[2]
+    outline.UpdateRegion(start, oldEnd, region[2], headings)
+
+    return blocks
+
+
+def test_heading_fenced_off():
+    text = "# one\n\ntext\n\n# two\n\n# three\n"
+    model = PieceTable(text)
+    outline = OutlineIndex()
+    blocks = updateOutline(outline, text, model.TakeDirtyRegion(), None)
+    assert [heading.text for heading in outline.GetOutline()] == ["one", "two", "three"]
+    # fence off everything after the first paragraph
+    model.Replace(7, 7, "```\n")
+    end = len(model.Snapshot().GetText())
+    model.Replace(end, end, "```\n")
+    text = model.Snapshot().GetText()
+    updateOutline(outline, text, model.TakeDirtyRegion(), blocks)
+    assert outline.GetOutline() == buildOutline(text)
+    assert [heading.text for heading in outline.GetOutline()] == ["one"]
+
+
+@pytest.mark.parametrize("doc, edits", editCases)
+def test_incremental_outline_matches_full_outline(doc, edits):
+    doc = list(doc)
+    text = "".join(doc)
+    model = PieceTable(text)
+    outline = OutlineIndex()
+    blocks = updateOutline(outline, text, model.TakeDirtyRegion(), None)
+    for i, j, new in edits:
+        # replace some lines
+        a = len("".join(doc[:i]))
+        b = len("".join(doc[:j]))
+        doc[i:j] = new
+        model.Replace(a, b, "".join(new))
+        text = model.Snapshot().GetText()
+        blocks = updateOutline(outline, text, model.TakeDirtyRegion(), blocks)
+        assert outline.GetOutline() == buildOutline(text), text
@@ -0,0 +1,67 @@
+import markdown
+import pytest
+
+from ..engines import PythonMarkdownEngine
+from ..interpreters import InterpreterPool
+from ..profiling import Profile, ProfilingInterpreter
+
+
+content = "# Title\n\nSome *text*\n"
+
+
+def test_processors_timed():
+    md = markdown.Markdown()
+    profiler = ProfilingInterpreter(md)
+    html = profiler.convert(content)
+    assert html == markdown.Markdown().convert(content)
+    # every stage is timed, under the processor's registered name
+    timings = {(timing.stage, timing.name): timing for timing in profiler.profile.GetLast()}
+    assert ("preprocessor", "normalize_whitespace") in timings
+    assert ("blockprocessor", "hashheader.run") in timings
+    assert ("inlinepattern", "em_strong") in timings
+    assert ("treeprocessor", "inline") in timings
+    assert ("postprocessor", "raw_html") in timings
+    assert timings[("treeprocessor", "inline")].calls == 1
+    # processors are only instrumented during a conversion
+    assert "run" not in vars(md.treeprocessors["inline"])
+
+
+def test_totals_accumulate():
+    profiler = ProfilingInterpreter(markdown.Markdown())
+    profiler.convert(content)
+    profiler.convert(content)
+    assert profiler.profile.conversions == 2
+    totals = {(timing.stage, timing.name): timing for timing in profiler.profile.GetTotals()}
+    assert totals[("treeprocessor", "inline")].calls == 2
+    assert profiler.profile.convertTime >= profiler.profile.lastConvertTime
+    assert "2 conversion(s)" in profiler.profile.Format()
+    profiler.profile.Reset()
+    assert profiler.profile.GetTotals() == []
+
+
+def test_pooled_engine_profiled():
+    engine = PythonMarkdownEngine(pool=InterpreterPool())
+    profiler = ProfilingInterpreter(engine)
+    profiler.convert(content)
+    assert profiler.profile.GetLast()
+    # source map still reaches the wrapped engine
+    assert engine.sourceMap.lines == [0, 2]
+    assert profiler.sourceMap is engine.sourceMap
+
+
+def test_slowest_first():
+    profile = Profile()
+    timings = profile.Begin()
+    profile.Record(timings, "treeprocessor", "fast", 0.001)
+    profile.Record(timings, "treeprocessor", "slow", 0.003)
+    profile.Record(timings, "treeprocessor", "slow", 0.002)
+    profile.End(timings, 0.01)
+    slow, fast = profile.GetLast()
+    assert (slow.name, slow.calls, slow.max) == ("slow", 2, 0.003)
+    assert slow.total == pytest.approx(0.005)
+    assert fast.name == "fast"
+
+
+def test_only_python_markdown():
+    with pytest.raises(TypeError):
+        ProfilingInterpreter(object())
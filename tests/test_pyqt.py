@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("PyQt5.QtWebEngineWidgets", exc_type=ImportError)
+
+from .. import flags
+from ..pyqt.pyqt5 import MarkdownCtrl, qt
+
+
+@pytest.fixture(scope="module")
+def app():
+    return qt.QApplication.instance() or qt.QApplication([])
+
+
+@pytest.fixture
+def ctrl(app):
+    ctrl = MarkdownCtrl(None)
+    ctrl.show()
+    yield ctrl
+    ctrl.deleteLater()
+    app.processEvents()
+
+
+def test_outline_updated_while_hidden(app, ctrl):
+    ctrl.setMarkdownText("# Shown heading\n")
+    app.processEvents()
+    assert [heading.text for heading in ctrl.getOutline()] == ["Shown heading"]
+    outlines = []
+    ctrl.outlineChanged.connect(outlines.append)
+    # edit with only the preview shown
+    ctrl.setView(flags.RenderedHtmlCtrl)
+    ctrl.setMarkdownText("# Hidden heading\n")
+    app.processEvents()
+    assert [heading.text for heading in ctrl.getOutline()] == ["Hidden heading"]
+    assert [heading.text for heading in outlines[-1]] == ["Hidden heading"]
+    # once shown again, the text is styled
+    ctrl.setView(flags.AllCtrls)
+    app.processEvents()
+    rawCtrl = ctrl.getCtrl(flags.RawMarkdownCtrl)
+    assert not rawCtrl._restyleOnShow
+    assert rawCtrl.model.TakeDirtyRegion() is None
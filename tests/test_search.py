@@ -0,0 +1,26 @@
+import random
+
+from ..document import PieceTable
+from ..search import LineIndex
+
+
+def expandToLines(text, start, end):
+    # expand a range to whole lines by scanning for newlines
+    start = text.rfind("\n", 0, start) + 1
+    end = text.find("\n", end)
+
+    return start, len(text) if end < 0 else end + 1
+
+
+def test_expand_to_lines_after_edits():
+    rng = random.Random(0)
+    model = PieceTable("one\ntwo\n\nthree\nfour")
+    lines = LineIndex(model)
+    for step in range(200):
+        text = model.Snapshot().GetText()
+        start = rng.randint(0, len(text))
+        end = rng.randint(start, len(text))
+        assert lines.ExpandToLines(start, end) == expandToLines(text, start, end), (step, text)
+        # edit somewhere, so some of the index is dropped
+        pos = rng.randint(0, len(text))
+        model.Replace(pos, min(pos + rng.randint(0, 3), len(text)), rng.choice(["", "x", "\n", "a\nb"]))
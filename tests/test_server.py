@@ -0,0 +1,112 @@
+import socket
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from ..server import PreviewServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "image.txt").write_text("inside")
+    (tmp_path / "secret.txt").write_text("outside")
+    server = PreviewServer(root=tmp_path / "docs")
+    server.Start()
+    yield server
+    server.Stop()
+
+
+def get(server, path):
+    with urllib.request.urlopen(server.GetUrl().rstrip("/") + path, timeout=5) as response:
+        return response.status, response.read()
+
+
+def readEvent(file):
+    # read lines up to the blank line ending an event
+    lines = []
+    while True:
+        line = file.readline().decode("utf-8")
+        if not line.strip("\r\n"):
+            return lines
+        lines.append(line.rstrip("\r\n"))
+
+
+def openEvents(server):
+    sock = socket.create_connection((server.host, server.port), timeout=5)
+    sock.sendall(b"GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    file = sock.makefile("rb")
+    # skip headers
+    readEvent(file)
+
+    return sock, file
+
+
+def test_page_served(server):
+    server.Publish("<p>hello</p>")
+    status, data = get(server, "/")
+    assert status == 200
+    assert b"<p>hello</p>" in data
+
+
+def test_assets_served_from_root_only(server):
+    assert get(server, "/image.txt") == (200, b"inside")
+    for path in ("/../secret.txt", "/%2e%2e/secret.txt", "/docs/../../secret.txt"):
+        with pytest.raises(urllib.error.HTTPError) as err:
+            get(server, path)
+        assert err.value.code == 404
+
+
+def test_update_and_reload_pushed(server):
+    server.Publish("<p>one</p>")
+    sock, file = openEvents(server)
+    try:
+        # catch up with the current render on connecting
+        assert readEvent(file) == ["event: update", "data: <p>one</p>"]
+        # a new body is swapped in
+        server.Publish("<p>two</p>")
+        assert readEvent(file) == ["event: update", "data: <p>two</p>"]
+        # a new theme reloads the page
+        server.Publish("<p>two</p>", theme="body { color: red; }")
+        assert readEvent(file) == ["event: reload", "data: "]
+    finally:
+        file.close()
+        sock.close()
+
+
+def test_restart(server):
+    server.Publish("<p>kept</p>")
+    server.Stop()
+    assert not server.IsRunning()
+    server.Start()
+    assert server.IsRunning()
+    status, data = get(server, "/")
+    assert status == 200
+    assert b"<p>kept</p>" in data
+
+
+def test_reload_not_skipped(server):
+    server.Publish("<p>one</p>")
+    sock, file = openEvents(server)
+    try:
+        assert readEvent(file) == ["event: update", "data: <p>one</p>"]
+        # change the theme then the body, both before the viewer is sent either
+        done = threading.Event()
+
+        def _publish():
+            server.Publish("<p>two</p>", theme="body { color: red; }")
+            server.Publish("<p>three</p>")
+            done.set()
+
+        server._loop.call_soon_threadsafe(_publish)
+        assert done.wait(5)
+        # the viewer still has to reload for the new theme
+        assert readEvent(file) == ["event: reload", "data: "]
+        status, data = get(server, "/")
+        assert b"color: red" in data
+        assert b"<p>three</p>" in data
+    finally:
+        file.close()
+        sock.close()
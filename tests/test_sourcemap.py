@@ -0,0 +1,107 @@
+import re
+
+import markdown
+
+from ..sourcemap import SourceMap, SourceMapExtension, GetClickedLine, clickScheme
+
+
+def convert(content, extensions=()):
+    md = markdown.Markdown(extensions=[SourceMapExtension(), *extensions])
+    html = md.convert(content)
+
+    return html, md.sourceMap
+
+
+def tagged(html):
+    return [int(line) for line in re.findall(r'data-line="(\d+)"', html)]
+
+
+def test_blocks_tagged_with_start_line():
+    content = (
+        "# Title\n"
+        "\n"
+        "Some text\n"
+        "over two lines\n"
+        "\n"
+        "- one\n"
+        "- two\n"
+        "\n"
+        "## Section\n"
+    )
+    html, sourceMap = convert(content)
+    assert '<h1 data-line="0">' in html
+    assert '<p data-line="2">' in html
+    assert '<ul data-line="5">' in html
+    assert '<h2 data-line="8">' in html
+    assert sourceMap.lines == [0, 2, 5, 8]
+
+
+def test_fenced_code_tagged():
+    content = (
+        "Text\n"
+        "\n"
+        "```python\n"
+        "x = 1\n"
+        "```\n"
+        "\n"
+        "More text\n"
+    )
+    html, sourceMap = convert(content, extensions=["fenced_code"])
+    assert re.search(r'<pre data-line="2"', html)
+    assert sourceMap.lines == [0, 2, 6]
+    assert tagged(html) == sourceMap.lines
+
+
+def test_codehilite_tagged():
+    content = (
+        "Text\n"
+        "\n"
+        "    indented = True\n"
+        "\n"
+        "```python\n"
+        "fenced = True\n"
+        "```\n"
+        "\n"
+        "More text\n"
+    )
+    html, sourceMap = convert(content, extensions=["fenced_code", "codehilite"])
+    assert '<div data-line="2" class="codehilite">' in html
+    assert '<div data-line="4" class="codehilite">' in html
+    assert sourceMap.lines == [0, 2, 4, 8]
+    # each block is tagged exactly once
+    assert tagged(html) == sourceMap.lines
+
+
+def test_reused_converter_starts_afresh():
+    md = markdown.Markdown(extensions=[SourceMapExtension()])
+    md.convert("a\n\nb\n\nc\n")
+    assert md.sourceMap.lines == [0, 2, 4]
+    md.reset()
+    html = md.convert("x\n\n\n\ny\n")
+    assert md.sourceMap.lines == [0, 4]
+    assert tagged(html) == [0, 4]
+
+
+def test_block_lookup():
+    sourceMap = SourceMap([0, 2, 5, 8])
+    assert len(sourceMap) == 4
+    # lines within a block map to its start
+    assert sourceMap.GetBlockIndex(3) == 1
+    assert sourceMap.GetBlockLine(3) == 2
+    assert sourceMap.GetBlockLine(5) == 5
+    # lines past the end are in the last block
+    assert sourceMap.GetBlockLine(100) == 8
+    assert sourceMap.GetSourceLine(2) == 5
+    # lines before the first block aren't in any
+    sourceMap = SourceMap([3])
+    assert sourceMap.GetBlockIndex(1) == -1
+    assert sourceMap.GetBlockLine(1) is None
+
+
+def test_clicked_line():
+    assert GetClickedLine(f"{clickScheme}:12") == 12
+    assert GetClickedLine(f"{clickScheme}:0") == 0
+    # anything else is ordinary navigation
+    assert GetClickedLine("https://example.com") is None
+    assert GetClickedLine(f"{clickScheme}:") is None
+    assert GetClickedLine(f"{clickScheme}:abc") is None
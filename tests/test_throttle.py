@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from ..throttle import RenderThrottle
+
+
+def test_costs_smoothed():
+    throttle = RenderThrottle(smoothing=0.5)
+    # the first time is taken as it is
+    throttle.Record("convert", 0.2)
+    assert throttle.GetCosts() == {"convert": 0.2}
+    # later ones are averaged in
+    throttle.Record("convert", 0.4)
+    assert throttle.GetCosts()["convert"] == pytest.approx(0.3)
+    throttle.Record("preview", 0.1)
+    assert throttle.GetCost() == pytest.approx(0.4)
+
+
+def test_cheap_renders_not_throttled():
+    throttle = RenderThrottle(frameBudget=0.05)
+    throttle.Record("convert", 0.01)
+    throttle.Record("preview", 0.02)
+    assert throttle.GetInterval() == 0
+    throttle.Rendered()
+    assert throttle.GetDelay() == 0
+
+
+def test_interval_keeps_to_max_load():
+    throttle = RenderThrottle(frameBudget=0.05, maxLoad=0.5, maxInterval=2.0)
+    # at half load, renders are as far apart as they take
+    throttle.Record("convert", 0.3)
+    assert throttle.GetInterval() == pytest.approx(0.3)
+    # at a quarter, three times as far
+    throttle.maxLoad = 0.25
+    assert throttle.GetInterval() == pytest.approx(0.9)
+    # but never further apart than the max
+    throttle.Record("convert", 100)
+    assert throttle.GetInterval() == 2.0
+
+
+def test_delay_counts_down():
+    throttle = RenderThrottle(frameBudget=0.05, maxLoad=0.5)
+    throttle.Record("convert", 0.2)
+    # nothing rendered yet, so render now
+    assert throttle.GetDelay() == 0
+    throttle.Rendered()
+    assert 0.1 < throttle.GetDelay() <= 0.2
+    time.sleep(0.2)
+    assert throttle.GetDelay() == 0
+    # forgetting costs renders straight away again
+    throttle.Rendered()
+    throttle.Reset()
+    assert throttle.GetDelay() == 0 and throttle.GetCosts() == {}
+
+
+def test_time_records_stage():
+    throttle = RenderThrottle()
+    with throttle.Time("convert"):
+        time.sleep(0.01)
+    assert throttle.GetCosts()["convert"] >= 0.01
@@ -0,0 +1,31 @@
+import json
+
+from ..typeset import TypesetCache, typesetScript
+
+
+body = '<pre><code class="language-mermaid">graph TD; A--&gt;B</code></pre>'
+
+
+def test_results_kept_per_theme():
+    cache = TypesetCache()
+    prepared = cache.Prepare(body, theme="light")
+    assert "data-pending" in prepared
+    key = cache.GetKey("mermaid", True, "graph TD; A-->B", "light")
+    assert f'data-key="{key}"' in prepared
+    # store what the page typeset
+    cache.Collect(json.dumps({"done": {key: "<svg>light</svg>"}, "pending": 0}))
+    assert "<svg>light</svg>" in cache.Prepare(body, theme="light")
+    # another theme has to typeset it for itself
+    prepared = cache.Prepare(body, theme="dark")
+    assert "data-pending" in prepared
+    assert "<svg>light</svg>" not in prepared
+
+
+def test_repeated_diagrams_rendered_apart():
+    cache = TypesetCache()
+    prepared = cache.Prepare(body + body, theme="light")
+    # the same diagram twice has one key...
+    key = cache.GetKey("mermaid", True, "graph TD; A-->B", "light")
+    assert prepared.count(f'data-key="{key}"') == 2
+    # ...so the page gives each its own id when rendering
+    assert "'mdwidget-' + el.dataset.key + '-' + i" in typesetScript
@@ -0,0 +1,94 @@
+import time
+import threading
+import contextlib
+
+__all__ = ["RenderThrottle"]
+
+
+class RenderThrottle:
+    """
+    Works out how often to re-render from what rendering has recently cost. The cost of each
+    stage (e.g. "convert" and "preview") is tracked as a moving average of the times given to
+    `Record`; while rendering fits in `frameBudget` seconds, every change is rendered straight
+    away, and past that renders are spaced out so they take up at most `maxLoad` of the
+    time (and are never more than `maxInterval` seconds apart) - so typing stays responsive
+    however slow a document is to render, with edits in between coalesced into one render.
+    """
+    def __init__(self, frameBudget=0.05, maxLoad=0.5, maxInterval=2.0, smoothing=0.3):
+        self.frameBudget = frameBudget
+        self.maxLoad = maxLoad
+        self.maxInterval = maxInterval
+        # weight given to the newest time in each moving average
+        self.smoothing = smoothing
+        self._costs = {}
+        self._lastRender = None
+        self._lock = threading.Lock()
+
+    def Record(self, stage, elapsed):
+        """
+        Add how long (in seconds) a stage of rendering just took.
+        """
+        with self._lock:
+            if stage in self._costs:
+                elapsed = self.smoothing * elapsed + (1 - self.smoothing) * self._costs[stage]
+            self._costs[stage] = elapsed
+
+    @contextlib.contextmanager
+    def Time(self, stage):
+        """
+        Context manager which records how long its body takes as a stage of rendering.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.Record(stage, time.perf_counter() - start)
+
+    def Rendered(self):
+        """
+        Note that a render has just happened.
+        """
+        self._lastRender = time.perf_counter()
+
+    def GetCosts(self):
+        """
+        Get the average cost (in seconds) of each stage of rendering, by name.
+        """
+        with self._lock:
+            return dict(self._costs)
+
+    def GetCost(self):
+        """
+        Get the average cost (in seconds) of a whole render.
+        """
+        with self._lock:
+            return sum(self._costs.values())
+
+    def GetInterval(self):
+        """
+        Get how long (in seconds) to leave between renders, given what they've been costing.
+        """
+        cost = self.GetCost()
+        # render every change while it's cheap enough
+        if cost <= self.frameBudget:
+            return 0
+        # otherwise leave enough time between renders to keep to the max load
+        return min(cost * (1 - self.maxLoad) / self.maxLoad, self.maxInterval)
+
+    def GetDelay(self):
+        """
+        Get how long (in seconds) until the next render is due - 0 if it's due now.
+        """
+        if self._lastRender is None:
+            return 0
+
+        return max(self._lastRender + self.GetInterval() - time.perf_counter(), 0)
+
+    def Reset(self):
+        """
+        Forget measured costs (e.g. after switching interpreter).
+        """
+        with self._lock:
+            self._costs.clear()
+        self._lastRender = None
+
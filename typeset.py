@@ -0,0 +1,225 @@
+import re
+import html
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+__all__ = ["TypesetCache", "cache"]
+
+
+# patterns for math and diagram blocks in HTML output, as (pattern, kind, display)
+blockPatterns = [
+    # fenced code marked as mermaid or math (any engine)
+    (re.compile(
+        r'<pre[^>]*><code[^>]*?class="(?:[^"]*\s)?language-mermaid\b[^"]*"[^>]*>(?P<source>.*?)</code></pre>',
+        re.DOTALL
+    ), "mermaid", True),
+    (re.compile(
+        r'<pre[^>]*><code[^>]*?class="(?:[^"]*\s)?language-math\b[^"]*"[^>]*>(?P<source>.*?)</code></pre>',
+        re.DOTALL
+    ), "math", True),
+    # pymdownx.arithmatex (generic mode)
+    (re.compile(
+        r'<div class="arithmatex">\\\[(?P<source>.*?)\\\]</div>', re.DOTALL
+    ), "math", True),
+    (re.compile(
+        r'<span class="arithmatex">\\\((?P<source>.*?)\\\)</span>', re.DOTALL
+    ), "math", False),
+    # markdown-it dollarmath
+    (re.compile(
+        r'<div class="math block">(?P<source>.*?)</div>', re.DOTALL
+    ), "math", True),
+    (re.compile(
+        r'<span class="math inline">(?P<source>.*?)</span>', re.DOTALL
+    ), "math", False),
+]
+
+
+# script which typesets placeholders in the page, keeping results for Python to collect
+typesetScript = """
+window.mdwidgetTypeset = {
+    results: {},
+    pending: 0,
+    take: function() {
+        var out = {done: this.results, pending: this.pending};
+        this.results = {};
+        return JSON.stringify(out);
+    },
+    math: function(source, display) {
+        if (window.katex) {
+            return katex.renderToString(source, {displayMode: display, throwOnError: false});
+        }
+        if (window.MathJax && MathJax.tex2svg) {
+            return MathJax.tex2svg(source, {display: display}).outerHTML;
+        }
+        return null;
+    },
+    run: async function() {
+        var els = document.querySelectorAll('.mdwidget-typeset[data-pending]');
+        this.pending = els.length;
+        if (window.mermaid) {
+            mermaid.initialize({startOnLoad: false});
+        }
+        for (var i = 0; i < els.length; i++) {
+            var el = els[i];
+            var result = null;
+            try {
+                if (el.dataset.kind == 'mermaid' && window.mermaid) {
+                    // (ids come from the key, so a cached diagram can't clash with another, and
+                    // the index, so neither can the same diagram twice on one page)
+                    var id = 'mdwidget-' + el.dataset.key + '-' + i;
+                    result = (await mermaid.render(id, el.textContent)).svg;
+                } else if (el.dataset.kind == 'math') {
+                    result = this.math(el.textContent, el.dataset.display == '1');
+                }
+            } catch (err) {}
+            if (result !== null) {
+                el.innerHTML = result;
+                el.removeAttribute('data-pending');
+                this.results[el.dataset.key] = result;
+            }
+            this.pending--;
+        }
+    }
+};
+window.addEventListener('load', function() { mdwidgetTypeset.run(); });
+"""
+# script to collect results from the page (gives a JSON string)
+collectScript = "window.mdwidgetTypeset ? mdwidgetTypeset.take() : null"
+
+
+class TypesetCache:
+    """
+    Cache of typeset math (KaTeX or MathJax) and diagrams (mermaid), keyed by a hash of their
+    source and shared by every preview. `Prepare` swaps each block in some HTML for either
+    its cached result or a placeholder, which the preview typesets once it's loaded - the
+    preview then passes results back via `Collect`, so each formula or diagram is only
+    typeset the first time it's seen. As results are styled by the page they were typeset
+    in, they're keyed by its theme too, so they're only reused in pages with the same theme.
+    The libraries themselves are loaded from `scripts` (by default, from a CDN - so pages
+    need to be allowed to load remote scripts). Holds up to `maxBytes` of results, dropping the least recently
+    used first.
+    """
+    scripts = [
+        "https://cdn.jsdelivr.net/npm/katex@0.16/dist/katex.min.js",
+        "https://cdn.jsdelivr.net/npm/mermaid@10/dist/mermaid.min.js",
+    ]
+    stylesheets = [
+        "https://cdn.jsdelivr.net/npm/katex@0.16/dist/katex.min.css",
+    ]
+
+    def __init__(self, maxBytes=16 * 1024 ** 2):
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def GetKey(kind, display, source, theme=""):
+        """
+        Get the hash a block is stored under, for a page with the given theme.
+        """
+        data = "\0".join(
+            (theme, kind, "1" if display else "0", source)
+        ).encode("utf-8", "surrogatepass")
+
+        return hashlib.sha1(data).hexdigest()
+
+    def Get(self, key):
+        """
+        Get the typeset HTML for a key, or None if it isn't cached.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+    def Store(self, key, result):
+        """
+        Cache the typeset HTML for a key.
+        """
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            if len(result) > self.maxBytes:
+                return
+            self._entries[key] = result
+            self._size += len(result)
+            # drop least recently used until we're within budget
+            while self._size > self.maxBytes:
+                _, dropped = self._entries.popitem(last=False)
+                self._size -= len(dropped)
+
+    def Clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def GetSize(self):
+        """
+        Get the number of characters of typeset HTML currently cached.
+        """
+        return self._size
+
+    def Collect(self, data):
+        """
+        Store results collected from a preview (the JSON string given by running
+        `collectScript` in it), returning how many blocks are still being typeset.
+        """
+        if not data:
+            return 0
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return 0
+        for key, result in data.get("done", {}).items():
+            self.Store(key, result)
+
+        return data.get("pending", 0)
+
+    def Prepare(self, htmlContent, theme=""):
+        """
+        Replace each math or diagram block in some HTML with its cached result for the given
+        theme, or with a placeholder for the preview to typeset.
+        """
+        for pattern, kind, display in blockPatterns:
+
+            def _replace(match):
+                source = html.unescape(match.group("source"))
+                key = self.GetKey(kind, display, source, theme)
+                tag = "div" if display else "span"
+                result = self.Get(key)
+                # if already typeset, use that
+                if result is not None:
+                    return (
+                        f'<{tag} class="mdwidget-typeset" data-kind="{kind}" '
+                        f'data-key="{key}">{result}</{tag}>'
+                    )
+                # otherwise, leave it to the preview
+                return (
+                    f'<{tag} class="mdwidget-typeset" data-kind="{kind}" data-key="{key}" '
+                    f'data-display="{int(display)}" data-pending>{html.escape(source)}</{tag}>'
+                )
+
+            htmlContent = pattern.sub(_replace, htmlContent)
+
+        return htmlContent
+
+    def GetHead(self):
+        """
+        Get the tags to add to a page's `<head>` so it can typeset placeholders.
+        """
+        tags = [f'<link rel="stylesheet" href="{href}">' for href in self.stylesheets]
+        tags += [f'<script src="{src}"></script>' for src in self.scripts]
+        tags.append(f"<script>{typesetScript}</script>")
+
+        return "\n".join(tags)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# cache shared by the whole process
+cache = TypesetCache()
@@ -0,0 +1,75 @@
+import os
+import threading
+from pathlib import Path
+
+from .edits import ComputeEdits
+
+__all__ = ["FileWatcher"]
+
+
+class FileWatcher(threading.Thread):
+    """
+    Polls a file on a background thread and, when it changes, reads it and diffs it against
+    a document model (anything with a `Snapshot()` method, e.g. `document.PieceTable`) off
+    the UI thread. The callback is then given `(version, text, edits)`, where `edits` will
+    turn the snapshot of that version into the new text - it's called from the watcher
+    thread, so should hand over to the UI thread (e.g. via `wx.CallAfter` or a Qt signal).
+    """
+    def __init__(self, path, model, callback, interval=0.5, encoding="utf-8"):
+        threading.Thread.__init__(self, daemon=True)
+        self.path = Path(path)
+        self.model = model
+        self.callback = callback
+        self.interval = interval
+        self.encoding = encoding
+        self._stopEvent = threading.Event()
+        # note current state, so only later changes count
+        self._stat = self._getStat()
+        self._pendingStat = None
+
+    def _getStat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def Stop(self):
+        """
+        Stop watching (the thread exits at its next poll).
+        """
+        self._stopEvent.set()
+
+    def Check(self):
+        """
+        Check the file once, calling the callback if it's changed. Returns True if it had.
+        """
+        stat = self._getStat()
+        # if file is unchanged or missing (e.g. mid-checkout), do nothing
+        if stat is None or stat == self._stat:
+            return False
+        # wait for one more poll without changes, so we don't read a half-written file
+        if stat != self._pendingStat:
+            self._pendingStat = stat
+            return False
+        # read new content
+        try:
+            text = self.path.read_text(encoding=self.encoding)
+        except (OSError, UnicodeDecodeError):
+            return False
+        self._stat = stat
+        # normalize newlines to match text ctrls
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        # diff against current content
+        snapshot = self.model.Snapshot()
+        edits = ComputeEdits(snapshot.GetText(), text)
+        if not edits:
+            return False
+        # hand over
+        self.callback(snapshot.GetVersion(), text, edits)
+
+        return True
+
+    def run(self):
+        while not self._stopEvent.wait(self.interval):
+            self.Check()
@@ -1,8 +1,12 @@
+import io
+import bisect
 import traceback
+from html import escape
 import enum
 import pygments, pygments.lexers, pygments.token
 import wx
 import wx.lib.splitter
+import wx.lib.newevent
 import wx.html2 as html
 import wx.richtext
 
@@ -10,15 +14,46 @@ import wx.richtext
 from pathlib import Path
 
 from .. import flags
+from ..sourcemap import SourceMap, SourceMapExtension, clickScript, GetClickedLine
+from ..engines import PythonMarkdownEngine, GetEngine
+from ..profiling import ProfilingInterpreter
+from ..isolation import IsolatedRenderer
+from ..highlight import HighlightHtml
+from ..typeset import cache as typesetCache, collectScript
+from ..export import IterHtml, WriteHtml
+from ..server import PreviewServer
+from ..outline import OutlineIndex
+from ..document import PieceTable
+from ..edits import ComputeEdits, GetRestyleRange
+from ..memory import manager as memoryManager
+from ..throttle import RenderThrottle
+from ..journal import EditJournal, ReplayJournal
+from ..lexing import LexChunk, LexParallel
+from ..htmlview import StyledRanges, PrettifyHtml
+from ..search import LineIndex, Searcher, CompilePattern, GetReplaceEdits
+from ..watcher import FileWatcher
+from ..loading import ChunkedReader
+from ..assetcache import cache as assetCache, scheme as assetScheme, PathToUrl
 from ..assets import folder as assetsFolder
 from ..themes.editor.default import DefaultStyle as defaultEditorTheme
 from ..themes.viewer.default import DefaultStyle as defaultViewerTheme
 
 
+# event emitted when headings are added, removed or renamed
+OutlineChangedEvent, EVT_OUTLINE_CHANGED = wx.lib.newevent.NewCommandEvent()
+# event emitted after each chunk of a file is loaded by LoadFile
+LoadProgressEvent, EVT_LOAD_PROGRESS = wx.lib.newevent.NewCommandEvent()
+# event emitted when a search (see StyledTextCtrl.Find) has found its matches
+SearchResultsEvent, EVT_SEARCH_RESULTS = wx.lib.newevent.NewCommandEvent()
+# event emitted when a block is clicked in the preview, with the Markdown line it started on
+PreviewClickedEvent, EVT_PREVIEW_CLICKED = wx.lib.newevent.NewCommandEvent()
+
+
 class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
     def __init__(
             self, parent, interpreter=None, 
-            minCtrlSize=(256, 256)
+            minCtrlSize=(256, 256),
+            extensions=(), extensionConfigs=None
         ):
         # initialise
         wx.Panel.__init__(self, parent)
@@ -28,11 +63,44 @@ class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
         self.sizer = wx.BoxSizer(wx.VERTICAL)
         self.SetSizer(self.sizer)
 
-        # setup interpreter
+        # setup interpreter (by default, borrowing from a pool shared by all ctrls)
         if interpreter is None:
-            import markdown
-            interpreter = markdown.Markdown()
+            interpreter = PythonMarkdownEngine(extensions, extensionConfigs)
+        # if given the name of an engine, make it
+        if isinstance(interpreter, str):
+            interpreter = GetEngine(interpreter, extensions, extensionConfigs)
         self.interpreter = interpreter
+        # if interpreter takes extensions, have it mark source lines in its output
+        if hasattr(interpreter, "registerExtensions"):
+            interpreter.registerExtensions([SourceMapExtension()], {})
+        self._sourceMap = SourceMap()
+        self._scrollSync = True
+        # (version, html) of last conversion, and version last shown in the HTML ctrls
+        self._htmlBody = (None, "")
+        self._renderedVersion = None
+        # how often to re-render, adapted to how long rendering takes
+        self.throttle = RenderThrottle()
+        self._renderTimer = wx.Timer(self)
+        # file we're editing, and thread watching it for changes
+        self._file = None
+        self._encoding = "utf-8"
+        self._watcher = None
+        # reader for a file being loaded in chunks
+        self._loader = None
+        # renderer for converting in a separate process, and the last render which worked
+        self._isolation = None
+        self._goodHtml = ""
+        # whether (and with what pygments style) to highlight code blocks in the HTML
+        self._codeHighlighting = False
+        self._codeStyle = None
+        # cache of typeset math and diagrams (if typesetting them)
+        self._typesetCache = None
+        # server showing the preview in browsers (if started)
+        self._server = None
+        # journal autosaving edits (if autosaving)
+        self._journal = None
+        # whether to pretty-print the raw HTML
+        self._prettyHtml = False
 
         # setup ctrls panel
         self.ctrlsPanel = ctrlsPanel = wx.lib.splitter.MultiSplitterWindow(self, id=wx.ID_ANY)
@@ -51,6 +119,9 @@ class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
         # add raw markdown ctrl
         rawMarkdownCtrl = self._ctrls[flags.RAW_MARKDOWN_CTRL] = StyledTextCtrl(ctrlsPanel, language="markdown", minSize=minCtrlSize, style=wx.richtext.RE_MULTILINE)
         ctrlsPanel.AppendWindow(rawMarkdownCtrl)
+        # keep preview scrolled to the caret
+        rawMarkdownCtrl.Bind(wx.EVT_KEY_UP, self.OnMarkdownCaretMoved)
+        rawMarkdownCtrl.Bind(wx.EVT_LEFT_UP, self.OnMarkdownCaretMoved)
         # add view toggle button
         rawMarkdownBtn = ViewToggleButton(viewSwitcherCtrl, iconName="view_md", label="Markdown code")
         rawMarkdownBtn.Bind(wx.EVT_TOGGLEBUTTON, self.OnViewSwitcherButtonClicked)
@@ -60,6 +131,8 @@ class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
         # add raw html ctrl
         rawHtmlCtrl = self._ctrls[flags.RAW_HTML_CTRL] = StyledTextCtrl(ctrlsPanel, language="html", minSize=minCtrlSize, style=wx.richtext.RE_MULTILINE | wx.richtext.RE_READONLY)
         ctrlsPanel.AppendWindow(rawHtmlCtrl)
+        # only style the HTML as it comes into view, as it's often longer than the Markdown
+        rawHtmlCtrl.SetLazyStyling(True)
         # add view toggle button
         rawHtmlBtn = ViewToggleButton(viewSwitcherCtrl, iconName="view_html", label="HTML code")
         rawHtmlBtn.Bind(wx.EVT_TOGGLEBUTTON, self.OnViewSwitcherButtonClicked)
@@ -69,6 +142,8 @@ class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
         # add rendered HTML ctrl
         renderedHtmlCtrl = self._ctrls[flags.RENDERED_HTML_CTRL] = HTMLPreviewCtrl(ctrlsPanel, minSize=minCtrlSize)
         ctrlsPanel.AppendWindow(renderedHtmlCtrl)
+        # jump to the source of blocks clicked in the preview
+        renderedHtmlCtrl.Bind(EVT_PREVIEW_CLICKED, self.OnPreviewClicked)
         # add view toggle button
         renderedHtmlBtn = ViewToggleButton(viewSwitcherCtrl, iconName="view_preview", label="HTML preview")
         renderedHtmlBtn.Bind(wx.EVT_TOGGLEBUTTON, self.OnViewSwitcherButtonClicked)
@@ -77,6 +152,17 @@ class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
 
         # bind update function
         self.Bind(wx.EVT_IDLE, self.OnSetMarkdownText)
+        self.Bind(wx.EVT_TIMER, self.OnSetMarkdownText, self._renderTimer)
+        # stop watching files when destroyed
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.OnDestroy)
+        # take the shared preview when focused (if it's following focus)
+        self.Bind(wx.EVT_CHILD_FOCUS, self.OnChildFocus)
+        # account for our caches in the process-wide memory budget
+        # (registering methods, as the manager only holds those weakly)
+        memoryManager.Register("document", rawMarkdownCtrl.model.GetLength, owner=self)
+        memoryManager.Register("html", self.GetHtmlCacheSize, self.ClearHtmlCache, owner=self)
+        memoryManager.Register("styles", self.GetStyleCacheSize, self.ClearStyleCache, owner=self)
+        memoryManager.Register("preview", renderedHtmlCtrl.GetContentSize, owner=self)
 
         # set default style
         self.SetSelectionMode(flags.MULTI_SELECTION)
@@ -84,10 +170,331 @@ class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
         self.SetButtonsLayout(flags.ALIGN_BUTTONS_CENTER | flags.BOTTOM_BUTTONS_AREA)
     
     def GetMarkdownText(self):
+        # get content (shared, so repeat calls don't copy the document again)
+        return self.GetSnapshot().GetText()
+
+    def ApplyEdits(self, edits):
+        """
+        Apply a list of (start, end, text) edits to the Markdown, with positions in the
+        current text, as one undoable action. Only the edited blocks are restyled.
+        """
         # get markdown ctrl
         ctrl = self.GetCtrl(flags.RAW_MARKDOWN_CTRL)
-        # get content
-        return ctrl.GetValue()
+        # apply edits last first, so earlier positions stay valid
+        ctrl.BeginBatchUndo("Edit")
+        for start, end, text in sorted(edits, key=lambda edit: edit[0], reverse=True):
+            ctrl.Replace(start, end, text)
+        ctrl.EndBatchUndo()
+        # style
+        ctrl.StyleText()
+
+    def ApplyDiff(self, value):
+        """
+        Set the Markdown text by applying only the lines which differ from the current text,
+        rather than replacing it all as `SetMarkdownText` does. Returns the edits applied.
+        """
+        # work out what's changed
+        edits = ComputeEdits(self.GetMarkdownText(), value)
+        # apply it
+        if edits:
+            self.ApplyEdits(edits)
+
+        return edits
+
+    def Find(self, pattern, regex=False, caseSensitive=False, wholeWord=False):
+        """
+        Search the Markdown in the background, highlighting matches in the raw markdown ctrl
+        (see `StyledTextCtrl.Find`).
+        """
+        return self.GetCtrl(flags.RAW_MARKDOWN_CTRL).Find(
+            pattern, regex=regex, caseSensitive=caseSensitive, wholeWord=wholeWord
+        )
+
+    def FindNext(self, backwards=False):
+        return self.GetCtrl(flags.RAW_MARKDOWN_CTRL).FindNext(backwards=backwards)
+
+    def ClearFind(self):
+        self.GetCtrl(flags.RAW_MARKDOWN_CTRL).ClearFind()
+
+    def GetMatches(self):
+        return self.GetCtrl(flags.RAW_MARKDOWN_CTRL).GetMatches()
+
+    def ReplaceAll(self, pattern, replacement, regex=False, caseSensitive=False, wholeWord=False):
+        """
+        Replace every match of a pattern as one undoable edit, returning how many were replaced.
+        """
+        compiled = CompilePattern(pattern, regex, caseSensitive, wholeWord)
+        edits = GetReplaceEdits(self.GetMarkdownText(), compiled, replacement, regex=regex)
+        if edits:
+            self.ApplyEdits(edits)
+
+        return len(edits)
+
+    def OpenFile(self, path, watch=True, encoding="utf-8"):
+        """
+        Load Markdown from a file and, if `watch` is True, keep reloading it as it's changed
+        from outside (e.g. by a generator or a git checkout), applying only the changed lines.
+        """
+        path = Path(path)
+        # store file details
+        self._file = path
+        self._encoding = encoding
+        # load content in chunks
+        self.LoadFile(path, encoding=encoding)
+        # start watching
+        self.WatchFile(watch)
+
+    def LoadFile(self, path, chunkSize=256 * 1024, encoding="utf-8", useMmap=False):
+        """
+        Load Markdown from a file a chunk at a time (optionally memory-mapped), appending
+        each chunk on a separate pass of the event loop so the app stays responsive. Only the
+        first chunk is styled straight away - the rest is styled, and the whole document
+        converted, once loading finishes. Progress is reported by `EVT_LOAD_PROGRESS` events.
+        """
+        # stop any load in progress (its chain of calls will carry on with this one)
+        loading = self._loader is not None
+        if loading:
+            self._loader.Close()
+        # clear content
+        self.SetMarkdownText("")
+        self.GetCtrl(flags.RAW_MARKDOWN_CTRL).DeferStyling(False)
+        # start reading
+        self._loader = ChunkedReader(path, chunkSize=chunkSize, encoding=encoding, useMmap=useMmap)
+        if not loading:
+            wx.CallAfter(self.OnLoadChunk)
+
+    def IsLoading(self):
+        """
+        Is a file currently being loaded by `LoadFile`?
+        """
+        return self._loader is not None
+
+    def OnLoadChunk(self, evt=None):
+        # stop if destroyed or cancelled
+        if not self or self._loader is None:
+            return
+        loader = self._loader
+        ctrl = self.GetCtrl(flags.RAW_MARKDOWN_CTRL)
+        # append next chunk, without making it undoable
+        chunk = loader.Read()
+        if chunk:
+            ctrl.GetBuffer().BeginSuppressUndo()
+            ctrl.AppendText(chunk)
+            ctrl.GetBuffer().EndSuppressUndo()
+            # style the first chunk, so what's visible looks right, then hold off until done
+            if not ctrl.IsStylingDeferred():
+                ctrl.StyleText()
+                ctrl.DeferStyling(True)
+        # report progress
+        wx.PostEvent(self, LoadProgressEvent(
+            self.GetId(), loaded=loader.loaded, total=loader.total, done=loader.done
+        ))
+        if loader.done:
+            # style the rest (conversion will happen on next idle)
+            self._loader = None
+            ctrl.DeferStyling(False)
+        else:
+            # carry on next time round the event loop
+            wx.CallAfter(self.OnLoadChunk)
+
+    def GetFile(self):
+        """
+        Get the path of the file opened by `OpenFile`, if any.
+        """
+        return self._file
+
+    def WatchFile(self, watch=True, interval=0.5):
+        """
+        Start (or stop) watching the file opened by `OpenFile` for changes, polling it every
+        `interval` seconds on a background thread.
+        """
+        # stop any existing watcher
+        if self._watcher is not None:
+            self._watcher.Stop()
+            self._watcher = None
+        # start a new one, which hands changes back to the UI thread
+        if watch and self._file is not None:
+            self._watcher = FileWatcher(
+                self._file,
+                model=self.GetCtrl(flags.RAW_MARKDOWN_CTRL).model,
+                callback=lambda *args: wx.CallAfter(self.OnFileChanged, *args),
+                interval=interval,
+                encoding=self._encoding,
+            )
+            self._watcher.start()
+
+    def OnFileChanged(self, version, content, edits):
+        # ignore if we've been destroyed since the change was seen
+        if not self:
+            return
+        # if changed while still loading, start loading again
+        if self._loader is not None:
+            self.LoadFile(self._file, encoding=self._encoding)
+            return
+        # if the document has been edited since the diff was made, diff again
+        if self.GetSnapshot().GetVersion() != version:
+            edits = ComputeEdits(self.GetMarkdownText(), content)
+        # apply changes
+        self.ApplyEdits(edits)
+
+    def OnDestroy(self, evt):
+        # stop watching our file (ignoring children being destroyed)
+        if evt.GetEventObject() is self and self._watcher is not None:
+            self._watcher.Stop()
+        # stop render workers
+        if evt.GetEventObject() is self and self._isolation is not None:
+            self._isolation.Close()
+        # stop preview server
+        if evt.GetEventObject() is self and self._server is not None:
+            self._server.Stop()
+        # stop accounting for our caches, and stop any pending render
+        if evt.GetEventObject() is self:
+            memoryManager.Unregister(self)
+            self._renderTimer.Stop()
+            # write out any edits still queued for the autosave journal
+            if self._journal is not None:
+                self._journal.Stop()
+        evt.Skip()
+
+    def GetAutosavePath(self, path=None):
+        """
+        Get where edits are journaled when autosaving: the given path or, by default, next to
+        the file opened by `OpenFile` (with ".journal" added to its name).
+        """
+        if path is not None:
+            return Path(path)
+        if self._file is None:
+            raise ValueError("No file is open, so a path for the autosave journal is needed.")
+
+        return self._file.with_name(self._file.name + ".journal")
+
+    def SetAutosave(self, enable=True, path=None, compactEvery=1000):
+        """
+        Start (or stop) autosaving, by appending each edit to a journal on a background thread
+        (see `journal.EditJournal`) rather than rewriting the whole document. If the app
+        crashes, `RecoverAutosave` gets the text back.
+        """
+        # stop any existing journal (keeping what it's written)
+        if self._journal is not None:
+            self._journal.Stop()
+            self._journal = None
+        # start a new one
+        if enable:
+            self._journal = EditJournal(
+                self.GetAutosavePath(path),
+                model=self.GetCtrl(flags.RAW_MARKDOWN_CTRL).model,
+                compactEvery=compactEvery,
+            )
+            self._journal.Start()
+
+    def GetAutosave(self):
+        """
+        Get the journal autosaving edits, if autosaving.
+        """
+        return self._journal
+
+    def RecoverAutosave(self, path=None):
+        """
+        Replay an autosave journal (e.g. after a crash) into the Markdown, returning True if
+        there was one to recover.
+        """
+        text = ReplayJournal(self.GetAutosavePath(path))
+        if text is None:
+            return False
+        self.SetMarkdownText(text)
+
+        return True
+
+    def DiscardAutosave(self, path=None):
+        """
+        Stop autosaving and delete the journal, e.g. once the document has been saved.
+        """
+        if self._journal is not None:
+            self._journal.Discard()
+            self._journal = None
+        elif path is not None or self._file is not None:
+            self.GetAutosavePath(path).unlink(missing_ok=True)
+
+    def SetPrettyHtml(self, enable=True):
+        """
+        Set whether to pretty-print the raw HTML (each block on its own line, indented by how
+        deeply it's nested) - this only affects the raw HTML ctrl, not the preview or export.
+        """
+        self._prettyHtml = enable
+        # render again
+        self._renderedVersion = None
+
+    def GetPrettyHtml(self):
+        return self._prettyHtml
+
+    def GetRenderInterval(self):
+        """
+        Get how long (in seconds) is currently left between renders, which grows as rendering
+        gets slower (see `throttle.RenderThrottle`).
+        """
+        return self.throttle.GetInterval()
+
+    def GetRenderCosts(self):
+        """
+        Get the average time (in seconds) recent renders have spent converting ("convert")
+        and updating the HTML ctrls ("preview").
+        """
+        return self.throttle.GetCosts()
+
+    def GetMemoryUsage(self):
+        """
+        Get the size of each of this ctrl's caches, by name (see `memory.MemoryManager`).
+        """
+        return memoryManager.GetUsage(self)
+
+    def ClearHtmlCache(self):
+        """
+        Drop the stored HTML from the last conversion (it's converted again when next needed).
+        """
+        self._htmlBody = (None, "")
+        self._goodHtml = ""
+
+    def GetHtmlCacheSize(self):
+        """
+        Get the size of the stored HTML from the last conversion.
+        """
+        return len(self._htmlBody[1]) + len(self._goodHtml)
+
+    def GetStyleCacheSize(self):
+        """
+        Get the size of the styles cached by the raw Markdown and HTML ctrls.
+        """
+        return (
+            self.GetCtrl(flags.RAW_MARKDOWN_CTRL).formatter.GetSize()
+            + self.GetCtrl(flags.RAW_HTML_CTRL).formatter.GetSize()
+        )
+
+    def ClearStyleCache(self):
+        """
+        Drop the styles cached by the raw Markdown and HTML ctrls (they're made again as
+        needed).
+        """
+        self.GetCtrl(flags.RAW_MARKDOWN_CTRL).formatter.Clear()
+        self.GetCtrl(flags.RAW_HTML_CTRL).formatter.Clear()
+
+    def OnChildFocus(self, evt):
+        # we're in use, so trim other ctrls' caches first
+        memoryManager.Touch(self)
+        # if the preview follows focus, bring it here
+        renderedHtmlCtrl = self.GetCtrl(flags.RENDERED_HTML_CTRL)
+        if renderedHtmlCtrl.pool.followFocus and renderedHtmlCtrl.IsShown():
+            renderedHtmlCtrl.AcquireView()
+        evt.Skip()
+
+    def GetSnapshot(self):
+        """
+        Get an immutable `document.DocumentSnapshot` of the Markdown content, which can be read
+        by reference and handed to other threads.
+        """
+        # get markdown ctrl
+        ctrl = self.GetCtrl(flags.RAW_MARKDOWN_CTRL)
+        # get snapshot
+        return ctrl.GetSnapshot()
 
     def SetMarkdownText(self, value):
         # get markdown ctrl
@@ -98,26 +505,68 @@ class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
         ctrl.StyleText()
     
     def OnSetMarkdownText(self, evt=None):
-        # get HTML body
-        htmlBody = self.GetHtmlBody()
-        # populate raw HTML ctrl
-        rawHtmlCtrl = self.GetCtrl(flags.RAW_HTML_CTRL)
-        rawHtmlCtrl.SetValue(htmlBody)
-        # get full HTML
-        htmlFull = self.GetHtml()
-        # populate rendered HTML ctrl
-        renderedHtmlCtrl = self.GetCtrl(flags.RENDERED_HTML_CTRL)
-        renderedHtmlCtrl.SetHtml(htmlFull)
+        # only update if content has changed since last time
+        version = self.GetSnapshot().GetVersion()
+        # (and not while loading a file, as it's converted once loaded)
+        # (and, if rendering has been slow, not until the next render is due - edits until
+        # then are coalesced into one render)
+        delay = self.throttle.GetDelay()
+        if version != self._renderedVersion and self._loader is None and delay > 0:
+            if not self._renderTimer.IsRunning():
+                self._renderTimer.StartOnce(max(int(delay * 1000), 1))
+        elif version != self._renderedVersion and self._loader is None:
+            self._renderedVersion = version
+            # get HTML body
+            with self.throttle.Time("convert"):
+                htmlBody = self.GetHtmlBody()
+            with self.throttle.Time("preview"):
+                # populate raw HTML ctrl
+                # (only changed blocks are replaced, and only visible ones restyled)
+                rawHtmlCtrl = self.GetCtrl(flags.RAW_HTML_CTRL)
+                rawHtmlCtrl.ApplyDiff(PrettifyHtml(htmlBody) if self._prettyHtml else htmlBody)
+                # get full HTML
+                htmlFull = self.GetHtml()
+                # populate rendered HTML ctrl
+                renderedHtmlCtrl = self.GetCtrl(flags.RENDERED_HTML_CTRL)
+                renderedHtmlCtrl.SetHtml(htmlFull, filename=self._file)
+            self.throttle.Rendered()
+            # push to browsers viewing the preview server
+            self.PublishPreview()
+            # we're in use, so trim other ctrls' caches first if over budget
+            memoryManager.Touch(self)
+            memoryManager.Check()
         # skip event
         if evt is not None:
             evt.Skip()
     
     def GetHtmlBody(self):
         # get markdown
-        mdContent = self.GetMarkdownText()
+        snapshot = self.GetSnapshot()
+        # if this version has already been converted, reuse it
+        if self._htmlBody[0] == snapshot.GetVersion():
+            return self._htmlBody[1]
+        mdContent = snapshot.GetText()
+        # if isolated, convert in a worker process and keep showing the last render until done
+        if self._isolation is not None:
+            self._isolation.Submit(
+                snapshot.GetVersion(), mdContent,
+                lambda *args: wx.CallAfter(self.OnIsolatedRender, *args)
+            )
+            return self._htmlBody[1]
         # parse to HTML
         try:
+            # reset interpreter so no state (e.g. footnotes) carries over from last time
+            if hasattr(self.interpreter, "reset"):
+                self.interpreter.reset()
             htmlContent = self.interpreter.convert(mdContent)
+            # highlight code blocks (cached, so only changed blocks are highlighted again)
+            if self._codeHighlighting:
+                htmlContent = HighlightHtml(htmlContent, style=self.GetCodeStyle())
+            # get source map (blank documents are never converted, so have no map)
+            self._sourceMap = SourceMap()
+            if mdContent.strip():
+                self._sourceMap = getattr(self.interpreter, "sourceMap", None) or SourceMap()
+            self._goodHtml = htmlContent
         except Exception as err:
             # on fail, return error as HTML
             tb = "\n".join(traceback.format_exception(err))
@@ -126,9 +575,233 @@ class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
                 f"<p>Could not parse Markdown. Error from Python:</p>\n"
                 f"<pre><code>{tb}</code></pre>\n"
                 )
+        # store against version
+        self._htmlBody = (snapshot.GetVersion(), htmlContent)
         
         return htmlContent
 
+    def GetEngineCapabilities(self):
+        """
+        Get what the interpreter can do, as `flags.EngineCapability` flags. Interpreters which
+        aren't engines (see `engines.Engine`) are assumed to be python-markdown-like if they
+        take extensions, and to have no capabilities otherwise.
+        """
+        if hasattr(self.interpreter, "GetCapabilities"):
+            return self.interpreter.GetCapabilities()
+        if hasattr(self.interpreter, "registerExtensions"):
+            return flags.SUPPORTS_EXTENSIONS | flags.SUPPORTS_SOURCE_POSITIONS
+
+        return flags.EngineCapability(0)
+
+    def EnableProfiling(self, enable=True):
+        """
+        Start (or stop) timing each python-markdown processor on every conversion. Timings
+        build up over the session in the `profiling.Profile` given by `GetProfile`.
+        """
+        profiling = isinstance(self.interpreter, ProfilingInterpreter)
+        if enable and not profiling:
+            self.interpreter = ProfilingInterpreter(self.interpreter)
+        if not enable and profiling:
+            self.interpreter = self.interpreter.interpreter
+
+    def GetProfile(self):
+        """
+        Get the `profiling.Profile` of conversions so far, or None if profiling isn't enabled.
+        """
+        if isinstance(self.interpreter, ProfilingInterpreter):
+            return self.interpreter.profile
+
+    def SetIsolation(self, enable=True, timeout=5.0, memoryLimit=512 * 1024 ** 2):
+        """
+        Start (or stop) converting in a separate worker process, stopped if it takes longer
+        than `timeout` seconds or uses more than `memoryLimit` bytes. While a conversion
+        runs the preview keeps showing the last render, and if it fails the last good render
+        is shown with an error above it - so the editor stays responsive whatever the
+        document. See `isolation.IsolatedRenderer`.
+        """
+        # stop any existing workers
+        if self._isolation is not None:
+            self._isolation.Close()
+            self._isolation = None
+        # start new ones (converting whatever the interpreter wraps, if it's profiling)
+        if enable:
+            interpreter = self.interpreter
+            if isinstance(interpreter, ProfilingInterpreter):
+                interpreter = interpreter.interpreter
+            self._isolation = IsolatedRenderer(
+                interpreter, timeout=timeout, memoryLimit=memoryLimit
+            )
+
+    def OnIsolatedRender(self, version, htmlContent, sourceMap, error):
+        # ctrl may have been destroyed while rendering
+        if not self:
+            return
+        # ignore renders which finish after isolation is turned off
+        if self._isolation is None:
+            return
+        if error is None:
+            if self._codeHighlighting:
+                htmlContent = HighlightHtml(htmlContent, style=self.GetCodeStyle())
+            self._goodHtml = htmlContent
+            self._sourceMap = sourceMap
+        else:
+            # on fail, show the last good render with the error above it
+            msg = escape(str(error))
+            htmlContent = (
+                f"<blockquote>\n"
+                f"<p><strong>Could not render Markdown</strong> (showing last successful render):</p>\n"
+                f"<pre><code>{msg}</code></pre>\n"
+                f"</blockquote>\n"
+                f"{self._goodHtml}"
+            )
+        self._htmlBody = (version, htmlContent)
+        # show it
+        self._renderedVersion = None
+        self.OnSetMarkdownText()
+
+    def SetCodeHighlighting(self, enable=True, style=None):
+        """
+        Set whether to highlight code blocks (with a language) in the HTML, using a pygments
+        style - by default, whatever theme the Markdown ctrl is using. Highlighted blocks are
+        cached (see `highlight.HighlightCache`), so only new or changed blocks cost anything.
+        """
+        self._codeHighlighting = enable
+        self._codeStyle = style
+        # convert again
+        self._htmlBody = (None, self._htmlBody[1])
+        self._renderedVersion = None
+
+    def GetCodeHighlighting(self):
+        return self._codeHighlighting
+
+    def GetCodeStyle(self):
+        """
+        Get the pygments style code blocks are highlighted with.
+        """
+        if self._codeStyle is not None:
+            return self._codeStyle
+
+        return self.GetCtrl(flags.RAW_MARKDOWN_CTRL).GetTheme()
+
+    def SetTypesetting(self, enable=True, cache=typesetCache):
+        """
+        Set whether to typeset math (KaTeX or MathJax) and mermaid diagrams in the preview.
+        Each block is typeset by the preview the first time it's seen and the result cached
+        by its source (see `typeset.TypesetCache`), so later renders only typeset blocks which
+        have changed.
+        """
+        self._typesetCache = cache if enable else None
+        self.GetCtrl(flags.RENDERED_HTML_CTRL).typesetCache = self._typesetCache
+        # render again
+        self._renderedVersion = None
+
+    def GetTypesetting(self):
+        return self._typesetCache is not None
+
+    def StartPreviewServer(self, host="127.0.0.1", port=0):
+        """
+        Start serving the preview to browsers (see `server.PreviewServer`), returning the URL
+        to view it at. Every render is then pushed to all connected browsers.
+        """
+        if self._server is None:
+            self._server = PreviewServer(host=host, port=port)
+        url = self._server.Start()
+        self.PublishPreview()
+
+        return url
+
+    def StopPreviewServer(self):
+        """
+        Stop serving the preview to browsers.
+        """
+        if self._server is not None:
+            self._server.Stop()
+            self._server = None
+
+    def GetPreviewServer(self):
+        return self._server
+
+    def PublishPreview(self):
+        # push current render to the preview server, if running
+        if self._server is None:
+            return
+        htmlBody = self.GetHtmlBody()
+        theme = self.GetCtrl(flags.RENDERED_HTML_CTRL).GetTheme()
+        # typeset math and diagrams as for the preview
+        head = ""
+        if self._typesetCache is not None:
+            htmlBody = self._typesetCache.Prepare(htmlBody, theme)
+            # always load typesetting libraries, so blocks in later renders can be typeset too
+            head = self._typesetCache.GetHead()
+        self._server.Publish(
+            htmlBody,
+            theme=theme,
+            root=self._file.parent if self._file is not None else None,
+            head=head
+        )
+
+    def GetSourceMap(self):
+        """
+        Get the map from Markdown lines to top-level HTML blocks made by the last conversion.
+        """
+        return self._sourceMap
+
+    def GetOutline(self):
+        """
+        Get the headings in the Markdown document, as a list of `outline.Heading`s. Bind
+        `EVT_OUTLINE_CHANGED` to be notified when they change.
+        """
+        return self.GetCtrl(flags.RAW_MARKDOWN_CTRL).outline.GetOutline()
+
+    def SetScrollSync(self, value):
+        """
+        Set whether the HTML preview should follow the caret in the Markdown ctrl.
+        """
+        self._scrollSync = value
+
+    def GetScrollSync(self):
+        return self._scrollSync
+
+    def SyncPreview(self, line=None):
+        """
+        Scroll the HTML preview to the block containing the given Markdown line (or the line
+        with the caret on, if None).
+        """
+        ctrl = self.GetCtrl(flags.RAW_MARKDOWN_CTRL)
+        # if not given a line, use the caret
+        if line is None:
+            _, _, line = ctrl.PositionToXY(ctrl.GetInsertionPoint())
+        # can't sync if the interpreter doesn't say where blocks came from
+        if flags.SUPPORTS_SOURCE_POSITIONS not in self.GetEngineCapabilities():
+            return
+        # look up the block this line is in
+        blockLine = self.GetSourceMap().GetBlockLine(line)
+        if blockLine is None:
+            return
+        # scroll to it
+        self.GetCtrl(flags.RENDERED_HTML_CTRL).ScrollToLine(blockLine)
+
+    def ShowMarkdownLine(self, line):
+        """
+        Move the caret in the Markdown ctrl to the start of the given line and scroll to it,
+        e.g. to jump to the source of a block clicked in the preview.
+        """
+        ctrl = self.GetCtrl(flags.RAW_MARKDOWN_CTRL)
+        pos = ctrl.XYToPosition(0, line)
+        ctrl.SetInsertionPoint(pos)
+        ctrl.ShowPosition(pos)
+
+    def OnPreviewClicked(self, evt):
+        self.ShowMarkdownLine(evt.line)
+
+    def OnMarkdownCaretMoved(self, evt=None):
+        # sync preview if requested
+        if self._scrollSync:
+            self.SyncPreview()
+        # skip event so the ctrl still gets it
+        if evt is not None:
+            evt.Skip()
+
     def OnViewSwitcherButtonClicked(self, evt=None):
         # if single select, uncheck all other buttons
         if self._selectionMode == flags.SINGLE_SELECTION:
@@ -168,25 +841,35 @@ class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
         self.SetCtrls(ctrls)
 
     def GetHtml(self):
+        # construct full html
+        htmlFull = "".join(self.IterHtml())
+        
+        return htmlFull
+
+    def IterHtml(self, chunkSize=64 * 1024):
+        """
+        Yield the full themed HTML page in chunks (head, theme, rendered body, tail), e.g. to
+        write out with `export.WriteHtml` without a second copy of the page in memory.
+        """
         # get html body
         htmlBody = self.GetHtmlBody()
         # get theme
         theme = self.GetCtrl(flags.RENDERED_HTML_CTRL).GetTheme()
-        # construct full html
-        htmlFull = (
-            f"<head>\n"
-            f"<style>\n"
-            f"{theme}\n"
-            f"</style>\n"
-            f"</head>\n"
-            f"<body>\n"
-            f"<main>\n"
-            f"{htmlBody}\n"
-            f"</main>\n"
-            f"</body>"
-        )
-        
-        return htmlFull
+        # swap math and diagrams for their cached typesetting (or placeholders to typeset)
+        head = ""
+        if self._typesetCache is not None:
+            htmlBody = self._typesetCache.Prepare(htmlBody, theme)
+            # only load typesetting libraries if there's something to typeset
+            if "data-pending" in htmlBody:
+                head = self._typesetCache.GetHead()
+
+        return IterHtml(htmlBody, theme=theme, head=head, chunkSize=chunkSize)
+
+    def ExportHtml(self, target, encoding="utf-8"):
+        """
+        Write the full themed HTML page to a file path, open file or socket, a chunk at a time.
+        """
+        return WriteHtml(self.IterHtml(), target, encoding=encoding)
     
     def GetCtrl(self, flag):
         """
@@ -237,6 +920,8 @@ class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
                 btn.SetValue(False)
         # layout panel
         self.ctrlsPanel.SizeWindows()
+        # hidden ctrls aren't updated, so update on next idle
+        self._renderedVersion = None
         # check for button ctrls flag
         self.GetCtrl(flags.VIEW_SWITCHER_CTRL).Show(flags.VIEW_SWITCHER_CTRL in ctrls)
     
@@ -296,6 +981,10 @@ class MarkdownCtrl(wx.Panel, flags.FlagAtrributeMixin):
                     thisCtrl.StyleText()
                 if isinstance(ctrl, HTMLPreviewCtrl):
                     thisCtrl.SetHtml(self.GetHtml())
+        # code highlighting follows the Markdown ctrl's theme, so convert again
+        if flags.RAW_MARKDOWN_CTRL in ctrl and self._codeHighlighting and self._codeStyle is None:
+            self._htmlBody = (None, self._htmlBody[1])
+            self._renderedVersion = None
     
     def SetButtonStyle(self, style, buttons=flags.ALL_CTRLS):
         """
@@ -433,6 +1122,16 @@ class MarkdownCtrlFormatter:
         
         return self.styles[token]
 
+    def GetSize(self):
+        # (roughly, per text attribute)
+        return len(self.styles) * 512
+
+    def Clear(self):
+        """
+        Forget token styles (they're made again as they're needed).
+        """
+        self.styles.clear()
+
 
 class StyledTextCtrl(wx.richtext.RichTextCtrl):
     def __init__(self, parent, language, minSize=(256, 256), style=wx.richtext.RE_MULTILINE):
@@ -442,27 +1141,208 @@ class StyledTextCtrl(wx.richtext.RichTextCtrl):
         # set minimum size
         self.SetMinSize(minSize)
         # setup lexer
+        self.language = language
         self.lexer = pygments.lexers.get_lexer_by_name(language)
+        # size from which restyling the whole document is lexed across worker processes, or
+        # None to always lex here (the default, as the workers are spawned by re-importing the
+        # app's main module, which needs an `if __name__ == "__main__":` guard - see
+        # `lexing.GetExecutor`)
+        self.parallelLexing = None
         # setup formatter
         self.formatter = MarkdownCtrlFormatter(defaultEditorTheme)
+        # setup heading index, fed by the tokens from styling
+        self.outline = OutlineIndex()
+        # setup document model, kept in sync from edit events
+        self.model = PieceTable()
+        self._ignoreEdits = False
+        # whether styling is on hold (e.g. while a file is loading)
+        self._deferStyling = False
+        # fenced code blocks when last styled
+        self._fencedBlocks = None
+        # whether there were edits while hidden, so everything needs styling once shown
+        self._restyleOnShow = False
+        # setup line index and search, with matches highlighted over the syntax styles
+        self.lines = LineIndex(self.model)
+        self.searcher = Searcher(lambda *args: wx.CallAfter(self.OnSearchDone, *args))
+        self.matchColour = "#ffd54f"
+        self._pattern = None
+        self._matches = []
+        # highlighted ranges, moved along with edits so the highlights can be found to clear them
+        self._highlighted = StyledRanges()
+        self.model.AddListener(self._highlighted.OnEdit)
+        # whether to only style text as it comes into view, and what's been styled if so
+        self.lazyStyling = False
+        self._styled = StyledRanges()
+        self.Bind(wx.EVT_SCROLLWIN, self.OnScroll)
+        self.Bind(wx.EVT_SIZE, self.OnSize)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.OnDestroy)
+        self.Bind(wx.richtext.EVT_RICHTEXT_CONTENT_INSERTED, self.OnContentInserted)
+        self.Bind(wx.richtext.EVT_RICHTEXT_CONTENT_DELETED, self.OnContentDeleted)
         # bind style function
         self.Bind(wx.EVT_TEXT, self.StyleText)
         self.Bind(wx.EVT_KEY_UP, self.StyleText)
         self.Bind(wx.EVT_SHOW, self.OnShow)
+
+    def SetValue(self, value):
+        # replace model first, so it's up to date for any handlers of the ctrl's events
+        self.model.SetText(value)
+        # set content without going through edit events
+        self._ignoreEdits = True
+        wx.richtext.RichTextCtrl.SetValue(self, value)
+        self._ignoreEdits = False
+
+    def AppendText(self, value):
+        # add to model first, so it's up to date for any handlers of the ctrl's events
+        self.model.Insert(self.model.GetLength(), value)
+        # append content without going through edit events
+        self._ignoreEdits = True
+        wx.richtext.RichTextCtrl.AppendText(self, value)
+        self._ignoreEdits = False
+
+    def ApplyDiff(self, value):
+        """
+        Set the content by replacing only the lines which differ from the current content
+        (without adding to undo history), so only those are restyled. Returns the edits.
+        """
+        edits = ComputeEdits(self.GetSnapshot().GetText(), value)
+        if not edits:
+            return edits
+        # hold off styling until all edits are in
+        deferred = self._deferStyling
+        self._deferStyling = True
+        self.GetBuffer().BeginSuppressUndo()
+        editable = self.IsEditable()
+        self.SetEditable(True)
+        self.Freeze()
+        # apply edits last first, so earlier positions stay valid
+        for start, end, text in reversed(edits):
+            self.Replace(start, end, text)
+        self.Thaw()
+        self.SetEditable(editable)
+        self.GetBuffer().EndSuppressUndo()
+        self.DeferStyling(deferred)
+
+        return edits
+
+    def SetLazyStyling(self, lazy=True):
+        """
+        Set whether to only style text as it's scrolled into view, rather than all of it as
+        it's edited - e.g. for long generated text which is read rather than edited.
+        """
+        if lazy and not self.lazyStyling:
+            self.model.AddListener(self._styled.OnEdit)
+        elif not lazy and self.lazyStyling:
+            self.model.RemoveListener(self._styled.OnEdit)
+            self.model.MarkDirty()
+        self.lazyStyling = lazy
+        self._styled.Clear()
+
+    def DeferStyling(self, defer=True):
+        """
+        Put styling on hold (edits are still noted), or resume it and style anything edited
+        in the meantime.
+        """
+        self._deferStyling = defer
+        if not defer:
+            self.StyleText()
+
+    def IsStylingDeferred(self):
+        return self._deferStyling
+
+    def GetSnapshot(self):
+        """
+        Get an immutable `document.DocumentSnapshot` of the current content.
+        """
+        # if an edit got past us, resync the model from the ctrl
+        if self.model.GetLength() != self.GetLastPosition():
+            self.model.SetText(self.GetValue())
+
+        return self.model.Snapshot()
+
+    def OnContentInserted(self, evt):
+        if not self._ignoreEdits:
+            # get inserted range (end is inclusive)
+            rng = evt.GetRange()
+            start = rng.GetStart()
+            end = rng.GetEnd() + 1
+            # copy just the inserted text into the model
+            self.model.Insert(start, self.GetRange(start, end))
+        evt.Skip()
+
+    def OnContentDeleted(self, evt):
+        if not self._ignoreEdits:
+            # get deleted range (end is inclusive)
+            rng = evt.GetRange()
+            # remove it from the model
+            self.model.Delete(rng.GetStart(), rng.GetLength())
+        evt.Skip()
     
     def SetTheme(self, theme):
         self.formatter = MarkdownCtrlFormatter(theme)
+        # everything needs restyling in the new theme
+        self.model.MarkDirty()
     
     def GetTheme(self):
         return self.formatter.theme
     
+    def IsParallelLexing(self, region, size):
+        """
+        Should a region (from `model.TakeDirtyRegion`) be lexed across worker processes? Only
+        restyling a whole large document (e.g. on first open or a theme change) is worth it.
+        """
+        return region[1] is None and self.parallelLexing is not None and size >= self.parallelLexing
+
     def StyleText(self, evt=None):
         """
-        Apply pyments.style to text contents
+        Apply pyments.style to text contents - only to the blocks edited since last time, if
+        the document model knows which they are.
         """
-        # don't restyle if ctrl is hidden
-        if not self.IsShown():
+        # styling is on hold (e.g. while a file is loading)
+        if self._deferStyling:
             return
+        # if edited while hidden, style everything now we're shown
+        if self._restyleOnShow and self.IsShown():
+            self._restyleOnShow = False
+            self.model.MarkDirty()
+        # get content
+        content = self.GetSnapshot().GetText()
+        # get region which needs restyling (if any)
+        region = self.model.TakeDirtyRegion()
+        if region is None:
+            # (if styling lazily, there may be unstyled text in view)
+            if self.lazyStyling:
+                self.StyleVisible()
+            return
+        shift = region[2]
+        # expand to whole blocks, so the lexer has the context it needs (including any text
+        # which has switched between code and prose since a fence was added or removed)
+        start, end, self._fencedBlocks = GetRestyleRange(content, region, self._fencedBlocks)
+        if not self.IsShown():
+            # don't style while hidden (everything is styled once shown), but keep the outline
+            # up to date
+            self._restyleOnShow = True
+            headings = self.LexHeadings(content, region, start, end)
+        elif self.lazyStyling:
+            # just style what's in view (edited ranges are already unstyled)
+            if region[1] is None:
+                self._styled.Clear()
+            self.StyleVisible()
+            headings = self.LexHeadings(content, region, start, end)
+        else:
+            headings = self.StyleRange(content, region, start, end)
+        # update heading index for the region (whose end was `end - shift` before editing)
+        oldEnd = None if region[1] is None else end - shift
+        if self.outline.UpdateRegion(start, oldEnd, shift, headings):
+            wx.PostEvent(self, OutlineChangedEvent(self.GetId(), outline=self.outline.GetOutline()))
+        # search edited text again, if searching
+        if self._pattern is not None:
+            self.searcher.Submit(self.GetSnapshot(), self._pattern)
+
+    def StyleRange(self, content, region, start, end):
+        """
+        Style a range of the text (from `edits.GetRestyleRange`), giving the headings in it
+        (see `outline.OutlineIndex.ParseHeading`).
+        """
         # freeze while we style
         self.GetBuffer().BeginSuppressUndo()
         self.Freeze()
@@ -472,20 +1352,32 @@ class StyledTextCtrl(wx.richtext.RichTextCtrl):
         # set base style
         baseStyle = self.formatter.GetTokenStyle(pygments.token.Token)
         self.SetBasicStyle(baseStyle)
-        # lex content to get tokens
-        content = self.GetValue()
-        tokens = pygments.lex(content, lexer=self.lexer)
-        # set character style
-        i = 0
-        while content.startswith("\n"):
-            content = content[1:]
-            i += 1
-        for token, text in tokens:
-            charFormat = self.formatter.GetTokenStyle(token)
-            # apply format object
-            self.SetStyleEx(wx.richtext.RichTextRange(i, i+len(text)), charFormat)
-            # move forward to next token
-            i += len(text)
+        if self.IsParallelLexing(region, end - start):
+            # lex whole document across worker processes, then apply the merged style runs
+            runs, headings = LexParallel(content, self.language)
+            for i, length, token in runs:
+                charFormat = self.formatter.GetTokenStyle(token)
+                self.SetStyleEx(wx.richtext.RichTextRange(i, i + length), charFormat)
+        else:
+            # lex region to get tokens
+            content = content[start:end]
+            tokens = pygments.lex(content, lexer=self.lexer)
+            # set character style
+            i = start
+            while content.startswith("\n"):
+                content = content[1:]
+                i += 1
+            headings = []
+            for token, text in tokens:
+                charFormat = self.formatter.GetTokenStyle(token)
+                # apply format object
+                self.SetStyleEx(wx.richtext.RichTextRange(i, i+len(text)), charFormat)
+                # note any headings
+                heading = self.outline.ParseHeading(i, token, text)
+                if heading is not None:
+                    headings.append(heading)
+                # move forward to next token
+                i += len(text)
         
         # thaw once done
         self.GetBuffer().EndSuppressUndo()
@@ -493,6 +1385,179 @@ class StyledTextCtrl(wx.richtext.RichTextCtrl):
         self.Update()
         self.Refresh()
 
+        return headings
+
+    def LexHeadings(self, content, region, start, end):
+        """
+        Lex a range of the text just for the headings in it, without styling it.
+        """
+        if self.IsParallelLexing(region, end - start):
+            _, headings = LexParallel(content, self.language)
+        else:
+            _, headings = LexChunk(self.language, content[start:end], start)
+
+        return headings
+
+    def StyleVisible(self):
+        """
+        Style any unstyled text in view (and a screen's worth either side), a line at a time.
+        """
+        if not self.IsShown() or self._deferStyling:
+            return
+        snapshot = self.GetSnapshot()
+        content = snapshot.GetText()
+        # get visible range, plus a margin so scrolling a little doesn't show unstyled text
+        first = self.GetFirstVisiblePosition()
+        _, last = self.HitTestPos(wx.Point(*self.GetClientSize()))
+        margin = max(last - first, 0)
+        start, end = self.lines.ExpandToLines(
+            max(first - margin, 0), min(last + margin, len(content)), snapshot
+        )
+        # get the bits of it which aren't styled
+        gaps = self._styled.GetGaps(start, end)
+        if not gaps:
+            return
+        # freeze while we style
+        self.GetBuffer().BeginSuppressUndo()
+        self.Freeze()
+        self.SetBackgroundColour(wx.Colour(self.GetTheme().background_color))
+        self.SetBasicStyle(self.formatter.GetTokenStyle(pygments.token.Token))
+        for gapStart, gapEnd in gaps:
+            # expand to whole lines
+            gapStart, gapEnd = self.lines.ExpandToLines(gapStart, gapEnd, snapshot)
+            # lex and style
+            text = content[gapStart:gapEnd]
+            i = gapStart
+            while text.startswith("\n"):
+                text = text[1:]
+                i += 1
+            for token, value in pygments.lex(text, lexer=self.lexer):
+                self.SetStyleEx(
+                    wx.richtext.RichTextRange(i, i + len(value)), self.formatter.GetTokenStyle(token)
+                )
+                i += len(value)
+            self._styled.Add(gapStart, gapEnd)
+        self.GetBuffer().EndSuppressUndo()
+        self.Thaw()
+        self.Refresh()
+
+    def Find(self, pattern, regex=False, caseSensitive=False, wholeWord=False):
+        """
+        Search for a pattern in the background, highlighting matches as an overlay (only
+        the background colour is changed, so syntax styles are kept). `EVT_SEARCH_RESULTS`
+        is posted once matches are found, and they're kept up to date as the text changes.
+        """
+        self._pattern = CompilePattern(pattern, regex, caseSensitive, wholeWord)
+        self.searcher.Submit(self.GetSnapshot(), self._pattern)
+
+        return self._pattern
+
+    def ClearFind(self):
+        """
+        Stop searching and remove match highlights.
+        """
+        self._pattern = None
+        self._matches = []
+        self.searcher.Cancel()
+        self.HighlightMatches()
+
+    def GetMatches(self):
+        """
+        Get the matches of the current search, as a list of `search.Match`es.
+        """
+        return self._matches
+
+    def FindNext(self, backwards=False):
+        """
+        Select the next (or previous) match from the caret, wrapping around, and scroll to it.
+        Returns the match, or None if there are none.
+        """
+        if not self._matches:
+            return None
+        starts = [match.start for match in self._matches]
+        pos = self.GetInsertionPoint()
+        if backwards:
+            i = bisect.bisect_left(starts, self.GetSelection()[0]) - 1
+        else:
+            i = bisect.bisect_right(starts, pos) % len(starts)
+        match = self._matches[i]
+        self.SetSelection(match.start, match.end)
+        self.ShowPosition(match.start)
+
+        return match
+
+    def OnSearchDone(self, version, pattern, matches):
+        # ignore results of a search which has since been replaced
+        if pattern is not self._pattern:
+            return
+        # if the text changed while searching, search again
+        snapshot = self.GetSnapshot()
+        if version != snapshot.GetVersion():
+            self.searcher.Submit(snapshot, pattern)
+            return
+        # store and show matches
+        self._matches = matches
+        self.HighlightMatches()
+        wx.PostEvent(self, SearchResultsEvent(self.GetId(), matches=matches))
+
+    def HighlightMatches(self):
+        """
+        Highlight matches in view, and remove highlights from anywhere else.
+        """
+        if not self.IsShown():
+            return
+        # get visible range, as whole lines so matches on partly visible lines are included
+        first = self.GetFirstVisiblePosition()
+        _, last = self.HitTestPos(wx.Point(*self.GetClientSize()))
+        first, last = self.lines.ExpandToLines(first, last, self.GetSnapshot())
+        # get matches in it (including one running into it from before)
+        starts = [match.start for match in self._matches]
+        i = bisect.bisect_left(starts, first)
+        j = bisect.bisect_left(starts, last)
+        if i > 0 and self._matches[i - 1].end > first:
+            i -= 1
+        visible = self._matches[i:j]
+        # paint background only, without adding to undo history
+        self.GetBuffer().BeginSuppressUndo()
+        self.Freeze()
+        clear = wx.richtext.RichTextAttr()
+        clear.SetBackgroundColour(wx.Colour(self.GetTheme().background_color))
+        for start, end in self._highlighted.GetRanges():
+            self.SetStyleEx(
+                wx.richtext.RichTextRange(start, end), clear, wx.richtext.RICHTEXT_SETSTYLE_OPTIMIZE
+            )
+        self._highlighted.Clear()
+        paint = wx.richtext.RichTextAttr()
+        paint.SetBackgroundColour(wx.Colour(self.matchColour))
+        for start, end in visible:
+            self.SetStyleEx(
+                wx.richtext.RichTextRange(start, end), paint, wx.richtext.RICHTEXT_SETSTYLE_OPTIMIZE
+            )
+            self._highlighted.Add(start, end)
+        self.GetBuffer().EndSuppressUndo()
+        self.Thaw()
+
+    def OnScroll(self, evt):
+        # style text scrolled into view
+        if self.lazyStyling:
+            wx.CallAfter(self.StyleVisible)
+        # highlight matches scrolled into view
+        if self._matches:
+            wx.CallAfter(self.HighlightMatches)
+        evt.Skip()
+
+    def OnSize(self, evt):
+        # more may be in view
+        if self.lazyStyling:
+            wx.CallAfter(self.StyleVisible)
+        evt.Skip()
+
+    def OnDestroy(self, evt):
+        # stop search thread
+        if evt.GetEventObject() is self:
+            self.searcher.Close()
+        evt.Skip()
+
     def OnShow(self, evt):
         # style self
         self.StyleText(evt)
@@ -500,34 +1565,288 @@ class StyledTextCtrl(wx.richtext.RichTextCtrl):
         evt.Skip()
 
 
+class AssetSchemeHandler(html.WebViewHandler):
+    """
+    Serves documents' images and other files to the preview from an `assetcache.AssetCache`,
+    so re-rendering doesn't read them from disk again.
+    """
+    def __init__(self, cache=assetCache):
+        html.WebViewHandler.__init__(self, assetScheme)
+        self.cache = cache
+
+    def GetFile(self, uri):
+        # get file
+        found = self.cache.GetUrl(uri)
+        if found is None:
+            return None
+        data, mimeType = found
+
+        return wx.FSFile(io.BytesIO(data), uri, mimeType, "", wx.DateTime.Now())
+
+
+class PreviewPool:
+    """
+    Pool of web views shared by every `HTMLPreviewCtrl`. Each web view has its own browser
+    engine behind it, so rather than every ctrl making one, ctrls borrow a view while shown
+    and give it back when hidden - so memory stays flat however many ctrls there are, and
+    a spare view is kept loaded so a newly shown preview doesn't wait for one to start up.
+    With `followFocus`, there is only one view, which moves to whichever `MarkdownCtrl` has
+    focus.
+    """
+    def __init__(self, maxIdle=2, spare=1, followFocus=False):
+        # max views to keep when not in use
+        self.maxIdle = maxIdle
+        # views to keep loaded and ready
+        self.spare = spare
+        self.followFocus = followFocus
+        self._idle = []
+        # (if following focus) ctrl with the view
+        self._owner = None
+
+    def SetFollowFocus(self, value):
+        """
+        Set whether to have just one view, moved to whichever ctrl has focus.
+        """
+        self.followFocus = value
+        if value:
+            self.spare = 0
+
+    def GetFollowFocus(self):
+        return self.followFocus
+
+    def GetOwner(self):
+        """
+        Get the ctrl which has the view, if following focus.
+        """
+        return self._owner
+
+    def Create(self, parent):
+        """
+        Make a new view (hidden, and with a blank page loaded so its engine is started), which
+        serves assets through an `AssetSchemeHandler`.
+        """
+        view = html.WebView.New(parent)
+        view.Hide()
+        # serve assets from the shared cache
+        view.RegisterHandler(AssetSchemeHandler())
+        view.SetPage("<html><body></body></html>", "")
+
+        return view
+
+    def Warm(self, parent):
+        """
+        Make views until there are `spare` idle ones (windows can't exist without a parent,
+        so they're parked in the top level window of `parent`).
+        """
+        # forget views destroyed along with the window they were parked in
+        self._idle = [view for view in self._idle if view]
+        while len(self._idle) < min(self.spare, self.maxIdle):
+            self._idle.append(self.Create(wx.GetTopLevelParent(parent)))
+
+    def Acquire(self, ctrl):
+        """
+        Give a view to an `HTMLPreviewCtrl`, taking it from whichever ctrl has it if following
+        focus.
+        """
+        # if following focus, take the view from whichever ctrl has it
+        if self.followFocus and self._owner not in (None, ctrl):
+            self._owner.ReleaseView()
+        if self.followFocus:
+            self._owner = ctrl
+        # take an idle view, or make one if there are none
+        view = None
+        while self._idle and not view:
+            view = self._idle.pop()
+        if not view:
+            view = self.Create(ctrl)
+        # make sure there's a spare for next time
+        self.Warm(ctrl)
+
+        return view
+
+    def Release(self, view, ctrl):
+        """
+        Take back a view from an `HTMLPreviewCtrl`.
+        """
+        if self._owner is ctrl:
+            self._owner = None
+        if not view:
+            return
+        # keep it if we need more, otherwise get rid of it
+        if len(self._idle) < self.maxIdle:
+            view.Hide()
+            view.Reparent(wx.GetTopLevelParent(ctrl))
+            view.SetPage("<html><body></body></html>", "")
+            self._idle.append(view)
+        else:
+            view.Destroy()
+
+    def Forget(self, ctrl):
+        """
+        Stop tracking a ctrl which is being destroyed (its view is destroyed with it).
+        """
+        if self._owner is ctrl:
+            self._owner = None
+
+
+# pool shared by the whole app
+previewPool = PreviewPool()
+
+
 class HTMLPreviewCtrl(wx.Panel):
     theme = defaultViewerTheme
 
-    def __init__(self, parent, minSize=(256, 256)):
+    def __init__(self, parent, minSize=(256, 256), pool=previewPool):
         # initalise
         wx.Panel.__init__(self, parent)
         self.parent = parent
         # setup sizer
         self.sizer = wx.BoxSizer()
         self.SetSizer(self.sizer)
-        # add webview
-        self.view = html.WebView.New(self)
-        self.sizer.Add(self.view, proportion=1, flag=wx.EXPAND)
+        # webview is borrowed from a pool while shown
+        self.pool = pool
+        self.view = None
+        # last content set, to show whenever we get a view
+        self._content = None
+        # line to keep scrolled to across page loads
+        self._scrollLine = None
+        # cache to store math and diagrams typeset by the page in (if typesetting)
+        self.typesetCache = None
+        self._typesetTries = 0
+        self.Bind(wx.EVT_SHOW, self.OnShow)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.OnDestroy)
         
         # set minimum size
         self.SetMinSize(minSize)
+
+    def HasView(self):
+        return self.view is not None
+
+    def AcquireView(self):
+        """
+        Borrow a web view from the pool, if we don't have one already.
+        """
+        if self.view is not None:
+            return
+        # get view
+        self.view = self.pool.Acquire(self)
+        self.view.Reparent(self)
+        self.sizer.Add(self.view, proportion=1, flag=wx.EXPAND)
+        self.view.Bind(html.EVT_WEBVIEW_LOADED, self.OnLoaded)
+        self.view.Bind(html.EVT_WEBVIEW_NAVIGATING, self.OnNavigating)
+        self.view.Show()
+        self.Layout()
+        # show last content
+        if self._content is not None:
+            self.view.SetPage(*self._content)
+
+    def ReleaseView(self):
+        """
+        Give our web view back to the pool.
+        """
+        if self.view is None:
+            return
+        view = self.view
+        self.view = None
+        view.Unbind(html.EVT_WEBVIEW_LOADED, handler=self.OnLoaded)
+        view.Unbind(html.EVT_WEBVIEW_NAVIGATING, handler=self.OnNavigating)
+        self.sizer.Detach(view)
+        self.pool.Release(view, self)
+
+    def OnShow(self, evt):
+        # borrow a view while shown (unless following focus, where focus decides)
+        if evt.IsShown() and not self.pool.followFocus:
+            self.AcquireView()
+        if not evt.IsShown():
+            self.ReleaseView()
+        evt.Skip()
+
+    def OnDestroy(self, evt):
+        # our view is destroyed with us, so just let the pool know
+        if evt.GetEventObject() is self:
+            self.view = None
+            self.pool.Forget(self)
+            assetCache.DisallowFolder(owner=self)
+        evt.Skip()
     
     def SetHtml(self, content, filename=None):
-        if not self.IsShown():
-            return
         # if not given a filename, use assets folder
         if filename is None:
             filename = Path(__file__).parent.parent / "assets" / "untitled.html"
         # enforce html extension
         filename = filename.parent / (filename.stem + ".html")
+        # store content (loading assets through the cache, from the document's folder, and
+        # reporting clicks, to jump to their source), to show whenever we have a view
+        # (one folder per ctrl, given up when it shows another or is destroyed)
+        assetCache.AllowFolder(filename.parent, owner=self)
+        self._content = (content + clickScript, PathToUrl(filename))
+        if not self.IsShown():
+            return
+        # make sure we have a view (unless following focus and another ctrl has it)
+        if not self.pool.followFocus or self.pool.GetOwner() is None:
+            self.AcquireView()
+        if self.view is None:
+            return
         # set html
-        self.view.SetPage(content, str(filename))
+        self.view.SetPage(*self._content)
     
+    def GetContentSize(self):
+        """
+        Get the size of the HTML held to show whenever we have a view.
+        """
+        if self._content is None:
+            return 0
+
+        return len(self._content[0])
+
+    def ScrollToLine(self, line):
+        """
+        Scroll to the block whose `data-line` attribute is the given Markdown line.
+        """
+        self._scrollLine = line
+        if not self.IsShown() or self.view is None:
+            return
+        self.view.RunScript(
+            f"var el = document.querySelector('[data-line=\"{int(line)}\"]');\n"
+            f"if (el) {{ el.scrollIntoView(); }}"
+        )
+
+    def OnLoaded(self, evt):
+        # page reloads lose scroll position, so restore it
+        if self._scrollLine is not None:
+            self.ScrollToLine(self._scrollLine)
+        # collect typesetting done by the page once it's had time to run
+        if self.typesetCache is not None:
+            self._typesetTries = 0
+            wx.CallLater(250, self.CollectTypeset)
+        evt.Skip()
+
+    def OnNavigating(self, evt):
+        # clicks on blocks are sent as navigation, so catch them rather than following them
+        line = GetClickedLine(evt.GetURL())
+        if line is None:
+            evt.Skip()
+            return
+        evt.Veto()
+        wx.PostEvent(self, PreviewClickedEvent(self.GetId(), line=line))
+
+    def CollectTypeset(self):
+        """
+        Store math and diagrams the page has typeset in `typesetCache`, checking again later
+        if it's still going.
+        """
+        if self.view is None or self.typesetCache is None:
+            return
+        result = self.view.RunScript(collectScript)
+        # (wxPython 4.1+ gives (success, result))
+        if isinstance(result, tuple):
+            result = result[1]
+        pending = self.typesetCache.Collect(result)
+        # check again if not done (giving up eventually, e.g. if a library didn't load)
+        self._typesetTries += 1
+        if pending and self._typesetTries < 40:
+            wx.CallLater(250, self.CollectTypeset)
+
     def GetTheme(self):
         return self.theme
     